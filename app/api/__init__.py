@@ -1,3 +1,5 @@
 from .reports import router as reports_router
+from .status_logs import router as status_logs_router
+from .stores import router as stores_router
 
-__all__ = ['reports_router']
+__all__ = ['reports_router', 'status_logs_router', 'stores_router']
@@ -1,60 +1,154 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from typing import List
+import asyncio
+import hashlib
+import json
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta,time
 import uuid
 import logging
-from app.core import get_db, settings
+from app.core import get_async_db, settings
+from app.core.database import AsyncSessionLocal
 from app.models import Report,ReportStatus 
+from app.utils.report_writer import REPORT_FORMATS, REPORT_MEDIA_TYPES
+from app.utils.watermark import get_data_watermark, parse_data_watermark
+from app.utils.progress import get_report_progress
+from app.utils.report_results import MAX_RESULTS_PAGE_SIZE, decode_results_cursor, encode_results_cursor, format_report_result, parse_result_filter, select_report_results
+from app.utils.uptime_index import parse_report_windows
+from app.utils.storage import get_location_storage, report_file_exists
+from app.services.notification_service import report_status_hub
 import os
 from celery import shared_task
 from celery_app import celery_app
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+async def get_report_by(db: AsyncSession, *criteria):
+    return (await db.execute(select(Report).where(*criteria))).scalars().first()
+
+def get_report_download_url(report: Report) -> str:
+    # Presigned URL for reports in S3, so the bytes bypass the API; local files go through it
+    report_format = report.format or "csv"
+    url = get_location_storage(report.url).download_url(
+        report.url, os.path.basename(report.url), REPORT_MEDIA_TYPES.get(report_format, 'application/octet-stream')
+    )
+    return url or f"/api/download_report?report_id={report.report_id}"
+
+async def find_reusable_report(db: AsyncSession, dedup_key: str):
+    report = await get_report_by(db, Report.dedup_key == dedup_key)
+    if not report:
+        return None
+
+    # A run older than the Celery time limit died without marking itself failed
+    stale_before = (await db.execute(select(func.now()))).scalar() - timedelta(seconds=celery_app.conf.task_time_limit or 3600)
+    stale = report.status == ReportStatus.running and report.created_at and report.created_at < stale_before
+    # Checking a report in S3 is a network call, so it runs in the threadpool
+    missing = report.status == ReportStatus.completed and not await run_in_threadpool(report_file_exists, report.url)
+    if stale or missing:
+        report.dedup_key = None
+        await db.commit()
+        return None
+    return report
+
 @router.post("/trigger_report")
-async def trigger_report(db: Session = Depends(get_db)):
+async def trigger_report(format: str = "csv", force: bool = False, profile: bool = False, window: List[str] = Query(None), incremental: bool = None, db: AsyncSession = Depends(get_async_db)):
+    if format not in REPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format {format}, expected one of {', '.join(REPORT_FORMATS)}")
     try:
+        parse_report_windows(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # Reports over unchanged data are reused: a completed one is returned as is and
+        # a running one is shared with the new caller, unless force is set. A profiled
+        # run always computes the report, since the profile is what the caller wants.
+        # The watermark queries are sync code; run_sync drives them on the async connection
+        watermark = await db.run_sync(get_data_watermark)
+        # Reports with custom windows only match reports with the same windows
+        windows_key = f"{hashlib.sha1(repr(window).encode('utf-8')).hexdigest()[:12]}:" if window else ""
+        dedup_key = None if force or profile else f"{format}:{windows_key}{watermark}"
+        if dedup_key:
+            existing = await find_reusable_report(db, dedup_key)
+            if existing:
+                return {
+                    "report_id": existing.report_id,
+                    "reused": True
+                }
+
         # Adding new Report instance in db 
         report_id = str(uuid.uuid4())
-        report = Report(report_id=report_id, status=ReportStatus.running)
+        report = Report(report_id=report_id, status=ReportStatus.running, format=format, windows=window or None, watermark=watermark, dedup_key=dedup_key)
         db.add(report)
-        db.commit()
-        db.refresh(report)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # A concurrent trigger created the report for this key first
+            await db.rollback()
+            existing = await get_report_by(db, Report.dedup_key == dedup_key)
+            if not existing:
+                raise
+            return {
+                "report_id": existing.report_id,
+                "reused": True
+            }
+        await db.refresh(report)
         
         # Call report_generation as a Celery task with just the report_id
-        celery_app.send_task('report_generation', args=[report_id])
+        # Incremental reports copy the stores without new logs from an earlier report
+        incremental = settings.REPORT_INCREMENTAL if incremental is None else incremental
+        # The worker computes from the settings version of the watermark, or restamps the report
+        settings_version = parse_data_watermark(watermark).settings_version
+        celery_app.send_task('report_generation', args=[report_id], kwargs={"profile": profile, "incremental": incremental, "settings_version": settings_version})
         
         return {
             "report_id": report_id
         }
     except Exception as e:
         logger.error(f"Error generating report: {str(e)}")
-        report.status = ReportStatus.failed
-        db.commit()
-        db.refresh(report)  
+        if 'report' in locals() and report.id:
+            report.status = ReportStatus.failed
+            report.dedup_key = None
+            await db.commit()
+            await db.refresh(report)  
         raise HTTPException(status_code=500, detail=str(e))
     
 @router.get("/get_report/{report_id}")
-async def get_report(report_id: str, db: Session = Depends(get_db)):
+async def get_report(report_id: str, db: AsyncSession = Depends(get_async_db)):
     try:
-        report = db.query(Report).filter(Report.report_id == report_id).first()
+        report = await get_report_by(db, Report.report_id == report_id)
         if not report:
             raise HTTPException(status_code=404, detail="Report not found")
 
         if report.status == ReportStatus.running:
-            return {"status": "Running"}
+            return {
+                "status": "Running",
+                "progress": get_report_progress(report)
+            }
         elif report.status == ReportStatus.completed:
             file_path = report.url
-            if not file_path or not os.path.exists(file_path):
+            if not await run_in_threadpool(report_file_exists, file_path):
                 raise HTTPException(status_code=404, detail="Report file not found")
             
             return {
                 "status": "Complete",
-                "file_path": file_path
+                "file_path": file_path,
+                "download_url": get_report_download_url(report),
+                "format": report.format or "csv",
+                "profile_path": report.profile_url,
+                "base_report_id": report.base_report_id
             }
         elif report.status == ReportStatus.failed:
-            return {"status": "Failed"}
+            return {
+                "status": "Failed",
+                "stage": report.stage,
+                "profile_path": report.profile_url
+            }
         else:
             raise HTTPException(status_code=500, detail="Unknown error")
             
@@ -64,16 +158,139 @@ async def get_report(report_id: str, db: Session = Depends(get_db)):
         logger.error(f"Error retrieving report: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/reports/{report_id}/stores")
+async def get_report_stores(
+    report_id: str,
+    filters: List[str] = Query(None, alias="filter"),
+    sort: str = "store_id",
+    order: str = "asc",
+    limit: int = Query(100, ge=1, le=MAX_RESULTS_PAGE_SIZE),
+    cursor: str = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Page of a completed report's stores from report_results; next_cursor continues it
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    descending = order == "desc"
+    try:
+        parsed_filters = [parse_result_filter(spec) for spec in filters or []]
+        after = decode_results_cursor(cursor, sort, descending) if cursor else None
+        statement = select_report_results(report_id, parsed_filters, sort, descending, after, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        report = await get_report_by(db, Report.report_id == report_id)
+        if not report:
+            raise HTTPException(status_code=404, detail="Report not found")
+        if report.status != ReportStatus.completed:
+            raise HTTPException(status_code=409, detail=f"Report is {report.status.value}, not Complete")
+
+        stores = [format_report_result(row) for row in (await db.execute(statement)).scalars()]
+        return {
+            "report_id": report_id,
+            "stores": stores,
+            "next_cursor": encode_results_cursor(sort, descending, stores[-1]) if len(stores) == limit else None
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error listing stores of report {report_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def read_report_status(report_id: str) -> dict:
+    # A short session per read, so a waiting client holds no pooled connection
+    async with AsyncSessionLocal() as db:
+        return await get_report(report_id, db)
+
+@router.get("/get_report/{report_id}/wait")
+async def wait_for_report(report_id: str, timeout: float = Query(30, gt=0)):
+    # get_report, but a running report is answered once it completes or fails (or after timeout seconds)
+    with report_status_hub.subscribe(report_id) as events:
+        body = await read_report_status(report_id)
+        if body["status"] != ReportStatus.running.value:
+            return body
+        try:
+            await asyncio.wait_for(events.get(), min(timeout, settings.REPORT_WAIT_MAX_SECONDS))
+        except asyncio.TimeoutError:
+            return body
+        return await read_report_status(report_id)
+
+def format_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+@router.get("/reports/{report_id}/events")
+async def report_events(report_id: str):
+    """Server-sent events: the get_report body now and after every status change, until it is final."""
+    # Unknown reports fail before the stream starts
+    await read_report_status(report_id)
+
+    async def stream():
+        with report_status_hub.subscribe(report_id) as events:
+            body = await read_report_status(report_id)
+            yield format_event("status", body)
+            idle = 0.0
+            while body["status"] == ReportStatus.running.value:
+                try:
+                    await asyncio.wait_for(events.get(), settings.REPORT_EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    idle += settings.REPORT_EVENTS_HEARTBEAT_SECONDS
+                    if idle < settings.REPORT_WAIT_MAX_SECONDS:
+                        # Comment line, keeps proxies from closing the idle stream
+                        yield ": keep-alive\n\n"
+                        continue
+                # Also re-read now and then, in case a published change was missed
+                idle = 0.0
+                body = await read_report_status(report_id)
+                yield format_event("status", body)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.post("/retry_report/{report_id}")
+async def retry_report(report_id: str, db: AsyncSession = Depends(get_async_db)):
+    try:
+        report = await get_report_by(db, Report.report_id == report_id)
+        if not report:
+            raise HTTPException(status_code=404, detail="Report not found")
+        if report.status != ReportStatus.failed:
+            raise HTTPException(status_code=409, detail="Only failed reports can be retried")
+
+        report.status = ReportStatus.running
+        await db.commit()
+
+        # Shards that already wrote their partial file are not recomputed; they may have
+        # copied stores from the base report, so the retry looks for one too
+        celery_app.send_task('report_generation', args=[report_id], kwargs={"incremental": report.base_report_id is not None})
+
+        return {
+            "report_id": report_id
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrying report: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/download_report")
-async def download_report(file_path: str):
+async def download_report(report_id: str = None, file_path: str = None, db: AsyncSession = Depends(get_async_db)):
     try:
-        if not file_path or not os.path.exists(file_path):
+        # Only files of completed reports are served, never an arbitrary caller-supplied path
+        if report_id:
+            report = await get_report_by(db, Report.report_id == report_id)
+        elif file_path:
+            report = await get_report_by(db, Report.url == file_path)
+        else:
+            raise HTTPException(status_code=400, detail="report_id is required")
+        if not report or report.status != ReportStatus.completed or not await run_in_threadpool(report_file_exists, report.url):
             raise HTTPException(status_code=404, detail="Report file not found")
-        
+
+        if get_location_storage(report.url).name != "local":
+            return RedirectResponse(get_report_download_url(report))
+
         return FileResponse(
-            path=file_path,
-            filename=os.path.basename(file_path),
-            media_type='application/octet-stream'
+            path=report.url,
+            filename=os.path.basename(report.url),
+            media_type=REPORT_MEDIA_TYPES.get(report.format or "csv", 'application/octet-stream')
         )
     except HTTPException:
         raise
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+import logging
+from app.core import settings
+from app.services.ingest_service import BufferFullError, parse_status_logs, status_log_buffer
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.post("/status_logs", status_code=202)
+async def ingest_status_logs(request: Request):
+    try:
+        body = await request.body()
+        try:
+            # Parsing thousands of rows would otherwise block the event loop
+            rows, errors = await run_in_threadpool(parse_status_logs, body, request.headers.get("content-type", ""))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {str(e)}")
+
+        if errors:
+            # Reject the whole batch so the poller can resend it as a unit
+            raise HTTPException(status_code=422, detail={"rejected": len(errors), "errors": errors[:100]})
+        if len(rows) > settings.INGEST_MAX_BATCH_ROWS:
+            raise HTTPException(status_code=413, detail=f"Batches are limited to {settings.INGEST_MAX_BATCH_ROWS} rows")
+
+        try:
+            status_log_buffer.add(rows)
+        except BufferFullError as e:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": str(e)},
+                headers={"Retry-After": str(max(1, int(settings.INGEST_FLUSH_INTERVAL_SECONDS)))}
+            )
+
+        return {
+            "accepted": len(rows)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error ingesting status logs: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
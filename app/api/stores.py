@@ -0,0 +1,119 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from datetime import datetime, timedelta
+from typing import List, Optional
+import logging
+from app.core import get_db, settings
+from app.models import StoreStatusLog
+from app.services.report_service import compute_store_result, load_single_store_settings
+from app.utils import get_store_logs_within_week, schedule_key
+from app.utils.cache import TTLCache
+from app.utils.schedule import EPOCH
+from app.utils.uptime_engine import to_epoch_us
+from app.utils.uptime_index import UptimeIndex, parse_report_windows, window_bounds
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Results are keyed by the store's latest log and settings, so a new log or an hours
+# change is a new key; the TTL only bounds how long stale keys hold memory
+store_uptime_cache = TTLCache(settings.STORE_UPTIME_CACHE_SIZE, settings.STORE_UPTIME_CACHE_TTL_SECONDS)
+store_uptime_index_cache = TTLCache(settings.STORE_UPTIME_CACHE_SIZE, settings.STORE_UPTIME_CACHE_TTL_SECONDS)
+
+def load_store_state(db: Session, store_id: str):
+    # Timezone, hours and latest log time of a store, or 404
+    timezone_str, time_range = load_single_store_settings(db, store_id)
+    if timezone_str is None:
+        raise HTTPException(status_code=404, detail="Store not found")
+
+    # (store_id, timestamp_utc) index lookup
+    last_store_log_time = db.query(func.max(StoreStatusLog.timestamp_utc)).filter(
+        StoreStatusLog.store_id == store_id
+    ).scalar()
+    if last_store_log_time is None:
+        raise HTTPException(status_code=404, detail="No status logs found for store")
+    return timezone_str, time_range, last_store_log_time
+
+# A plain def runs in the threadpool, so the blocking queries don't stall other requests
+@router.get("/stores/{store_id}/uptime")
+def get_store_uptime(store_id: str, db: Session = Depends(get_db)):
+    try:
+        timezone_str, time_range, last_store_log_time = load_store_state(db, store_id)
+
+        cache_key = (store_id, last_store_log_time, timezone_str, schedule_key(time_range))
+        result = store_uptime_cache.get(cache_key)
+        if result is None:
+            store_logs = get_store_logs_within_week(db, store_id, last_store_log_time)
+            result = compute_store_result(store_id, store_logs, last_store_log_time, timezone_str, time_range)
+            store_uptime_cache.set(cache_key, result)
+
+        return {
+            **result,
+            "last_log_time_utc": last_store_log_time.isoformat()
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing uptime for store {store_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def from_epoch_us(epoch_us: Optional[int]) -> Optional[str]:
+    return (EPOCH + timedelta(microseconds=epoch_us)).isoformat() if epoch_us is not None else None
+
+@router.get("/stores/{store_id}/uptime/windows")
+def get_store_window_uptime(
+    store_id: str,
+    window: List[str] = Query(None),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    # Relative windows (as on trigger_report) and/or one absolute [start, end) range (UTC)
+    try:
+        windows = parse_report_windows(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if (start is None) != (end is None):
+        raise HTTPException(status_code=400, detail="start and end must be given together")
+    if start is not None and end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if not windows and start is None:
+        raise HTTPException(status_code=400, detail="Give at least one window or a start and end")
+
+    try:
+        timezone_str, time_range, last_store_log_time = load_store_state(db, store_id)
+
+        # The index covers the report's one-week lookback and is reused for every window
+        cache_key = (store_id, last_store_log_time, timezone_str, schedule_key(time_range))
+        index = store_uptime_index_cache.get(cache_key)
+        if index is None:
+            store_logs = get_store_logs_within_week(db, store_id, last_store_log_time)
+            index = UptimeIndex.build(store_logs, timezone_str, time_range)
+            store_uptime_index_cache.set(cache_key, index)
+
+        bounds = [(w.name, *window_bounds(w, last_store_log_time, timezone_str)) for w in windows]
+        if start is not None:
+            bounds.append(("range", to_epoch_us(start), to_epoch_us(end)))
+        uptime, downtime = index.minutes([b[1] for b in bounds], [b[2] for b in bounds])
+
+        return {
+            "store_id": store_id,
+            "last_log_time_utc": last_store_log_time.isoformat(),
+            "covered_from_utc": from_epoch_us(index.covered_from),
+            "covered_to_utc": from_epoch_us(index.covered_to),
+            "windows": [
+                {
+                    "name": name,
+                    "start_utc": from_epoch_us(window_start),
+                    "end_utc": from_epoch_us(window_end),
+                    "uptime_minutes": round(up, 2),
+                    "downtime_minutes": round(down, 2),
+                }
+                for (name, window_start, window_end), up, down in zip(bounds, uptime.tolist(), downtime.tolist())
+            ]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing window uptime for store {store_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,11 +1,12 @@
 from .config import settings
-from .database import Base, get_db, init_db
+from .database import Base, get_db, get_async_db, init_db
 from .db_utils import get_db_session
 
 __all__ = [
     'settings',
     'Base',
     'get_db',
+    'get_async_db',
     'init_db',
     'get_db_session'
 ]
@@ -1,30 +1,127 @@
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
+from typing import Optional
+from sqlalchemy.engine import make_url
 import os
 
 
 load_dotenv()
 
+# Async driver used for each database backend by the API's async engine
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+}
+
 class Settings(BaseSettings):
   
-    MYSQL_USER: str = os.getenv("MYSQL_USER")
-    MYSQL_PASSWORD: str = os.getenv("MYSQL_PASSWORD")
-    MYSQL_HOST: str = os.getenv("MYSQL_HOST")
-    MYSQL_PORT: str = os.getenv("MYSQL_PORT")
-    MYSQL_DB: str = os.getenv("MYSQL_DB")
+    MYSQL_USER: Optional[str] = os.getenv("MYSQL_USER")
+    MYSQL_PASSWORD: Optional[str] = os.getenv("MYSQL_PASSWORD")
+    MYSQL_HOST: Optional[str] = os.getenv("MYSQL_HOST")
+    MYSQL_PORT: Optional[str] = os.getenv("MYSQL_PORT")
+    MYSQL_DB: Optional[str] = os.getenv("MYSQL_DB")
+
+    # Full SQLAlchemy URL, overrides the MYSQL_* settings (e.g. sqlite:///store_monitor.db)
+    DATABASE_URL: Optional[str] = os.getenv("DATABASE_URL")
+    # URL of the API's async engine; derived from the sync URL (aiomysql / aiosqlite) when unset
+    ASYNC_DATABASE_URL: Optional[str] = os.getenv("ASYNC_DATABASE_URL")
+
+    # Connection pool, per engine and process (ignored for in-memory SQLite)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT_SECONDS: int = int(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+    # Below MySQL's wait_timeout, so idle connections are replaced before the server drops them
+    DB_POOL_RECYCLE_SECONDS: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
 
     # AWS settings
-    AWS_ACCESS_KEY_ID: str = os.getenv("AWS_ACCESS_KEY_ID")
-    AWS_SECRET_ACCESS_KEY: str = os.getenv("AWS_SECRET_ACCESS_KEY")
-    AWS_REGION: str = os.getenv("AWS_REGION")
-    S3_BUCKET_NAME: str = os.getenv("S3_BUCKET_NAME")
+    AWS_ACCESS_KEY_ID: Optional[str] = os.getenv("AWS_ACCESS_KEY_ID")
+    AWS_SECRET_ACCESS_KEY: Optional[str] = os.getenv("AWS_SECRET_ACCESS_KEY")
+    AWS_REGION: Optional[str] = os.getenv("AWS_REGION")
+    S3_BUCKET_NAME: Optional[str] = os.getenv("S3_BUCKET_NAME")
+    # S3-compatible endpoint (e.g. MinIO); unset for AWS
+    S3_ENDPOINT_URL: Optional[str] = os.getenv("S3_ENDPOINT_URL")
+    S3_REPORT_PREFIX: str = os.getenv("S3_REPORT_PREFIX", "")
+    # Reports are uploaded in parts of this size while they are written (minimum 5)
+    S3_MULTIPART_PART_SIZE_MB: int = int(os.getenv("S3_MULTIPART_PART_SIZE_MB", "8"))
+
+    # Where reports are written: "local" (reports/ on the worker) or "s3" (S3_BUCKET_NAME)
+    REPORT_STORAGE: str = os.getenv("REPORT_STORAGE", "local")
+    # Lifetime of the presigned download URLs of reports in S3
+    REPORT_URL_EXPIRES_SECONDS: int = int(os.getenv("REPORT_URL_EXPIRES_SECONDS", "3600"))
     
     # Redis 
-    REDIS_URL: str = os.getenv("REDIS_URL")
+    REDIS_URL: Optional[str] = os.getenv("REDIS_URL")
+
+    # Report generation
+    REPORT_ENGINE: str = os.getenv("REPORT_ENGINE", "python")
+    REPORT_BATCH_SIZE: int = int(os.getenv("REPORT_BATCH_SIZE", "2000"))
+    REPORT_SHARDS: int = int(os.getenv("REPORT_SHARDS", "1"))
+    REPORT_SHARD_MAX_RETRIES: int = int(os.getenv("REPORT_SHARD_MAX_RETRIES", "3"))
+    # Default of trigger_report?incremental: copy the stores without new logs from the last
+    # completed report instead of recomputing them
+    REPORT_INCREMENTAL: bool = os.getenv("REPORT_INCREMENTAL", "false").lower() in ("1", "true", "yes")
+    # Rows per insert into report_results (GET /api/reports/{id}/stores)
+    REPORT_RESULTS_BATCH_SIZE: int = int(os.getenv("REPORT_RESULTS_BATCH_SIZE", "5000"))
+    REPORT_PROGRESS_INTERVAL_SECONDS: float = float(os.getenv("REPORT_PROGRESS_INTERVAL_SECONDS", "2.0"))
+    REPORT_PROFILE_INTERVAL_SECONDS: float = float(os.getenv("REPORT_PROFILE_INTERVAL_SECONDS", "0.01"))
+    # Longest wait of GET /api/get_report/{id}/wait, and how often report event streams re-read
+    # the report when no status change was published
+    REPORT_WAIT_MAX_SECONDS: float = float(os.getenv("REPORT_WAIT_MAX_SECONDS", "60"))
+    REPORT_EVENTS_HEARTBEAT_SECONDS: float = float(os.getenv("REPORT_EVENTS_HEARTBEAT_SECONDS", "15"))
+
+    # Celery worker profile: "solo" runs one task per process and restarts it after every
+    # task (Windows); "linux" keeps a pool of warm processes (or threads) that reuse their
+    # database pool, store settings and compiled schedules across tasks
+    WORKER_PROFILE: str = os.getenv("WORKER_PROFILE", "solo" if os.name == "nt" else "linux")
+    # "prefork" or "threads", linux profile only
+    WORKER_POOL: str = os.getenv("WORKER_POOL", "prefork")
+    # Pool processes/threads per worker, 0 for one per CPU
+    WORKER_CONCURRENCY: int = int(os.getenv("WORKER_CONCURRENCY", "0"))
+    # Report tasks are long, so a process only reserves the task it is about to run
+    WORKER_PREFETCH_MULTIPLIER: int = int(os.getenv("WORKER_PREFETCH_MULTIPLIER", "1"))
+    # A prefork child is replaced once its resident memory exceeds this after a task (0 = never)
+    WORKER_MAX_MEMORY_PER_CHILD_KB: int = int(os.getenv("WORKER_MAX_MEMORY_PER_CHILD_KB", "1048576"))
+    # Also replace children after this many tasks (0 = never)
+    WORKER_MAX_TASKS_PER_CHILD: int = int(os.getenv("WORKER_MAX_TASKS_PER_CHILD", "0"))
+    WORKER_PRELOAD_CACHES: bool = os.getenv("WORKER_PRELOAD_CACHES", "true").lower() in ("1", "true", "yes")
+    # Store settings are reused across tasks while the settings version is unchanged, for at most this long
+    STORE_SETTINGS_CACHE_TTL_SECONDS: int = int(os.getenv("STORE_SETTINGS_CACHE_TTL_SECONDS", "300"))
+
+    # Hourly uptime rollups
+    ROLLUP_INTERVAL_SECONDS: int = int(os.getenv("ROLLUP_INTERVAL_SECONDS", "300"))
+    ROLLUP_MAX_LOGS_PER_RUN: int = int(os.getenv("ROLLUP_MAX_LOGS_PER_RUN", "500000"))
+
+    # Status log ingestion (POST /api/status_logs)
+    INGEST_BUFFER_MAX_ROWS: int = int(os.getenv("INGEST_BUFFER_MAX_ROWS", "200000"))
+    INGEST_FLUSH_ROWS: int = int(os.getenv("INGEST_FLUSH_ROWS", "5000"))
+    INGEST_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("INGEST_FLUSH_INTERVAL_SECONDS", "1.0"))
+    INGEST_MAX_BATCH_ROWS: int = int(os.getenv("INGEST_MAX_BATCH_ROWS", "50000"))
+
+    # GET /api/stores/{store_id}/uptime result cache
+    STORE_UPTIME_CACHE_SIZE: int = int(os.getenv("STORE_UPTIME_CACHE_SIZE", "10000"))
+    STORE_UPTIME_CACHE_TTL_SECONDS: int = int(os.getenv("STORE_UPTIME_CACHE_TTL_SECONDS", "300"))
+
+    # Store status log retention, counted back from the newest log
+    LOG_RETENTION_DAYS: int = int(os.getenv("LOG_RETENTION_DAYS", "35"))
+    LOG_RETENTION_INTERVAL_SECONDS: int = int(os.getenv("LOG_RETENTION_INTERVAL_SECONDS", "86400"))
+    LOG_RETENTION_BATCH_SIZE: int = int(os.getenv("LOG_RETENTION_BATCH_SIZE", "10000"))
+    # "day" or "week"; only used once the table is partitioned (MySQL)
+    LOG_PARTITION_INTERVAL: str = os.getenv("LOG_PARTITION_INTERVAL", "day")
+    LOG_PARTITION_DAYS_AHEAD: int = int(os.getenv("LOG_PARTITION_DAYS_AHEAD", "7"))
     
     @property
     def SQLALCHEMY_DATABASE_URL(self):
+        if self.DATABASE_URL:
+            return self.DATABASE_URL
         return f"mysql://{self.MYSQL_USER}:{self.MYSQL_PASSWORD}@{self.MYSQL_HOST}:{self.MYSQL_PORT}/{self.MYSQL_DB}"
+
+    @property
+    def SQLALCHEMY_ASYNC_DATABASE_URL(self):
+        if self.ASYNC_DATABASE_URL:
+            return self.ASYNC_DATABASE_URL
+        url = make_url(self.SQLALCHEMY_DATABASE_URL)
+        return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)).render_as_string(hide_password=False)
     
     
     class Config:
@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
@@ -6,10 +8,42 @@ from .config import settings
 # Create the base class
 Base = declarative_base()
 
-# Create engine and session
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URL)
+def engine_options(url: str) -> dict:
+    options = {
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+    }
+    # In-memory SQLite uses a single-connection pool that takes no sizing options
+    if make_url(url).database not in (None, "", ":memory:"):
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        )
+    return options
+
+def enable_sqlite_wal(dbapi_connection, connection_record):
+    # Without WAL an open log scan blocks every other connection's writes, e.g. report progress
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
+# Create engine and session (Celery tasks, scripts and the threadpool routes)
+engine = create_engine(settings.SQLALCHEMY_DATABASE_URL, **engine_options(settings.SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine and session for the async def routes, so queries never block the event loop
+async_engine = create_async_engine(settings.SQLALCHEMY_ASYNC_DATABASE_URL, **engine_options(settings.SQLALCHEMY_ASYNC_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+for sqlite_engine in (engine, async_engine.sync_engine):
+    if sqlite_engine.dialect.name == "sqlite":
+        event.listen(sqlite_engine, "connect", enable_sqlite_wal)
+
+def insert_ignore(table):
+    # INSERT that skips rows hitting a unique key (INSERT IGNORE / INSERT OR IGNORE)
+    return insert(table).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+
 def get_db():
     db = SessionLocal()
     try:
@@ -17,7 +51,13 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def init_db():
     # Import models here to avoid circular imports
-    from app.models.models import StoreStatusLog, BusinessHours, StoreTimezone, Report
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    from app.models.models import StoreStatusLog, BusinessHours, StoreTimezone, Report, ReportResult, StoreStatusHourlyRollup, StoreStatusRollupState, StoreStatusRollupSettings, DataLoadCheckpoint
+    from app.core.migrations import add_settings_update_tracking
+    Base.metadata.create_all(bind=engine)
+    add_settings_update_tracking(engine)
@@ -1,10 +1,45 @@
-from app.core.database import init_db
+import argparse
+from app.core.config import settings
+from app.core.database import init_db, engine
+from app.core.migrations import add_missing_columns, add_missing_indexes, add_settings_update_tracking, deduplicate_store_status_logs, drop_outdated_rollups, partition_store_status_logs, supports_partitioning
 from app.models import models  # This import is necessary to register the models
 
 def main():
+    parser = argparse.ArgumentParser(description="Create and migrate the database tables")
+    parser.add_argument('--partition', choices=['day', 'week'], help="range-partition store_status_logs by timestamp (MySQL only)")
+    parser.add_argument('--days-ahead', type=int, default=settings.LOG_PARTITION_DAYS_AHEAD, help="partitions to create past today")
+    args = parser.parse_args()
+
+    # Rollups of an older layout are dropped here and recreated by init_db
+    if drop_outdated_rollups(engine):
+        print("Dropped the hourly rollups; the next rollup run rebuilds them")
+
     print("Creating database tables...")
     init_db()
     print("Database tables created successfully!")
 
+    for column in add_missing_columns(engine):
+        print(f"Added column {column}")
+
+    # Logs of an older version may repeat a (store_id, timestamp_utc) the unique index forbids
+    deleted = deduplicate_store_status_logs(engine)
+    if deleted:
+        print(f"Deleted {deleted} duplicate store status logs")
+
+    # Tables created by an older version get new indexes here
+    for index in add_missing_indexes(engine):
+        print(f"Created index {index}")
+
+    # Settings edits in place move the settings version through updated_at
+    for table in add_settings_update_tracking(engine):
+        print(f"Tracking updates of {table}")
+
+    if args.partition:
+        if not supports_partitioning(engine):
+            print(f"Skipping partitioning: not supported on {engine.dialect.name}")
+        else:
+            partitions = partition_store_status_logs(engine, args.partition, args.days_ahead)
+            print(f"store_status_logs has {partitions} new partitions" if partitions else "store_status_logs is already partitioned")
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,116 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+import os
+import time
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, multiprocess
+
+# With PROMETHEUS_MULTIPROC_DIR set (before this module is imported), every process - API
+# workers and Celery workers alike - writes its samples to files in that directory and
+# /metrics aggregates them; without it metrics live in the process' default registry.
+
+REPORT_STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REPORT_DURATION_SECONDS = Histogram(
+    "report_duration_seconds", "Wall time of a report (or report shard) job",
+    ["engine", "job", "status"], buckets=REPORT_STAGE_BUCKETS
+)
+REPORT_STAGE_SECONDS = Histogram(
+    "report_stage_seconds", "Wall time of one stage of a report job",
+    ["engine", "stage"], buckets=REPORT_STAGE_BUCKETS
+)
+REPORT_STORES_TOTAL = Counter("report_stores_total", "Stores computed by report jobs", ["engine"])
+REPORT_LOG_ROWS_TOTAL = Counter("report_log_rows_total", "Status log rows read by report jobs", ["engine"])
+REPORTS_IN_PROGRESS = Gauge("reports_in_progress", "Report jobs currently running", ["job"], multiprocess_mode="livesum")
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Latency of API requests",
+    ["method", "route", "status"], buckets=HTTP_BUCKETS
+)
+
+def get_metrics_registry():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+def mark_process_dead(pid: int):
+    # Drops the live gauges of an exited worker process
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+class ReportTimer:
+    """Accumulates per-stage time of one report job and publishes it once at the end.
+
+    Stages run once per store, so observing each call would flood the histograms with
+    tiny samples; the totals per job are what we alert on.
+    """
+
+    def __init__(self, engine: str):
+        self.engine = engine
+        self.seconds = defaultdict(float)
+        self.stores = 0
+        self.stores_total = 0
+        # Stores copied from the base report of an incremental report
+        self.stores_reused = 0
+        self.log_rows = 0
+        # Innermost stage entered last, for progress reporting
+        self.current_stage = None
+
+    @contextmanager
+    def stage(self, name: str):
+        self.current_stage = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - started
+
+    def iterate(self, name: str, iterable: Iterable) -> Iterator:
+        # Times only the work done inside the iterable, not in the loop body consuming it
+        iterator = iter(iterable)
+        while True:
+            if not name.startswith("_"):
+                self.current_stage = name
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.seconds[name] += time.perf_counter() - started
+                return
+            self.seconds[name] += time.perf_counter() - started
+            yield item
+
+    @contextmanager
+    def consumer_stage(self, name: str, results: Iterable):
+        """Time a stage that consumes `results` lazily, e.g. a streaming file write.
+
+        Producing the results is charged to the stages inside the producer, so only the
+        consumer's own time is added to `name`.
+        """
+        started = time.perf_counter()
+        try:
+            yield self.iterate("_produced", results)
+        finally:
+            produced = self.seconds.pop("_produced", 0.0)
+            self.seconds[name] += time.perf_counter() - started - produced
+
+    def observe(self):
+        for name, seconds in self.seconds.items():
+            REPORT_STAGE_SECONDS.labels(engine=self.engine, stage=name).observe(seconds)
+        REPORT_STORES_TOTAL.labels(engine=self.engine).inc(self.stores)
+        REPORT_LOG_ROWS_TOTAL.labels(engine=self.engine).inc(self.log_rows)
+
+@contextmanager
+def track_report_job(engine: str, job: str):
+    REPORTS_IN_PROGRESS.labels(job=job).inc()
+    started = time.perf_counter()
+    status = "failed"
+    try:
+        yield
+        status = "completed"
+    finally:
+        REPORTS_IN_PROGRESS.labels(job=job).dec()
+        REPORT_DURATION_SECONDS.labels(engine=engine, job=job, status=status).observe(time.perf_counter() - started)
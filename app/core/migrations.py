@@ -0,0 +1,264 @@
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+import logging
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+STORE_STATUS_TABLE = "store_status_logs"
+# Plain (store_id, timestamp_utc) index of older versions, replaced by the unique one
+REPLACED_STORE_TIME_INDEX = "ix_store_status_logs_store_time"
+SETTINGS_TABLES = ["business_hours", "store_timezones"]
+PARTITION_INTERVALS = {
+    "day": 1,
+    "week": 7,
+}
+
+def add_missing_indexes(engine: Engine) -> List[str]:
+    """Create model indexes missing from tables created by an older version.
+
+    The unique (store_id, timestamp_utc) index of store_status_logs comes from
+    deduplicate_store_status_logs instead. Returns the names of the indexes that were created.
+    """
+    from app.core.database import Base
+
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            logger.info(f"Creating index {index.name} on {table.name}")
+            index.create(bind=engine)
+            created.append(index.name)
+    return created
+
+def deduplicate_store_status_logs(engine: Engine) -> int:
+    """Make (store_id, timestamp_utc) unique on a store_status_logs table of an older version.
+
+    Logs repeating a stored (store_id, timestamp_utc) are deleted, keeping the one with the
+    lowest id (the first stored), then the unique index replaces the plain one. Returns the
+    logs deleted; tables that already have the unique index are left alone.
+    """
+    from app.models import StoreStatusLog
+
+    inspector = inspect(engine)
+    if STORE_STATUS_TABLE not in inspector.get_table_names():
+        return 0
+    existing = {index["name"] for index in inspector.get_indexes(STORE_STATUS_TABLE)}
+    unique_index = next(index for index in StoreStatusLog.__table__.indexes if index.unique)
+    if unique_index.name in existing:
+        return 0
+
+    with engine.begin() as connection:
+        if engine.dialect.name == "mysql":
+            # MySQL cannot select from the table a DELETE targets, but it can join it
+            deleted = connection.execute(text(
+                f"DELETE later FROM {STORE_STATUS_TABLE} later JOIN {STORE_STATUS_TABLE} earlier "
+                "ON earlier.store_id = later.store_id AND earlier.timestamp_utc = later.timestamp_utc "
+                "AND earlier.id < later.id"
+            )).rowcount
+        else:
+            deleted = connection.execute(text(
+                f"DELETE FROM {STORE_STATUS_TABLE} WHERE id NOT IN "
+                f"(SELECT MIN(id) FROM {STORE_STATUS_TABLE} GROUP BY store_id, timestamp_utc)"
+            )).rowcount
+    logger.info(f"Deleted {deleted} duplicate logs of {STORE_STATUS_TABLE}")
+
+    logger.info(f"Creating index {unique_index.name} on {STORE_STATUS_TABLE}")
+    unique_index.create(bind=engine)
+    if REPLACED_STORE_TIME_INDEX in existing:
+        logger.info(f"Dropping index {REPLACED_STORE_TIME_INDEX} on {STORE_STATUS_TABLE}")
+        with engine.begin() as connection:
+            on_table = f" ON {STORE_STATUS_TABLE}" if engine.dialect.name == "mysql" else ""
+            connection.execute(text(f"DROP INDEX {REPLACED_STORE_TIME_INDEX}{on_table}"))
+    return deleted
+
+def drop_outdated_rollups(engine: Engine) -> bool:
+    """Drop hourly rollups stored in float minutes, so that create_all recreates the table.
+
+    Rollups are derived from the logs: with the rollup state gone too, the next
+    rollup_store_status run rebuilds them. Returns whether anything was dropped.
+    """
+    from app.models import StoreStatusHourlyRollup, StoreStatusRollupState
+
+    inspector = inspect(engine)
+    table = StoreStatusHourlyRollup.__table__
+    if table.name not in inspector.get_table_names():
+        return False
+    if "active_minutes" not in {column["name"] for column in inspector.get_columns(table.name)}:
+        return False
+    logger.info(f"Dropping {table.name} to rebuild it in integer microseconds")
+    table.drop(bind=engine)
+    if StoreStatusRollupState.__tablename__ in inspector.get_table_names():
+        with engine.begin() as connection:
+            connection.execute(StoreStatusRollupState.__table__.delete())
+    return True
+
+def add_missing_columns(engine: Engine) -> List[str]:
+    """Add model columns missing from tables created by an older version.
+
+    create_all only creates missing tables, so new nullable columns are added here.
+    Returns the "table.column" names that were added.
+    """
+    from app.core.database import Base
+
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                added.append(f"{table.name}.{column.name}")
+    for name in added:
+        logger.info(f"Added column {name}")
+    return added
+
+def add_settings_update_tracking(engine: Engine) -> List[str]:
+    """Have the database set updated_at of the settings tables on every insert and update.
+
+    Edits are made directly in the database, so the column is maintained there (ON UPDATE
+    on MySQL, triggers on SQLite) rather than by the ORM. Tables without the column yet are
+    skipped until add_missing_columns has added it. Returns the tables now tracked.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    tracked = []
+    with engine.begin() as connection:
+        for table in SETTINGS_TABLES:
+            if table not in existing_tables or "updated_at" not in {column["name"] for column in inspector.get_columns(table)}:
+                continue
+            if engine.dialect.name == "mysql":
+                connection.execute(text(
+                    f"ALTER TABLE {table} MODIFY updated_at DATETIME(6) NULL "
+                    "DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)"
+                ))
+            elif engine.dialect.name == "sqlite":
+                # Same text format as SQLAlchemy's SQLite DateTime, so max() orders correctly
+                now = "strftime('%Y-%m-%d %H:%M:%f', 'now') || '000'"
+                for event, condition in (("INSERT", "NEW.updated_at IS NULL"), ("UPDATE", "NEW.updated_at IS OLD.updated_at")):
+                    connection.execute(text(
+                        f"CREATE TRIGGER IF NOT EXISTS {table}_updated_at_{event.lower()} AFTER {event} ON {table} "
+                        f"FOR EACH ROW WHEN {condition} "
+                        f"BEGIN UPDATE {table} SET updated_at = {now} WHERE id = NEW.id; END"
+                    ))
+            else:
+                logger.warning(f"Settings edits in place on {engine.dialect.name} need updated_at set by the writer")
+                continue
+            tracked.append(table)
+    return tracked
+
+def supports_partitioning(engine: Engine) -> bool:
+    return engine.dialect.name == "mysql"
+
+def partition_boundaries(first_day: date, last_day: date, interval: str) -> List[date]:
+    # Exclusive upper bounds; weekly partitions start on Mondays
+    step = PARTITION_INTERVALS[interval]
+    boundary = first_day - timedelta(days=first_day.weekday()) if step == 7 else first_day
+    boundaries = []
+    while True:
+        boundary += timedelta(days=step)
+        boundaries.append(boundary)
+        if boundary > last_day:
+            return boundaries
+
+def partition_clause(boundaries: List[date]) -> str:
+    # Partitions are named after their exclusive upper bound
+    partitions = [
+        f"PARTITION p{boundary.strftime('%Y%m%d')} VALUES LESS THAN ('{boundary.isoformat()}')"
+        for boundary in boundaries
+    ]
+    partitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    return ", ".join(partitions)
+
+def list_store_status_partitions(engine: Engine) -> List[Tuple[str, Optional[datetime]]]:
+    """(partition name, exclusive upper bound) of every partition, None for MAXVALUE."""
+    if not supports_partitioning(engine):
+        return []
+
+    with engine.connect() as connection:
+        rows = connection.execute(text(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION"
+        ), {"table": STORE_STATUS_TABLE}).all()
+
+    partitions = []
+    for name, description in rows:
+        bound = None if description == "MAXVALUE" else datetime.fromisoformat(description.strip("'"))
+        partitions.append((name, bound))
+    return partitions
+
+def partition_store_status_logs(engine: Engine, interval: str = "day", days_ahead: int = 7) -> int:
+    """Range-partition store_status_logs by timestamp_utc (MySQL only).
+
+    MySQL requires the partitioning column in every unique key, so the primary key
+    becomes (id, timestamp_utc). Partitions cover the logged days plus days_ahead;
+    add_store_status_partitions keeps creating new ones. Returns the partition count.
+    """
+    from app.models import StoreStatusLog
+
+    if not supports_partitioning(engine):
+        raise ValueError(f"Partitioning needs MySQL, not {engine.dialect.name}")
+    if list_store_status_partitions(engine):
+        logger.info(f"{STORE_STATUS_TABLE} is already partitioned")
+        return 0
+
+    with engine.connect() as connection:
+        first_time, last_time = connection.execute(
+            select(func.min(StoreStatusLog.timestamp_utc), func.max(StoreStatusLog.timestamp_utc))
+        ).one()
+    today = datetime.utcnow().date()
+    first_day = first_time.date() if first_time else today
+    last_day = max(last_time.date() if last_time else today, today) + timedelta(days=days_ahead)
+    boundaries = partition_boundaries(first_day, last_day, interval)
+
+    logger.info(f"Partitioning {STORE_STATUS_TABLE} into {len(boundaries) + 1} {interval} partitions")
+    with engine.begin() as connection:
+        connection.execute(text(
+            f"ALTER TABLE {STORE_STATUS_TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp_utc)"
+        ))
+        connection.execute(text(
+            f"ALTER TABLE {STORE_STATUS_TABLE} PARTITION BY RANGE COLUMNS (timestamp_utc) ({partition_clause(boundaries)})"
+        ))
+    return len(boundaries) + 1
+
+def add_store_status_partitions(engine: Engine, until: date, interval: str = "day") -> int:
+    """Split the MAXVALUE partition so that dated partitions reach past `until`."""
+    partitions = list_store_status_partitions(engine)
+    bounds = [bound for _, bound in partitions if bound is not None]
+    if not bounds or bounds[-1].date() > until:
+        return 0
+
+    boundaries = partition_boundaries(bounds[-1].date(), until, interval)
+    # partition_boundaries restarts weekly steps on a Monday, never before the last bound
+    boundaries = [boundary for boundary in boundaries if boundary > bounds[-1].date()]
+    with engine.begin() as connection:
+        connection.execute(text(
+            f"ALTER TABLE {STORE_STATUS_TABLE} REORGANIZE PARTITION pmax INTO ({partition_clause(boundaries)})"
+        ))
+    logger.info(f"Added {len(boundaries)} partitions to {STORE_STATUS_TABLE}")
+    return len(boundaries)
+
+def drop_store_status_partitions(engine: Engine, cutoff: datetime) -> int:
+    """Drop every partition whose rows are all older than cutoff."""
+    expired = [name for name, bound in list_store_status_partitions(engine) if bound is not None and bound <= cutoff]
+    if not expired:
+        return 0
+
+    with engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE {STORE_STATUS_TABLE} DROP PARTITION {', '.join(expired)}"))
+    logger.info(f"Dropped partitions {', '.join(expired)} of {STORE_STATUS_TABLE}")
+    return len(expired)
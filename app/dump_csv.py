@@ -1,104 +1,179 @@
 import pandas as pd
 import os
+import argparse
+import csv
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import mysql.connector
-from mysql.connector import Error
-from datetime import datetime
+from sqlalchemy import create_engine, insert, select
+from app.core.config import settings
+from app.core.database import Base, insert_ignore
+from app.models import StoreStatusLog, BusinessHours, StoreTimezone, StoreStatusHourlyRollup, StoreStatusRollupState, StoreStatusRollupSettings, DataLoadCheckpoint
 
-def load_csv_to_mysql():
-    
-    load_dotenv()
-    
-    
-    db_config = {
-        'host': os.getenv('MYSQL_HOST'),
-        'user': os.getenv('MYSQL_USER'),
-        'password': os.getenv('MYSQL_PASSWORD'),
-        'database': "tasd",
-        'port': int(os.getenv('MYSQL_PORT'))
-    }
-    
-    try:
-        
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor()
-        
-        # Create tables if they don't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS store_status_logs (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                store_id VARCHAR(36),
-                timestamp_utc DATETIME NOT NULL,
-                status ENUM('active', 'inactive') NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_store_id (store_id)
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS business_hours (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                store_id VARCHAR(36),
-                day_of_week INT NOT NULL,
-                start_time_local TIME NOT NULL,
-                end_time_local TIME NOT NULL,
-                INDEX idx_store_id (store_id)
+def parse_store_status(chunk: pd.DataFrame) -> pd.DataFrame:
+    # Vectorized replacement for one strptime per row
+    timestamps = chunk['timestamp_utc'].str.replace(' UTC', '', regex=False)
+    return pd.DataFrame({
+        'store_id': chunk['store_id'],
+        'timestamp_utc': pd.Series(pd.to_datetime(timestamps, format='ISO8601').dt.to_pydatetime(), index=chunk.index, dtype=object),
+        'status': chunk['status'],
+    })
+
+def parse_menu_hours(chunk: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame({
+        'store_id': chunk['store_id'],
+        'day_of_week': chunk['dayOfWeek'].astype(int),
+        'start_time_local': pd.to_datetime(chunk['start_time_local'], format='%H:%M:%S').dt.time,
+        'end_time_local': pd.to_datetime(chunk['end_time_local'], format='%H:%M:%S').dt.time,
+    })
+
+def parse_timezones(chunk: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame({
+        'store_id': chunk['store_id'],
+        'timezone_str': chunk['timezone_str'],
+    })
+
+# (csv file, target model, chunk parser)
+DUMPS = [
+    ('store_status.csv', StoreStatusLog, parse_store_status),
+    ('menu_hours.csv', BusinessHours, parse_menu_hours),
+    ('timezones.csv', StoreTimezone, parse_timezones),
+]
+
+def get_checkpoint(engine, source: str) -> int:
+    with engine.begin() as connection:
+        rows_loaded = connection.execute(
+            select(DataLoadCheckpoint.rows_loaded).where(DataLoadCheckpoint.source == source)
+        ).scalar()
+        if rows_loaded is None:
+            connection.execute(insert(DataLoadCheckpoint), [{'source': source, 'rows_loaded': 0}])
+            return 0
+        return rows_loaded
+
+def insert_rows(connection, model, rows: pd.DataFrame, load_data_infile: bool):
+    # Polls repeating a stored (store_id, timestamp_utc) are skipped by its unique index
+    ignore_duplicates = model is StoreStatusLog
+    if load_data_infile:
+        # Let the MySQL server parse the batch instead of binding every value
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', delete=False) as tmp:
+            rows.to_csv(tmp, index=False, header=False, quoting=csv.QUOTE_MINIMAL, date_format='%Y-%m-%d %H:%M:%S.%f')
+        try:
+            connection.exec_driver_sql(
+                f"LOAD DATA LOCAL INFILE '{tmp.name}' {'IGNORE ' if ignore_duplicates else ''}INTO TABLE {model.__tablename__} "
+                "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' "
+                f"({', '.join(rows.columns)})"
             )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS store_timezones (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                store_id VARCHAR(36) UNIQUE,
-                timezone_str VARCHAR(50) NOT NULL DEFAULT 'America/Chicago',
-                INDEX idx_store_id (store_id)
+        finally:
+            os.remove(tmp.name)
+    else:
+        # One executemany per batch instead of one INSERT per row
+        statement = insert_ignore(model.__table__) if ignore_duplicates else insert(model.__table__)
+        connection.execute(statement, rows.to_dict('records'))
+
+def load_csv(engine, dumps_dir: str, filename: str, model, parse, batch_size: int, load_data_infile: bool) -> int:
+    path = os.path.join(dumps_dir, filename)
+    if not os.path.exists(path):
+        print(f"Skipping {filename}: {path} not found")
+        return 0
+
+    # Resume after the rows committed by a previous, interrupted run
+    rows_loaded = get_checkpoint(engine, filename)
+    if rows_loaded:
+        print(f"Resuming {filename} after {rows_loaded} rows")
+
+    started = time.perf_counter()
+    rows_this_run = 0
+    chunks = pd.read_csv(path, chunksize=batch_size, dtype=str, skiprows=range(1, rows_loaded + 1))
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        rows = parse(chunk)
+
+        # Rows and checkpoint are committed together, so a failure never loads a batch twice
+        with engine.begin() as connection:
+            insert_rows(connection, model, rows, load_data_infile)
+            rows_loaded += len(rows)
+            connection.execute(
+                DataLoadCheckpoint.__table__.update()
+                .where(DataLoadCheckpoint.source == filename)
+                .values(rows_loaded=rows_loaded)
             )
-        """)
-        
-        # Load data
-        print("Loading store_status.csv...")
-        store_status_df = pd.read_csv('dumps/store_status.csv')
-        for _, row in store_status_df.iterrows():
-            # Convert UTC timestamp string to datetime object
-            timestamp_str = row['timestamp_utc'].replace(' UTC', '')
-            timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S.%f')
-            
-            cursor.execute("""
-                INSERT INTO store_status_logs (store_id, timestamp_utc, status)
-                VALUES (%s, %s, %s)
-            """, (row['store_id'], timestamp, row['status']))
-        
-        
-        print("Loading menu_hours.csv...")
-        menu_hours_df = pd.read_csv('dumps/menu_hours.csv')
-        for _, row in menu_hours_df.iterrows():
-            cursor.execute("""
-                INSERT INTO business_hours (store_id, day_of_week, start_time_local, end_time_local)
-                VALUES (%s, %s, %s, %s)
-            """, (row['store_id'], row['dayOfWeek'], row['start_time_local'], row['end_time_local']))
-        
-        
-        print("Loading timezones.csv...")
-        timezones_df = pd.read_csv('dumps/timezones.csv')
-        for _, row in timezones_df.iterrows():
-            cursor.execute("""
-                INSERT INTO store_timezones (store_id, timezone_str)
-                VALUES (%s, %s)
-            """, (row['store_id'], row['timezone_str']))
-        
-        # Commit the transaction
-        connection.commit()
-        print("Data loaded successfully!")
-        
-    except Error as e:
+
+        rows_this_run += len(rows)
+        elapsed = time.perf_counter() - started
+        print(f"{filename}: {rows_loaded} rows loaded ({rows_this_run / elapsed:,.0f} rows/s)")
+
+    elapsed = time.perf_counter() - started
+    print(f"Loaded {rows_this_run} rows from {filename} in {elapsed:.1f}s ({rows_this_run / max(elapsed, 1e-9):,.0f} rows/s)")
+    return rows_this_run
+
+def load_csv_to_mysql(database_url: str = None, dumps_dir: str = 'dumps', batch_size: int = 50000,
+                      parallel: bool = True, load_data_infile: bool = False, reset: bool = False):
+
+    load_dotenv()
+
+    database_url = database_url or settings.SQLALCHEMY_DATABASE_URL
+    connect_args = {'local_infile': 1} if load_data_infile else {}
+    engine = create_engine(database_url, connect_args=connect_args)
+
+    if load_data_infile and engine.dialect.name != 'mysql':
+        print("LOAD DATA LOCAL INFILE needs MySQL, falling back to batched inserts")
+        load_data_infile = False
+
+    # Create tables if they don't exist
+    Base.metadata.create_all(bind=engine)
+
+    if reset:
+        # Checkpoints only make sense for the rows already loaded, so a reset empties the
+        # loaded tables (and the rollups derived from the logs) in the same transaction
+        with engine.begin() as connection:
+            for model in [model for _, model, _ in DUMPS] + [StoreStatusHourlyRollup, StoreStatusRollupState, StoreStatusRollupSettings]:
+                connection.execute(model.__table__.delete())
+            connection.execute(DataLoadCheckpoint.__table__.delete())
+
+    started = time.perf_counter()
+    try:
+        # SQLite allows a single writer, so only load the tables in parallel elsewhere
+        workers = len(DUMPS) if parallel and engine.dialect.name != 'sqlite' else 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(load_csv, engine, dumps_dir, filename, model, parse, batch_size, load_data_infile)
+                for filename, model, parse in DUMPS
+            ]
+            total_rows = sum(future.result() for future in futures)
+
+        elapsed = time.perf_counter() - started
+        print(f"Data loaded successfully! {total_rows} rows in {elapsed:.1f}s ({total_rows / max(elapsed, 1e-9):,.0f} rows/s)")
+        return total_rows
+
+    except Exception as e:
         print(f"Error: {e}")
-        connection.rollback()
-    
+        print("Committed batches are kept; run the loader again to resume")
+        raise
+
     finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
-            print("MySQL connection is closed")
+        engine.dispose()
+        print("Database connection is closed")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the CSV dumps into the database")
+    parser.add_argument('--database-url', help="SQLAlchemy URL, defaults to the configured database")
+    parser.add_argument('--dumps-dir', default='dumps')
+    parser.add_argument('--batch-size', type=int, default=50000, help="rows per insert batch and commit")
+    parser.add_argument('--sequential', action='store_true', help="load the files one after another")
+    parser.add_argument('--load-data-infile', action='store_true', help="use LOAD DATA LOCAL INFILE (MySQL only)")
+    parser.add_argument('--reset', action='store_true', help="empty the loaded tables and checkpoints, then load every file from the start")
+    args = parser.parse_args()
+
+    load_csv_to_mysql(
+        database_url=args.database_url,
+        dumps_dir=args.dumps_dir,
+        batch_size=args.batch_size,
+        parallel=not args.sequential,
+        load_data_infile=args.load_data_infile,
+        reset=args.reset,
+    )
 
 if __name__ == "__main__":
-    load_csv_to_mysql() 
\ No newline at end of file
+    main()
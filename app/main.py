@@ -1,6 +1,11 @@
-from fastapi import FastAPI
-from app.api import reports
+from fastapi import FastAPI, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.api import reports, status_logs, stores
+from app.core.metrics import HTTP_REQUEST_SECONDS, get_metrics_registry
+from app.services.ingest_service import status_log_buffer
+from app.services.notification_service import report_status_hub
 import logging
+import time
 
 # Configure logging
 logging.basicConfig(
@@ -15,4 +20,42 @@ app = FastAPI(
 )
 
 # Include routers
-app.include_router(reports.router, prefix="/api", tags=["reports"]) 
\ No newline at end of file
+app.include_router(reports.router, prefix="/api", tags=["reports"])
+app.include_router(status_logs.router, prefix="/api", tags=["status_logs"])
+app.include_router(stores.router, prefix="/api", tags=["stores"])
+
+@app.on_event("startup")
+def start_status_log_buffer():
+    status_log_buffer.start()
+
+@app.on_event("shutdown")
+def flush_status_log_buffer():
+    # Buffered polls are written before the worker exits
+    status_log_buffer.stop()
+
+@app.on_event("startup")
+async def start_report_status_hub():
+    await report_status_hub.start()
+
+@app.on_event("shutdown")
+async def stop_report_status_hub():
+    await report_status_hub.stop()
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template, not the raw path, so ids do not explode the series count
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            method=request.method, route=route.path if route else "unmatched", status=status
+        ).observe(time.perf_counter() - started)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(generate_latest(get_metrics_registry()), media_type=CONTENT_TYPE_LATEST)
@@ -1,4 +1,4 @@
-from .models import StoreStatus, ReportStatus, StoreStatusLog, BusinessHours, StoreTimezone, Report
+from .models import StoreStatus, ReportStatus, StoreStatusLog, BusinessHours, StoreTimezone, Report, REPORT_RESULT_METRICS, ReportResult, StoreStatusHourlyRollup, StoreStatusRollupState, StoreStatusRollupSettings, DataLoadCheckpoint
 
 __all__ = [
     'StoreStatus',
@@ -6,5 +6,11 @@ __all__ = [
     'StoreStatusLog',
     'BusinessHours',
     'StoreTimezone',
-    'Report'
+    'Report',
+    'REPORT_RESULT_METRICS',
+    'ReportResult',
+    'StoreStatusHourlyRollup',
+    'StoreStatusRollupState',
+    'StoreStatusRollupSettings',
+    'DataLoadCheckpoint'
 ]
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum, Time, JSON
+from sqlalchemy import Column, BigInteger, Integer, String, DateTime, Enum, Time, JSON, Date, Index, UniqueConstraint
+from sqlalchemy.dialects import mysql
 from sqlalchemy.sql import func
 from app.core.database import Base
 import enum
@@ -14,6 +15,11 @@ class ReportStatus(enum.Enum):
 
 class StoreStatusLog(Base):
     __tablename__ = "store_status_logs"
+    __table_args__ = (
+        # Week-window scans and "latest log" lookups are index range scans in this order; unique
+        # so that a resent poll is ignored by the database (see insert_ignore)
+        Index("uq_store_status_logs_store_time", "store_id", "timestamp_utc", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     store_id = Column(String(36), index=True) 
@@ -21,6 +27,9 @@ class StoreStatusLog(Base):
     status = Column(Enum(StoreStatus), nullable=False)
     created_at = Column(DateTime, server_default=func.now())
 
+# Microseconds on MySQL, so that edits in quick succession still move max(updated_at)
+SETTINGS_UPDATED_AT = DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql")
+
 class BusinessHours(Base):
     __tablename__ = "business_hours"
 
@@ -29,6 +38,8 @@ class BusinessHours(Base):
     day_of_week = Column(Integer, nullable=False)  
     start_time_local = Column(Time, nullable=False)
     end_time_local = Column(Time, nullable=False)
+    # Set by the database on every insert and update (see add_settings_update_tracking)
+    updated_at = Column(SETTINGS_UPDATED_AT, nullable=True, index=True)
 
 class StoreTimezone(Base):
     __tablename__ = "store_timezones"
@@ -36,6 +47,7 @@ class StoreTimezone(Base):
     id = Column(Integer, primary_key=True, index=True)
     store_id = Column(String(36), unique=True, index=True)  
     timezone_str = Column(String(50), nullable=False, default="America/Chicago")
+    updated_at = Column(SETTINGS_UPDATED_AT, nullable=True, index=True)
 
 class Report(Base):
     __tablename__ = "reports"
@@ -45,4 +57,101 @@ class Report(Base):
     status = Column(Enum(ReportStatus), default=ReportStatus.running)
     created_at = Column(DateTime, server_default=func.now())
     completed_at = Column(DateTime, nullable=True)
-    url = Column(String(500), nullable=True) 
\ No newline at end of file
+    url = Column(String(500), nullable=True) 
+    # csv, csv.gz or parquet
+    format = Column(String(16), nullable=True, default="csv")
+    # Inputs the report was computed from (see get_data_watermark)
+    watermark = Column(String(128), nullable=True)
+    # format + watermark while the report is running or reusable; cleared when it fails,
+    # so at most one report per key and concurrent triggers collide on the unique index
+    dedup_key = Column(String(160), nullable=True, unique=True, index=True)
+    # Progress of a running report, saved every REPORT_PROGRESS_INTERVAL_SECONDS
+    stage = Column(String(32), nullable=True)
+    stores_done = Column(Integer, nullable=True)
+    stores_total = Column(Integer, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    progress_updated_at = Column(DateTime, nullable=True)
+    # Custom window specs (see parse_report_window), added as columns after the standard ones
+    windows = Column(JSON, nullable=True)
+    # Collapsed stacks of a profiled run (trigger_report?profile=true)
+    profile_url = Column(String(500), nullable=True)
+    # Completed report the stores without new logs were copied from (incremental reports)
+    base_report_id = Column(String(100), nullable=True)
+
+# Per-store metrics of a report, in report column order
+REPORT_RESULT_METRICS = [
+    "uptime_last_hour",
+    "uptime_last_day",
+    "uptime_last_week",
+    "downtime_last_hour",
+    "downtime_last_day",
+    "downtime_last_week",
+]
+
+class ReportResult(Base):
+    __tablename__ = "report_results"
+    __table_args__ = (
+        UniqueConstraint("report_id", "store_id", name="uq_report_results_report_store"),
+        # Filtering and keyset pages on one metric of a report are range scans of its index
+        *(Index(f"ix_report_results_{metric}", "report_id", metric, "store_id") for metric in REPORT_RESULT_METRICS),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    report_id = Column(String(100), nullable=False)
+    store_id = Column(String(36), nullable=False)
+    uptime_last_hour = Column(Integer, nullable=False)
+    uptime_last_day = Column(Integer, nullable=False)
+    uptime_last_week = Column(Integer, nullable=False)
+    downtime_last_hour = Column(Integer, nullable=False)
+    downtime_last_day = Column(Integer, nullable=False)
+    downtime_last_week = Column(Integer, nullable=False)
+    # Custom window minutes (uptime_<name>/downtime_<name>), returned but not indexed
+    windows = Column(JSON, nullable=True)
+
+class StoreStatusHourlyRollup(Base):
+    __tablename__ = "store_status_hourly_rollups"
+    __table_args__ = (
+        UniqueConstraint("store_id", "local_date", "hour_start_utc", name="uq_rollup_store_day_hour"),
+        Index("ix_rollup_store_hour", "store_id", "hour_start_utc"),
+        # Retention expires rollups by local day
+        Index("ix_rollup_local_date", "local_date"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    store_id = Column(String(36), nullable=False)
+    # Local business day the minutes belong to (a UTC hour can straddle two)
+    local_date = Column(Date, nullable=False)
+    hour_start_utc = Column(DateTime, nullable=False)
+    # Microseconds, so sums over any number of rows are exact
+    active_us = Column(BigInteger, nullable=False, default=0)
+    inactive_us = Column(BigInteger, nullable=False, default=0)
+    business_us = Column(BigInteger, nullable=False, default=0)
+    last_status = Column(Enum(StoreStatus), nullable=True)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+class StoreStatusRollupState(Base):
+    __tablename__ = "store_status_rollup_state"
+
+    id = Column(Integer, primary_key=True)
+    # Highest store_status_logs.id already folded into the hourly rollups
+    last_log_id = Column(Integer, nullable=False, default=0)
+    # Store settings version (see get_settings_version) the rollups were last checked against
+    settings_version = Column(String(32), nullable=True)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+class StoreStatusRollupSettings(Base):
+    __tablename__ = "store_status_rollup_settings"
+
+    id = Column(Integer, primary_key=True)
+    store_id = Column(String(36), unique=True, nullable=False)
+    # Digest of the timezone and business hours the store's rollups were computed with
+    settings_key = Column(String(16), nullable=False)
+
+class DataLoadCheckpoint(Base):
+    __tablename__ = "data_load_checkpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String(255), unique=True, nullable=False)
+    # CSV data rows already committed, so an interrupted load resumes after them
+    rows_loaded = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,301 @@
+"""Generate a store report locally, without the API, Redis or a Celery worker.
+
+    python -m app.report --output reports/adhoc.csv --engine numpy --workers 8
+    python -m app.report --output reports/adhoc.parquet --from-dumps dumps --window yesterday=-1d
+    python -m app.report --output reports/audit.csv --as-of-from 2023-01-01 --as-of-to 2023-01-31 --step hour
+
+Stores are split into one shard per worker process (by crc32 of store_id, as for
+REPORT_SHARDS), each process computes its shard with the same code as report_generation
+and the partial files are merged into --output. Logs and store settings come from the
+configured database (DATABASE_URL), or with --from-dumps from store_status.csv,
+menu_hours.csv and timezones.csv in that directory.
+
+With --as-of-from/--as-of-to the report is a backfill instead: one row per store and as-of
+point (every --step between the two) with the hour, day and week before that point, from a
+single pass over each store's logs (see app.utils.backfill).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from app.core.metrics import ReportTimer
+from app.dump_csv import parse_menu_hours, parse_timezones
+from app.services.report_service import (
+    REPORT_ENGINES, build_store_settings, get_store_settings, get_versioned_store_settings, iter_backfill_results, iter_backfill_rows,
+    iter_report_results, iter_store_results, store_shard
+)
+from app.utils.backfill import BACKFILL_KEY_FIELDS, BACKFILL_LOOKBACK, BACKFILL_STEPS, as_of_points
+from app.utils.report import get_week_start, merge_report_files
+from app.utils.report_writer import REPORT_FORMATS, ReportWriter
+from app.utils.schedule import EPOCH
+from app.utils.store_logs import StoreLogs
+from app.utils.uptime_engine import to_epoch_us
+from app.utils.uptime_index import parse_report_windows, window_fields
+
+# Dump files read with --from-dumps
+STORE_STATUS_DUMP = "store_status.csv"
+MENU_HOURS_DUMP = "menu_hours.csv"
+TIMEZONES_DUMP = "timezones.csv"
+
+def get_report_format(output: str) -> str:
+    # Longest match first, so .csv.gz is not taken for .gz
+    for report_format in sorted(REPORT_FORMATS, key=len, reverse=True):
+        if output.endswith(f".{report_format}"):
+            return report_format
+    return "csv"
+
+def parse_as_of(value: str) -> datetime:
+    # ISO date or date and time, in UTC
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time {value!r}, expected e.g. 2023-01-01 or 2023-01-01T06:00")
+
+def init_database_worker():
+    from app.core.database import engine
+    # A forked worker must not reuse the parent's pooled connections
+    engine.dispose(close=False)
+
+def compute_database_shard(shard_path: str, engine: str, windows: list, shard_index: int = None, shard_count: int = 1, as_of: np.ndarray = None) -> dict:
+    from app.core.database import SessionLocal
+
+    timer = ReportTimer("backfill" if as_of is not None else engine)
+    db = SessionLocal()
+    try:
+        with timer.stage("settings_load"):
+            timezone, time_range_for_dayofweek = get_store_settings(db)
+        if as_of is not None:
+            rows = iter_backfill_results(db, timezone, time_range_for_dayofweek, as_of, shard_index, shard_count, timer)
+            with timer.consumer_stage("file_write", rows) as rows, ReportWriter(shard_path, "csv", key_fields=BACKFILL_KEY_FIELDS) as writer:
+                writer.write_rows(rows)
+            return shard_summary(timer)
+        results = iter_report_results(db, engine, timezone, time_range_for_dayofweek, shard_index, shard_count, timer, windows)
+        with timer.consumer_stage("file_write", results) as results, ReportWriter(shard_path, "csv", extra_fields=window_fields(windows)) as writer:
+            writer.write_many(results)
+    finally:
+        db.close()
+    return shard_summary(timer)
+
+def compute_dump_shard(shard_path: str, engine: str, windows: list, timezone: dict, time_range_for_dayofweek: dict,
+                       store_ids: List[str], offsets: np.ndarray, timestamps: np.ndarray, statuses: np.ndarray, as_of: np.ndarray = None) -> dict:
+    # Store i's logs (its week, or the backfill range) are timestamps[offsets[i]:offsets[i + 1]], oldest first
+    if as_of is not None:
+        timer = ReportTimer("backfill")
+        timer.stores_total = len(store_ids)
+        rows = iter_backfill_rows(iter_dump_store_logs(store_ids, offsets, timestamps, statuses), timezone, time_range_for_dayofweek, as_of, timer)
+        with timer.consumer_stage("file_write", rows) as rows, ReportWriter(shard_path, "csv", key_fields=BACKFILL_KEY_FIELDS) as writer:
+            writer.write_rows(rows)
+        return shard_summary(timer)
+
+    timer = ReportTimer(engine)
+    latest_log_times = {
+        store_id: EPOCH + timedelta(microseconds=int(timestamps[end - 1]))
+        for store_id, end in zip(store_ids, offsets[1:].tolist())
+    }
+    timer.stores_total = len(store_ids)
+    store_logs_stream = iter_dump_store_logs(store_ids, offsets, timestamps, statuses)
+    results = iter_store_results(store_logs_stream, engine, latest_log_times, timezone, time_range_for_dayofweek, timer, windows)
+    with timer.consumer_stage("file_write", results) as results, ReportWriter(shard_path, "csv", extra_fields=window_fields(windows)) as writer:
+        writer.write_many(results)
+    return shard_summary(timer)
+
+def iter_dump_store_logs(store_ids: List[str], offsets: np.ndarray, timestamps: np.ndarray, statuses: np.ndarray):
+    for store_id, start, end in zip(store_ids, offsets[:-1].tolist(), offsets[1:].tolist()):
+        yield store_id, StoreLogs(timestamps[start:end], statuses[start:end])
+
+def shard_summary(timer: ReportTimer) -> dict:
+    return {"stores": timer.stores, "log_rows": timer.log_rows, "seconds": dict(timer.seconds)}
+
+def load_dump_settings(dumps_dir: str) -> Tuple[dict, dict]:
+    timezones = parse_timezones(pd.read_csv(os.path.join(dumps_dir, TIMEZONES_DUMP), dtype=str))
+    menu_hours = parse_menu_hours(pd.read_csv(os.path.join(dumps_dir, MENU_HOURS_DUMP), dtype=str))
+    return build_store_settings(timezones.itertuples(index=False), menu_hours.itertuples(index=False))
+
+def load_dump_logs(dumps_dir: str, chunksize: int = 1_000_000) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    """Status logs of store_status.csv as arrays sorted by store, then time.
+
+    Returns the store ids, each log's store index, UTC epoch microseconds and statuses.
+    Store ids are kept once per store rather than once per log.
+    """
+    store_index = {}
+    store_codes, timestamps, statuses = [], [], []
+    for chunk in pd.read_csv(os.path.join(dumps_dir, STORE_STATUS_DUMP), dtype=str, chunksize=chunksize):
+        codes, uniques = pd.factorize(chunk["store_id"])
+        chunk_stores = np.array([store_index.setdefault(store_id, len(store_index)) for store_id in uniques], dtype=np.int32)
+        store_codes.append(chunk_stores[codes])
+        parsed = pd.to_datetime(chunk["timestamp_utc"].str.replace(" UTC", "", regex=False), format="ISO8601")
+        timestamps.append(parsed.to_numpy(dtype="datetime64[us]").astype(np.int64))
+        statuses.append((chunk["status"] == "active").to_numpy(dtype=np.uint8))
+
+    store_codes = np.concatenate(store_codes) if store_codes else np.empty(0, dtype=np.int32)
+    timestamps = np.concatenate(timestamps) if timestamps else np.empty(0, dtype=np.int64)
+    statuses = np.concatenate(statuses) if statuses else np.empty(0, dtype=np.uint8)
+    order = np.lexsort((timestamps, store_codes))
+    return list(store_index), store_codes[order], timestamps[order], statuses[order]
+
+def split_dump_logs(dumps_dir: str, timezone: dict, shard_count: int, as_of: np.ndarray = None) -> List[Dict]:
+    # Week window of every store with a timezone (or the logs a backfill over the as_of
+    # points reads), grouped by shard
+    store_ids, store_codes, timestamps, statuses = load_dump_logs(dumps_dir)
+    bounds = np.flatnonzero(np.diff(store_codes)) + 1
+    starts = np.concatenate([[0], bounds]) if len(store_codes) else np.empty(0, dtype=np.int64)
+    ends = np.concatenate([bounds, [len(store_codes)]]) if len(store_codes) else np.empty(0, dtype=np.int64)
+
+    shards = [{"store_ids": [], "slices": []} for _ in range(shard_count)]
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        store_id = store_ids[store_codes[start]]
+        if store_id not in timezone:
+            continue
+        if as_of is not None:
+            lower_us = int(as_of[0]) - BACKFILL_LOOKBACK // timedelta(microseconds=1)
+            end = start + int(np.searchsorted(timestamps[start:end], int(as_of[-1])))
+        else:
+            lower_us = to_epoch_us(get_week_start(EPOCH + timedelta(microseconds=int(timestamps[end - 1]))))
+        first = start + int(np.searchsorted(timestamps[start:end], lower_us))
+        if first == end:
+            continue
+        shard = shards[store_shard(store_id, shard_count)]
+        shard["store_ids"].append(store_id)
+        shard["slices"].append((first, end))
+
+    for shard in shards:
+        slices = shard.pop("slices")
+        if slices:
+            index = np.concatenate([np.arange(first, end) for first, end in slices])
+        else:
+            index = np.empty(0, dtype=np.int64)
+        shard["offsets"] = np.concatenate([[0], np.cumsum([end - first for first, end in slices], dtype=np.int64)]).astype(np.int64)
+        shard["timestamps"] = timestamps[index]
+        shard["statuses"] = statuses[index]
+    return shards
+
+def generate_report(output: str, engine: str = "numpy", workers: int = None, report_format: str = None,
+                    windows: list = None, dumps_dir: str = None, as_of: np.ndarray = None) -> dict:
+    """Compute a report across `workers` processes and write it to `output`.
+
+    With as_of (UTC epoch microseconds, see as_of_points) it is a backfill over those points
+    instead; the engine and windows do not apply to it.
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    report_format = report_format or get_report_format(output)
+    windows = windows or []
+    if as_of is not None:
+        if not len(as_of):
+            raise ValueError("A backfill needs at least one as-of point")
+        if windows:
+            raise ValueError("Custom windows are relative to the latest log and do not apply to a backfill")
+        engine = "backfill"
+    if dumps_dir and engine == "rollup":
+        raise ValueError("The rollup engine reads the hourly rollup table, use python or numpy with --from-dumps")
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="store_report_") as shard_dir:
+        shard_paths = [os.path.join(shard_dir, f"shard_{shard_index}_of_{workers}.csv") for shard_index in range(workers)]
+
+        if dumps_dir:
+            # Step 1: Read the dumps once here and hand each process only its shard's logs
+            timezone, time_range_for_dayofweek = load_dump_settings(dumps_dir)
+            shards = split_dump_logs(dumps_dir, timezone, workers, as_of)
+            print(f"Read {sum(len(shard['timestamps']) for shard in shards)} logs of {len(timezone)} stores from {dumps_dir} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            jobs = [
+                (compute_dump_shard, shard_path, engine, windows, timezone, time_range_for_dayofweek,
+                 shard["store_ids"], shard["offsets"], shard["timestamps"], shard["statuses"], as_of)
+                for shard_path, shard in zip(shard_paths, shards)
+            ]
+            initializer = None
+        elif workers == 1:
+            # One shard is the whole report, without filtering the log scan by store
+            jobs = [(compute_database_shard, shard_paths[0], engine, windows, None, 1, as_of)]
+            initializer = init_database_worker
+        else:
+            if engine == "rollup":
+                # Fold new logs once here, so the processes only read the rollup table
+                from app.core.config import settings
+                from app.core.database import SessionLocal
+                from app.utils.rollup import bring_rollups_current
+                db = SessionLocal()
+                try:
+                    settings_version, store_settings = get_versioned_store_settings(db)
+                    bring_rollups_current(db, *store_settings, settings.REPORT_BATCH_SIZE, settings.ROLLUP_MAX_LOGS_PER_RUN, settings_version)
+                finally:
+                    db.close()
+            jobs = [
+                (compute_database_shard, shard_path, engine, windows, shard_index, workers, as_of)
+                for shard_index, shard_path in enumerate(shard_paths)
+            ]
+            initializer = init_database_worker
+
+        # Step 2: Compute the shards in parallel
+        if workers == 1:
+            summaries = [job[0](*job[1:]) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=initializer) as executor:
+                summaries = [future.result() for future in [executor.submit(*job) for job in jobs]]
+
+        # Step 3: Merge the partial files into the report
+        key_fields = BACKFILL_KEY_FIELDS if as_of is not None else None
+        merge_report_files(shard_paths, output, report_format, window_fields(windows), key_fields=key_fields)
+
+    seconds = {}
+    for summary in summaries:
+        for stage, stage_seconds in summary["seconds"].items():
+            seconds[stage] = round(seconds.get(stage, 0.0) + stage_seconds, 3)
+    return {
+        "output": output,
+        "stores": sum(summary["stores"] for summary in summaries),
+        "log_rows": sum(summary["log_rows"] for summary in summaries),
+        "workers": workers,
+        "seconds": round(time.perf_counter() - started, 3),
+        # Summed over processes, so they can add up to more than the wall time
+        "stage_seconds": seconds,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a store report without the API, Redis or Celery")
+    parser.add_argument("--output", required=True, help="report file; the format follows the extension (.csv, .csv.gz, .parquet)")
+    parser.add_argument("--engine", choices=REPORT_ENGINES, default="numpy")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes, one store shard each")
+    parser.add_argument("--format", choices=REPORT_FORMATS, help="report format, overrides the output extension")
+    parser.add_argument("--window", action="append", default=[], help="custom window NAME=SPEC, e.g. yesterday=-1d (repeatable)")
+    parser.add_argument("--from-dumps", metavar="DUMPS_DIR", help=f"read {STORE_STATUS_DUMP}, {MENU_HOURS_DUMP} and {TIMEZONES_DUMP} instead of the database")
+    parser.add_argument("--as-of-from", type=parse_as_of, metavar="UTC_TIME", help="backfill: first as-of point, e.g. 2023-01-01 or 2023-01-01T06:00")
+    parser.add_argument("--as-of-to", type=parse_as_of, metavar="UTC_TIME", help="backfill: last as-of point (inclusive)")
+    parser.add_argument("--step", choices=BACKFILL_STEPS, default="hour", help="backfill: time between as-of points")
+    args = parser.parse_args()
+
+    if args.from_dumps and args.engine == "rollup":
+        parser.error("--from-dumps needs the python or numpy engine")
+    try:
+        windows = parse_report_windows(args.window)
+    except ValueError as e:
+        parser.error(str(e))
+
+    as_of = None
+    if args.as_of_from or args.as_of_to:
+        if not (args.as_of_from and args.as_of_to):
+            parser.error("a backfill needs both --as-of-from and --as-of-to")
+        if windows:
+            parser.error("--window does not apply to a backfill")
+        try:
+            as_of = as_of_points(args.as_of_from, args.as_of_to, args.step)
+        except ValueError as e:
+            parser.error(str(e))
+
+    try:
+        summary = generate_report(args.output, args.engine, args.workers, args.format, windows, args.from_dumps, as_of)
+    except Exception as e:
+        print(f"Error generating report: {e}", file=sys.stderr)
+        raise
+
+    print(f"Report generated successfully: {summary['output']} ({summary['stores']} stores, {summary['log_rows']} logs, "
+          f"{summary['workers']} workers, {summary['seconds']}s)")
+    print(f"Stage seconds: {summary['stage_seconds']}")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
 from .report_service import report_generation
+from .rollup_service import rollup_store_status
+from .retention_service import apply_store_status_retention
 
 __all__ = [
-    "report_generation"
+    "report_generation",
+    "rollup_store_status",
+    "apply_store_status_retention"
 ]
\ No newline at end of file
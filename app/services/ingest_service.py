@@ -0,0 +1,227 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.exc import DBAPIError, DisconnectionError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from app.core.config import settings
+from app.core.database import engine, insert_ignore
+from app.models import StoreStatusLog, StoreStatus
+logger = logging.getLogger(__name__)
+
+STATUSES = {status.value: status for status in StoreStatus}
+
+# Polls before the engines' epoch or past what a DATETIME column holds are rejected up
+# front, so the database never refuses a buffered row for its timestamp
+MIN_TIMESTAMP = datetime(1970, 1, 1)
+MAX_TIMESTAMP = datetime(9999, 12, 31, 23, 59, 59)
+
+# Lost connections, pool timeouts and lock waits pass; a row the database rejects does not
+TRANSIENT_ERRORS = (OperationalError, InterfaceError, DisconnectionError, PoolTimeoutError)
+
+class BufferFullError(Exception):
+    pass
+
+def is_transient_error(error: Exception) -> bool:
+    return isinstance(error, TRANSIENT_ERRORS) or (isinstance(error, DBAPIError) and error.connection_invalidated)
+
+def parse_timestamp(value: str) -> datetime:
+    # Accept the dump format ("2023-01-24 09:06:42.605777 UTC") as well as ISO 8601
+    if value.endswith(" UTC"):
+        value = value[:-4]
+    elif value.endswith("Z"):
+        value = value[:-1]
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def parse_status_logs(body: bytes, content_type: str = "") -> Tuple[List[Dict], List[Dict]]:
+    """Parse an NDJSON or JSON-array batch of status polls.
+
+    Returns (rows ready for insert, errors) where each error names the offending line/index.
+    """
+    text = body.decode("utf-8").strip()
+    if not text:
+        return [], []
+
+    if text.startswith("[") and "ndjson" not in content_type:
+        items = json.loads(text)
+    else:
+        items = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append(ValueError(f"invalid JSON: {e}"))
+
+    rows, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, Exception):
+                raise item
+            if not isinstance(item, dict):
+                raise ValueError("expected an object")
+            store_id = item.get("store_id")
+            if not isinstance(store_id, str) or not store_id or len(store_id) > 36:
+                raise ValueError("store_id must be a non-empty string of at most 36 characters")
+            status = STATUSES.get(item.get("status"))
+            if status is None:
+                raise ValueError("status must be 'active' or 'inactive'")
+            timestamp = item.get("timestamp_utc")
+            if not isinstance(timestamp, str):
+                raise ValueError("timestamp_utc must be a string")
+            timestamp_utc = parse_timestamp(timestamp)
+            if not MIN_TIMESTAMP <= timestamp_utc <= MAX_TIMESTAMP:
+                raise ValueError(f"timestamp_utc must be between {MIN_TIMESTAMP.isoformat()} and {MAX_TIMESTAMP.isoformat()}")
+            rows.append({
+                "store_id": store_id,
+                "timestamp_utc": timestamp_utc,
+                "status": status,
+            })
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+    return rows, errors
+
+class StatusLogBuffer:
+    """In-process buffer for status polls, flushed with bulk inserts.
+
+    Rows are flushed by a background thread once flush_size rows are waiting or the oldest
+    row has waited flush_interval seconds. add() raises BufferFullError instead of blocking
+    when max_rows are already waiting, so callers can apply backpressure. A poll whose
+    (store_id, timestamp_utc) is already stored is skipped by the database's unique index,
+    so resent batches are harmless whichever process buffered them.
+    """
+
+    def __init__(self, max_rows: int, flush_size: int, flush_interval: float, bind=None):
+        self.max_rows = max_rows
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.bind = bind if bind is not None else engine
+        self._rows: List[Dict] = []
+        self._in_flight = 0
+        self._oldest: Optional[float] = None
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.rows_flushed = 0
+        # Polls the unique index skipped as already stored, and polls the database rejected
+        self.rows_skipped = 0
+        self.rows_rejected = 0
+
+    def __len__(self):
+        with self._condition:
+            return len(self._rows) + self._in_flight
+
+    def start(self):
+        with self._condition:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="status-log-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        # Whatever arrived after the last flush
+        self.flush()
+
+    def add(self, rows: List[Dict]) -> int:
+        with self._condition:
+            if len(self._rows) + self._in_flight + len(rows) > self.max_rows:
+                raise BufferFullError(f"status log buffer is full ({self.max_rows} rows)")
+            if not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            if len(self._rows) >= self.flush_size:
+                self._condition.notify_all()
+            return len(self._rows)
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._condition:
+                rows, self._rows = self._rows, []
+                self._oldest = None
+                self._in_flight = len(rows)
+            if not rows:
+                return 0
+            try:
+                inserted, rejected = self._insert_isolating(rows)
+                self.rows_flushed += len(rows)
+                self.rows_skipped += len(rows) - inserted - rejected
+                self.rows_rejected += rejected
+                return len(rows)
+            except Exception as e:
+                logger.error(f"Error flushing {len(rows)} status logs: {str(e)}")
+                # Only transient errors get here; keep the rows for the next attempt, which
+                # skips the ones a split batch already stored
+                with self._condition:
+                    self._rows[:0] = rows
+                    self._oldest = self._oldest or time.monotonic()
+                raise
+            finally:
+                with self._condition:
+                    self._in_flight = 0
+
+    def _insert(self, rows: List[Dict]) -> int:
+        inserted = 0
+        with self.bind.begin() as connection:
+            for start in range(0, len(rows), self.flush_size):
+                inserted += connection.execute(insert_ignore(StoreStatusLog.__table__), rows[start:start + self.flush_size]).rowcount
+        return inserted
+
+    def _insert_isolating(self, rows: List[Dict]) -> Tuple[int, int]:
+        """Insert rows, splitting a batch the database rejects until the rejected rows are alone.
+
+        Returns (rows inserted, rows dropped). Rejected rows are logged and dropped, so one bad
+        row cannot hold back the buffer; transient errors are raised for the caller to retry.
+        """
+        try:
+            return self._insert(rows), 0
+        except Exception as e:
+            if is_transient_error(e):
+                raise
+            if len(rows) == 1:
+                logger.error(f"Dropping status log rejected by the database: {rows[0]}: {str(e)}")
+                return 0, 1
+        middle = len(rows) // 2
+        first_inserted, first_rejected = self._insert_isolating(rows[:middle])
+        second_inserted, second_rejected = self._insert_isolating(rows[middle:])
+        return first_inserted + second_inserted, first_rejected + second_rejected
+
+    def _due(self) -> bool:
+        if not self._rows:
+            return False
+        return len(self._rows) >= self.flush_size or time.monotonic() - self._oldest >= self.flush_interval
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopping and not self._due():
+                    timeout = self.flush_interval
+                    if self._oldest is not None:
+                        timeout = max(0.0, self._oldest + self.flush_interval - time.monotonic())
+                    self._condition.wait(timeout)
+                if self._stopping:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                # Back off before retrying an unreachable database
+                time.sleep(self.flush_interval)
+
+status_log_buffer = StatusLogBuffer(
+    max_rows=settings.INGEST_BUFFER_MAX_ROWS,
+    flush_size=settings.INGEST_FLUSH_ROWS,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL_SECONDS,
+)
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Set
+from app.core.config import settings
+logger = logging.getLogger(__name__)
+
+REPORT_STATUS_CHANNEL = "report_status"
+
+def is_redis_url(url: Optional[str]) -> bool:
+    return bool(url) and url.startswith(("redis://", "rediss://", "unix://"))
+
+class ReportStatusHub:
+    """Report status changes, published by report tasks and awaited by API requests.
+
+    Tasks publish to a Redis channel. Each API process holds a single subscription to it
+    and wakes the requests of that process waiting on the report, so a waiting client costs
+    one open connection and no database polling. Without a Redis REDIS_URL (tests, eager
+    Celery) publish() delivers to the waiters of the current process instead. Delivery is
+    best effort: waiters re-read the report after a timeout either way.
+    """
+
+    def __init__(self, redis_url: Optional[str]):
+        self.redis_url = redis_url if is_redis_url(redis_url) else None
+        self._waiters: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._loop = None
+        self._listener = None
+        self._publisher = None
+        self._publisher_lock = threading.Lock()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        if self.redis_url and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self):
+        import redis.asyncio as aioredis
+
+        while True:
+            try:
+                async with aioredis.from_url(self.redis_url) as client, client.pubsub() as pubsub:
+                    await pubsub.subscribe(REPORT_STATUS_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._deliver(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Waiters fall back to their timeout until the subscription is back
+                logger.warning(f"Report status subscription failed, reconnecting: {str(e)}")
+                await asyncio.sleep(1)
+
+    def _deliver(self, event: dict):
+        for queue in list(self._waiters.get(event.get("report_id"), ())):
+            queue.put_nowait(event)
+
+    @contextmanager
+    def subscribe(self, report_id: str) -> Iterator[asyncio.Queue]:
+        # Subscribe before reading the report, so a change in between is not missed
+        queue = asyncio.Queue()
+        self._waiters[report_id].add(queue)
+        try:
+            yield queue
+        finally:
+            self._waiters[report_id].discard(queue)
+            if not self._waiters[report_id]:
+                del self._waiters[report_id]
+
+    def waiting(self) -> int:
+        return sum(len(queues) for queues in self._waiters.values())
+
+    def _get_publisher(self):
+        with self._publisher_lock:
+            if self._publisher is None:
+                import redis
+                self._publisher = redis.Redis.from_url(self.redis_url)
+            return self._publisher
+
+    def publish(self, report_id: str, status: str):
+        event = {"report_id": report_id, "status": status}
+        if self.redis_url:
+            try:
+                self._get_publisher().publish(REPORT_STATUS_CHANNEL, json.dumps(event))
+            except Exception as e:
+                logger.warning(f"Could not publish status of report {report_id}: {str(e)}")
+            return
+
+        if self._loop is None or self._loop.is_closed():
+            return
+        # Eager tasks run in the API's threadpool, off the event loop
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._deliver(event)
+        else:
+            self._loop.call_soon_threadsafe(self._deliver, event)
+
+report_status_hub = ReportStatusHub(settings.REDIS_URL)
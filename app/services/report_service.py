@@ -1,20 +1,470 @@
 from fastapi import  HTTPException
-from datetime import datetime
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Set, Tuple
 import logging
+import numpy as np
 import pytz
-from app.models import Report, StoreStatusLog, BusinessHours, StoreTimezone, ReportStatus 
-from datetime import datetime
+from app.models import Report, StoreStatus, StoreStatusLog, BusinessHours, StoreTimezone, ReportStatus 
+from itertools import islice
 import os
-from celery import shared_task
+import time
+import zlib
+from sqlalchemy import func
+from celery import chord
 from celery_app import celery_app
-from app.utils import get_uptime_downtime_for_store,get_store_logs_within_week,generate_report_for_all_stores,convert_to_local_time,is_within_business_hours
+from app.utils import get_uptime_downtime_for_store,generate_report_for_all_stores,get_latest_log_times,stream_store_logs,stream_store_logs_within_week,get_report_shard_path,merge_report_shard_files,read_report_results
+from app.utils.uptime_engine import UptimeBatch
+from app.utils.backfill import BACKFILL_LOOKBACK, compute_backfill_rows
+from app.utils.report_writer import ReportWriter
+from app.utils.schedule import DEFAULT_HOURS, EPOCH, US_PER_DAY, compile_schedule, compile_week
+from app.utils.store_logs import StoreLogs
+from app.utils.rollup import bring_rollups_current, compute_rollup_results
+from app.utils.profiler import get_profile_path, get_shard_profile_path, merge_collapsed_stacks, sample_profile
+from app.utils.progress import ReportProgress, start_report_progress
+from app.utils.cache import TTLCache
+from app.utils.uptime_index import UptimeIndex, compute_window_results, parse_report_windows, window_fields
+from app.utils.report_results import save_report_results, tee_report_results
+from app.utils.storage import report_file_exists
+from app.utils.watermark import format_data_watermark, get_changed_store_ids, get_settings_version, get_truncated_store_ids, parse_data_watermark
 from app.core.database import SessionLocal
+from app.core.db_utils import get_db_session
+from app.core.config import settings
+from app.core.metrics import ReportTimer, track_report_job
+from app.services.notification_service import report_status_hub
 logger = logging.getLogger(__name__)
 
+def compute_store_result(store_id: str, store_logs: StoreLogs, last_store_log_time: datetime, store_timezone: str, time_range: dict, timer: ReportTimer = None) -> dict:
+    timer = timer or ReportTimer("python")
+    with timer.stage("timezone_conversion"):
+        store_data = group_logs_by_local_day(store_id, store_logs, store_timezone, time_range)
+
+    with timer.stage("computation"):
+        return compute_store_uptime(store_id, store_data, last_store_log_time, store_timezone, time_range)
+
+def group_logs_by_local_day(store_id: str, store_logs: StoreLogs, store_timezone: str, time_range: dict) -> dict:
+    store_data = {}
+    store_tz = pytz.timezone(store_timezone)
+
+    try:
+        # Business-hour membership of every log with one binary search over the store's
+        # compiled UTC windows, instead of re-localizing its day's hours per log
+        timestamps = store_logs.timestamps
+        first_day = int(timestamps[0] // US_PER_DAY) - 1 if len(timestamps) else 0
+        last_day = int(timestamps[-1] // US_PER_DAY) + 1 if len(timestamps) else -1
+        schedule = compile_schedule(time_range, store_timezone, first_day, last_day)
+        window_index = schedule.window_index(timestamps)
+    except Exception as e:
+        logger.error(f"Error processing logs for store {store_id}: {str(e)}")
+        raise e
+
+    # Only logs inside business hours are converted to local datetimes
+    inside = np.flatnonzero(window_index >= 0)
+    for timestamp_us, active in zip(timestamps[inside].tolist(), store_logs.statuses[inside].tolist()):
+        try:
+            # Convert timestamp to local time
+            timestamp_in_local = pytz.utc.localize(EPOCH + timedelta(microseconds=timestamp_us)).astimezone(store_tz)
+            date = timestamp_in_local.strftime("%Y-%m-%d")
+
+            if date not in store_data:
+                store_data[date] = []
+
+            store_data[date].append({
+                "timestamp": timestamp_in_local,
+                "status": StoreStatus.active if active else StoreStatus.inactive
+            })
+
+        except Exception as e:
+            logger.error(f"Error processing log for store {store_id}: {str(e)}")
+            raise e
+
+    return store_data
+
+def compute_store_uptime(store_id: str, store_data: dict, last_store_log_time: datetime, store_timezone: str, time_range: dict) -> dict:
+    # Get the end time for the last log of the day
+    last_log_day = last_store_log_time.weekday()
+    last_day_hours = time_range.get(last_log_day, {
+        "end_time": "23:59:59"
+    })
+    last_date_str = last_store_log_time.strftime("%Y-%m-%d")
+    end_time_str = f"{last_date_str} {last_day_hours['end_time']}"
+    # Create datetime with timezone
+    store_tz = pytz.timezone(store_timezone)
+    last_date = store_tz.localize(datetime.strptime(end_time_str, "%Y-%m-%d %H:%M:%S"))
+
+    return get_uptime_downtime_for_store(store_data, time_range, last_date, store_timezone, store_id)
+
+REPORT_ENGINES = ("python", "numpy", "rollup")
+
+def load_store_settings(db):
+    """Timezone and business hours of every store, keyed by store_id.
+
+    Only the needed columns are read, and stores with the same timezone or the same weekly
+    hours share one dict, so memory grows with the number of distinct schedules rather than
+    with the number of stores. The returned dicts are shared and must not be modified.
+    """
+    # Fetch all stores and their timezones
+    stores = db.query(StoreTimezone.store_id, StoreTimezone.timezone_str).yield_per(10000)
+    business_hours = db.query(
+        BusinessHours.store_id, BusinessHours.day_of_week, BusinessHours.start_time_local, BusinessHours.end_time_local
+    ).order_by(BusinessHours.id).yield_per(10000)
+    return build_store_settings(stores, business_hours)
+
+def build_store_settings(stores: Iterable[Tuple], business_hours: Iterable[Tuple]):
+    # (store_id, timezone_str) and (store_id, day_of_week, start_time, end_time) rows, from
+    # the database or the CSV dumps, into the dicts described in load_store_settings
+    timezone = {}
+    shared_timezones = {}
+
+    # Step 1: Initialize store_data with timezone and validate timezone
+    for store_id, timezone_str in stores:
+        if timezone_str not in shared_timezones:
+            try:
+                # Validate timezone
+                pytz.timezone(timezone_str)
+                shared_timezones[timezone_str] = {"timeZone": timezone_str}
+            except pytz.exceptions.UnknownTimeZoneError:
+                # Use America/Chicago as fallback
+                shared_timezones[timezone_str] = {"timeZone": "America/Chicago"}
+        if shared_timezones[timezone_str]["timeZone"] != timezone_str:
+            logger.warning(f"Invalid timezone {timezone_str} for store {store_id}")
+        timezone[store_id] = shared_timezones[timezone_str]
+
+    if not timezone:
+        raise HTTPException(status_code=404, detail="No stores found")
+
+    # Step 2: Get the time range for each day of week
+    store_hours = {}
+    for store_id, dayofweek, start_time, end_time in business_hours:
+        store_hours.setdefault(store_id, {})[dayofweek] = (start_time, end_time)
+
+    if not store_hours:
+        raise HTTPException(status_code=404, detail="No business hours found")
+
+    # Step 3: Build (or reuse) the weekly time range of each store; stores without hours are
+    # open all day, stores with hours but no timezone keep only the days they have
+    time_range_for_dayofweek = {}
+    shared_days = {}
+    shared_weeks = {}
+    for store_id in [*timezone, *(store_id for store_id in store_hours if store_id not in timezone)]:
+        hours = store_hours.get(store_id, {})
+        days = range(7) if store_id in timezone else sorted(hours)
+        week_key = tuple((dayofweek, hours.get(dayofweek)) for dayofweek in days)
+        if week_key not in shared_weeks:
+            week = {}
+            for dayofweek, day_hours in week_key:
+                if day_hours is None:
+                    week[dayofweek] = DEFAULT_HOURS
+                    continue
+                if day_hours not in shared_days:
+                    shared_days[day_hours] = {
+                        "start_time": day_hours[0],
+                        "end_time": day_hours[1]
+                    }
+                week[dayofweek] = shared_days[day_hours]
+            shared_weeks[week_key] = week
+        time_range_for_dayofweek[store_id] = shared_weeks[week_key]
+
+    return timezone, time_range_for_dayofweek
+
+# Store settings of this worker process by settings version, reused by its later tasks (see get_store_settings)
+store_settings_cache = TTLCache(1, settings.STORE_SETTINGS_CACHE_TTL_SECONDS)
+
+# Attempts at reading the settings while no edit lands between the version and the rows
+STORE_SETTINGS_LOAD_ATTEMPTS = 3
+
+class StoreSettingsChanged(Exception):
+    """The store settings are no longer the version a report was started with."""
+
+def get_versioned_store_settings(db) -> Tuple[str, Tuple[dict, dict]]:
+    """(settings version, load_store_settings) reused across the tasks of a worker process.
+
+    The cache is keyed on get_settings_version, which every insert, delete and edit of
+    the settings tables moves, so cached settings are never used for another version.
+    The version is read again after loading, and the load repeated if an edit came in
+    between, so the settings returned are exactly the version returned.
+    """
+    for _ in range(STORE_SETTINGS_LOAD_ATTEMPTS):
+        settings_version = get_settings_version(db)
+        store_settings = store_settings_cache.get(settings_version)
+        if store_settings is not None:
+            return settings_version, store_settings
+        store_settings = load_store_settings(db)
+        if get_settings_version(db) == settings_version:
+            store_settings_cache.set(settings_version, store_settings)
+            return settings_version, store_settings
+    raise StoreSettingsChanged(f"Store settings changed during each of {STORE_SETTINGS_LOAD_ATTEMPTS} loads")
+
+def get_store_settings(db):
+    # load_store_settings of the current settings version, see get_versioned_store_settings
+    return get_versioned_store_settings(db)[1]
+
+def preload_worker_caches():
+    """Warm what report tasks reuse within a worker process before the first task arrives.
+
+    Opens a pooled database connection, loads the store settings and compiles every
+    distinct (timezone, business hours) schedule over the week before the newest log.
+    """
+    started = time.perf_counter()
+    with get_db_session() as db:
+        timezone, time_range_for_dayofweek = get_store_settings(db)
+        latest_log_time = db.query(func.max(StoreStatusLog.timestamp_utc)).scalar()
+
+    schedules = {}
+    for store_id, store_timezone in timezone.items():
+        time_range = time_range_for_dayofweek.get(store_id, {})
+        # Shared settings dicts make id() a cheap identity of the store's hours
+        schedules[(store_timezone["timeZone"], id(time_range))] = time_range
+    if latest_log_time is not None:
+        last_day = (latest_log_time - EPOCH).days + 1
+        # Two weeks per schedule; beyond the compiled week cache the preload would evict itself
+        for (timezone_str, _), time_range in islice(schedules.items(), compile_week.cache_info().maxsize // 2):
+            pytz.timezone(timezone_str)
+            compile_schedule(time_range, timezone_str, last_day - 9, last_day)
+    logger.info(f"Preloaded settings of {len(timezone)} stores and {len(schedules)} schedules in {time.perf_counter() - started:.2f}s")
+
+def load_single_store_settings(db, store_id: str):
+    # Same defaults and fallbacks as load_store_settings, for one store
+    store = db.query(StoreTimezone).filter(StoreTimezone.store_id == store_id).first()
+    if not store:
+        return None, None
+
+    try:
+        pytz.timezone(store.timezone_str)
+        timezone_str = store.timezone_str
+    except pytz.exceptions.UnknownTimeZoneError:
+        logger.warning(f"Invalid timezone {store.timezone_str} for store {store.store_id}")
+        timezone_str = "America/Chicago"
+
+    time_range = {
+        dayofweek: {
+            "start_time": "00:00:00",
+            "end_time": "23:59:59"
+        }
+        for dayofweek in range(7)
+    }
+    for business_hour in db.query(BusinessHours).filter(BusinessHours.store_id == store_id).order_by(BusinessHours.id):
+        time_range[business_hour.day_of_week] = {
+            "start_time": business_hour.start_time_local,
+            "end_time": business_hour.end_time_local
+        }
+
+    return timezone_str, time_range
+
+def store_shard(store_id: str, shard_count: int) -> int:
+    # crc32 rather than hash() so every worker process agrees on the shard
+    return zlib.crc32(store_id.encode("utf-8")) % shard_count
+
+# Completed reports looked at for the base of an incremental report, newest first
+INCREMENTAL_BASE_CANDIDATES = 10
+
+class IncrementalBase(NamedTuple):
+    """Results of a completed report, and the stores with logs ingested after its watermark."""
+    report_id: str
+    results: Dict[str, dict]
+    changed_store_ids: Set[str]
+
+def find_base_report(db, report) -> Optional[Report]:
+    """Newest completed report whose unchanged stores an incremental run of `report` can copy.
+
+    A store's result only depends on its own settings and the logs of its week window, so it
+    can be copied unless the store got new logs or lost logs of that window to retention
+    (see load_incremental_base). Changed business hours or timezones are not tracked per
+    store: the report is then computed in full. The base also needs the same custom windows
+    and its file still in storage.
+    """
+    current = parse_data_watermark(report.watermark)
+    if current is None:
+        return None
+
+    candidates = db.query(Report).filter(
+        Report.status == ReportStatus.completed,
+        Report.report_id != report.report_id,
+        Report.watermark.isnot(None)
+    ).order_by(Report.completed_at.desc(), Report.id.desc()).limit(INCREMENTAL_BASE_CANDIDATES).all()
+    for candidate in candidates:
+        previous = parse_data_watermark(candidate.watermark)
+        if previous is None or (candidate.windows or None) != (report.windows or None):
+            continue
+        if previous.settings_version != current.settings_version or previous.min_log_id > current.min_log_id or previous.max_log_id > current.max_log_id:
+            continue
+        if not report_file_exists(candidate.url):
+            continue
+        return candidate
+    return None
+
+def load_incremental_base(db, base_report: Report, windows: list, shard_index: int = None, shard_count: int = 1) -> Optional[IncrementalBase]:
+    # None when the base cannot be read; every store is computed then, which gives the same report
+    try:
+        results = read_report_results(base_report.url, base_report.format or "csv", window_fields(windows))
+        changed_store_ids = get_changed_store_ids(db, parse_data_watermark(base_report.watermark).max_log_id)
+        # Retention runs by timestamp, so expired logs need not move the watermark's min id
+        changed_store_ids |= get_truncated_store_ids(db, set(results) - changed_store_ids)
+    except Exception as e:
+        logger.warning(f"Could not copy stores from report {base_report.report_id}, computing every store: {str(e)}")
+        return None
+    if shard_index is not None:
+        results = {store_id: result for store_id, result in results.items() if store_shard(store_id, shard_count) == shard_index}
+    return IncrementalBase(base_report.report_id, results, changed_store_ids)
+
+def iter_report_results(db, engine: str, timezone: dict, time_range_for_dayofweek: dict, shard_index: int = None, shard_count: int = 1, timer: ReportTimer = None, windows: list = None, incremental: IncrementalBase = None, settings_version: str = None):
+    # Yields store results as they are computed, so writers never hold the whole report.
+    # Custom windows (ReportWindow) add uptime_<name>/downtime_<name> minutes to each result.
+    # With incremental only the stores with new logs are computed, the others are copied.
+    timer = timer or ReportTimer(engine)
+    if windows and engine == "rollup":
+        # Custom windows are answered from the raw logs, which the rollup engine never reads
+        logger.info("Custom report windows need raw logs, using the numpy engine instead of rollup")
+        engine = "numpy"
+
+    # Step 3: Get the latest log time of every store (of this shard) with one grouped query
+    with timer.stage("log_fetch"):
+        latest_log_times = {
+            store_id: last_store_log_time
+            for store_id, last_store_log_time in get_latest_log_times(db, incremental.changed_store_ids if incremental else None).items()
+            if store_id in timezone and (shard_index is None or store_shard(store_id, shard_count) == shard_index)
+        }
+    copied = []
+    if incremental:
+        copied = [
+            result for store_id, result in incremental.results.items()
+            if store_id not in latest_log_times and store_id not in incremental.changed_store_ids and store_id in timezone
+        ]
+    timer.stores_total += len(latest_log_times) + len(copied)
+    if copied:
+        timer.stores += len(copied)
+        timer.stores_reused += len(copied)
+        yield from copied
+    restrict_to_stores = shard_index is not None or incremental is not None
+
+    if engine == "rollup":
+        # Fold any logs not yet rolled up, then read stores x 168 hourly rows instead of raw logs
+        with timer.stage("rollup_refresh"):
+            bring_rollups_current(db, timezone, time_range_for_dayofweek, settings.REPORT_BATCH_SIZE, settings.ROLLUP_MAX_LOGS_PER_RUN, settings_version)
+        with timer.stage("computation"):
+            results = compute_rollup_results(db, latest_log_times, timezone, time_range_for_dayofweek, restrict_to_stores=restrict_to_stores)
+        timer.stores += len(results)
+        yield from results
+        return
+
+    # Step 4: Stream the week window of all stores in one ordered scan and
+    # compute each store as soon as its run of logs is complete. The numpy
+    # engine computes stores in batches of REPORT_BATCH_SIZE instead.
+    store_logs_stream = stream_store_logs_within_week(db, latest_log_times, restrict_to_stores=restrict_to_stores)
+    yield from iter_store_results(store_logs_stream, engine, latest_log_times, timezone, time_range_for_dayofweek, timer, windows)
+
+def iter_store_results(store_logs_stream: Iterator[Tuple[str, StoreLogs]], engine: str, latest_log_times: Dict[str, datetime], timezone: dict, time_range_for_dayofweek: dict, timer: ReportTimer, windows: list = None):
+    # Results of the python and numpy engines from (store_id, StoreLogs) of each store's week,
+    # wherever the logs come from (the database or the CSV dumps)
+    batch = UptimeBatch()
+    window_results = {}
+    for store_id, store_logs in timer.iterate("log_fetch", store_logs_stream):
+        timer.log_rows += len(store_logs)
+        try:
+            if windows:
+                with timer.stage("window_index"):
+                    index = UptimeIndex.build(store_logs, timezone[store_id]["timeZone"], time_range_for_dayofweek[store_id])
+                    window_results[store_id] = compute_window_results(index, windows, latest_log_times[store_id], timezone[store_id]["timeZone"])
+
+            if engine == "numpy":
+                with timer.stage("timezone_conversion"):
+                    batch.add_store(store_id, store_logs, latest_log_times[store_id], timezone[store_id]["timeZone"], time_range_for_dayofweek[store_id])
+                if len(batch) >= settings.REPORT_BATCH_SIZE:
+                    with timer.stage("computation"):
+                        results = batch.compute()
+                    timer.stores += len(results)
+                    yield from attach_window_results(results, window_results)
+                    batch = UptimeBatch()
+            else:
+                result = compute_store_result(store_id, store_logs, latest_log_times[store_id], timezone[store_id]["timeZone"], time_range_for_dayofweek[store_id], timer)
+                timer.stores += 1
+                yield from attach_window_results([result], window_results)
+        
+        except Exception as e:
+            logger.error(f"Error processing store {store_id}: {str(e)}")
+            raise e
+
+    with timer.stage("computation"):
+        results = batch.compute()
+    timer.stores += len(results)
+    yield from attach_window_results(results, window_results)
+
+def attach_window_results(results: list, window_results: dict) -> list:
+    # Custom window minutes wait here until their store's result is computed
+    for result in results:
+        result.update(window_results.pop(result["store_id"], {}))
+    return results
+
+def iter_backfill_results(db, timezone: dict, time_range_for_dayofweek: dict, as_of_us: np.ndarray, shard_index: int = None, shard_count: int = 1, timer: ReportTimer = None):
+    # Backfill rows of every store (of this shard) at each as-of point, from one ordered
+    # scan of the logs between the first point's lookback and the last point
+    timer = timer or ReportTimer("backfill")
+    lower_bound = EPOCH + timedelta(microseconds=int(as_of_us[0])) - BACKFILL_LOOKBACK
+    upper_bound = EPOCH + timedelta(microseconds=int(as_of_us[-1]))
+    store_ids = [
+        store_id for store_id in timezone
+        if shard_index is None or store_shard(store_id, shard_count) == shard_index
+    ]
+    timer.stores_total += len(store_ids)
+    store_logs_stream = stream_store_logs(
+        db,
+        dict.fromkeys(store_ids, lower_bound),
+        restrict_to_stores=shard_index is not None,
+        upper_bounds=dict.fromkeys(store_ids, upper_bound),
+    )
+    yield from iter_backfill_rows(store_logs_stream, timezone, time_range_for_dayofweek, as_of_us, timer)
+
+def iter_backfill_rows(store_logs_stream: Iterator[Tuple[str, StoreLogs]], timezone: dict, time_range_for_dayofweek: dict, as_of_us: np.ndarray, timer: ReportTimer):
+    for store_id, store_logs in timer.iterate("log_fetch", store_logs_stream):
+        timer.log_rows += len(store_logs)
+        try:
+            with timer.stage("computation"):
+                rows = list(compute_backfill_rows(store_id, store_logs, timezone[store_id]["timeZone"], time_range_for_dayofweek[store_id], as_of_us))
+        except Exception as e:
+            logger.error(f"Error backfilling store {store_id}: {str(e)}")
+            raise e
+        timer.stores += 1
+        yield from rows
+
+def notify_report_status(report_id: str, status: ReportStatus):
+    # Wakes API requests waiting on the report (long-poll and SSE), after the commit they re-read
+    report_status_hub.publish(report_id, status.value)
+
+def complete_report(db, report, file_url):
+    if(file_url):
+        report.status = ReportStatus.completed
+        report.completed_at = datetime.now()
+        report.url = file_url
+        db.commit()
+        db.refresh(report)
+    else:
+        report.status = ReportStatus.failed
+        # A failed report is never reused
+        report.dedup_key = None
+        db.commit()
+        db.refresh(report)
+    notify_report_status(report.report_id, report.status)
+
+def restamp_settings_version(db, report, settings_version: str):
+    # The settings were edited after the report was triggered and it is computed from the newer
+    # version: its watermark says so, and it is no longer reused for the key of the older one
+    logger.warning(f"Store settings of report {report.report_id} changed since it was triggered, computing from version {settings_version}")
+    watermark = parse_data_watermark(report.watermark)
+    report.watermark = format_data_watermark(watermark.min_log_id, watermark.max_log_id, settings_version)
+    report.dedup_key = None
+    db.commit()
+
 @celery_app.task(name='report_generation')
-def report_generation(report_id: str):
+def report_generation(report_id: str, engine: str = None, shards: int = None, profile: bool = False, incremental: bool = False, settings_version: str = None):
+    # With incremental the stores without logs since the base report's watermark (see
+    # find_base_report) are copied from it; without a usable base every store is computed.
+    # settings_version is the one the report's watermark claims (read from it by default);
+    # the report is computed from exactly the settings version its watermark ends up with.
     try:
-      
+        engine = engine or settings.REPORT_ENGINE
+        if engine not in REPORT_ENGINES:
+            raise ValueError(f"Unknown report engine {engine}, expected one of {REPORT_ENGINES}")
+        shards = shards or settings.REPORT_SHARDS
         
         db = SessionLocal()
         
@@ -22,132 +472,163 @@ def report_generation(report_id: str):
         report = db.query(Report).filter(Report.report_id == report_id).first()
         if not report:
             raise Exception(f"Report with ID {report_id} not found")
+
+        # Without a watermark (older layout) there is no version to check the settings against
+        watermark = parse_data_watermark(report.watermark)
+        settings_version = (settings_version or watermark.settings_version) if watermark else None
+        if settings_version:
+            current_version = get_settings_version(db)
+            if current_version != settings_version:
+                restamp_settings_version(db, report, current_version)
+                settings_version = current_version
             
-        logger.info(f"Starting report generation for report_id: {report_id}")
-        
-        # Fetch all stores and their timezones
-        stores = db.query(StoreTimezone).all()
-        business_hours = db.query(BusinessHours).all()
-
-        if not stores:
-            raise HTTPException(status_code=404, detail="No stores found")
-        if not business_hours:
-            raise HTTPException(status_code=404, detail="No business hours found")
-
-        timezone = {}
-        store_data = {}
-        time_range_for_dayofweek = {}
-        result = []
-        
-        # Step 1: Initialize store_data with timezone and validate timezone
-        for store in stores:
-            try:
-                # Validate timezone
-                store_tz = pytz.timezone(store.timezone_str)
-                timezone[store.store_id] = {
-                    "timeZone": store.timezone_str
-                }
-            except pytz.exceptions.UnknownTimeZoneError:
-                logger.warning(f"Invalid timezone {store.timezone_str} for store {store.store_id}")
-                # Use America/Chicago as fallback
-                timezone[store.store_id] = {
-                    "timeZone": "America/Chicago"
-                }
-            
-            # Initialize time_range_for_dayofweek for each store
-            time_range_for_dayofweek[store.store_id] = {}
-            for dayofweek in range(7):
-                time_range_for_dayofweek[store.store_id][dayofweek] = {
-                    "start_time": "00:00:00",
-                    "end_time": "23:59:59"
-                }
-       
-        # Step 2: Get the time range for each day of week
-        for business_hour in business_hours:
-            store_id = business_hour.store_id
-            dayofweek = business_hour.day_of_week
-            start_time = business_hour.start_time_local
-            end_time = business_hour.end_time_local
-            if store_id not in time_range_for_dayofweek:
-                time_range_for_dayofweek[store_id] = {}
-            time_range_for_dayofweek[store_id][dayofweek] = {
-                "start_time": start_time,
-                "end_time": end_time
-            }
-        
-        # Step 3: Get store logs for each store
-        for store in stores:
-            store_id = store.store_id
-            
-            try:
-                last_store_log = db.query(StoreStatusLog).filter(StoreStatusLog.store_id == store_id).order_by(StoreStatusLog.timestamp_utc.desc()).first()
-                if not last_store_log:
-                    continue
-                
-                last_store_log_time = last_store_log.timestamp_utc
-                store_logs = get_store_logs_within_week(db, store_id, last_store_log_time)
-                
-                store_data[store_id] = {}
-                
-                for log in store_logs:
-                    try:
-                        # check timezone exists 
-                        if store_id not in timezone:
-                            timezone[store_id] = {"timeZone": "America/Chicago"}
-                        
-                        # Convert timestamp to local time
-                        timestamp_in_local = convert_to_local_time(log["timestamp"], timezone[store_id]["timeZone"])
-                        date = timestamp_in_local.strftime("%Y-%m-%d")
-                        
-                        # Check if timestamp is within business hours
-                        if is_within_business_hours(timestamp_in_local, time_range_for_dayofweek[store_id], timezone[store_id]["timeZone"]):
-                            if date not in store_data[store_id]:
-                                store_data[store_id][date] = []
-                                
-                            store_data[store_id][date].append({
-                                "timestamp": timestamp_in_local,
-                                "status": log["status"],
-                                "utc": log["timestamp"]
-                            })
-                            
-                    except Exception as e:
-                        logger.error(f"Error processing log for store {store_id}: {str(e)}")
-                        raise e
-
-                # Get the end time for the last log of the day
-                last_log_day = last_store_log_time.weekday()
-                business_hours = time_range_for_dayofweek[store_id].get(last_log_day, {
-                    "end_time": "23:59:59"
-                })
-                last_date_str = last_store_log_time.strftime("%Y-%m-%d")
-                end_time_str = f"{last_date_str} {business_hours['end_time']}"
-                # Create datetime with timezone
-                store_tz = pytz.timezone(timezone[store_id]["timeZone"])
-                last_date = store_tz.localize(datetime.strptime(end_time_str, "%Y-%m-%d %H:%M:%S"))
-
-                result.append(get_uptime_downtime_for_store(store_data[store_id], time_range_for_dayofweek[store_id], last_date, timezone[store_id]["timeZone"] , store_id))        
-            
-            except Exception as e:
-                logger.error(f"Error processing store {store_id}: {str(e)}")
-                raise e
+        base_report = find_base_report(db, report) if incremental else None
+        report.base_report_id = base_report.report_id if base_report else None
+        logger.info(f"Starting report generation for report_id: {report_id} (engine: {engine}, shards: {shards}, base report: {report.base_report_id})")
+        start_report_progress(report, "shards" if shards > 1 else "settings_load")
+        db.commit()
 
-        
-        file_url = generate_report_for_all_stores(result,report.report_id)
-        if(file_url):
-            report.status = ReportStatus.completed
-            report.completed_at = datetime.now()
-            report.url = file_url
-            db.commit()
-            db.refresh(report)
-        else:
-            report.status = ReportStatus.failed
-            db.commit()
-            db.refresh(report)
+        if shards > 1:
+            # Fan out one task per store shard and merge their partial files once all
+            # have finished. Shards whose partial file already exists are skipped, so
+            # re-sending report_generation for a failed report only redoes failed shards.
+            chord([
+                report_shard.s(report_id, shard_index, shards, engine, profile, report.base_report_id, settings_version)
+                for shard_index in range(shards)
+            ])(merge_report_shards.s(report_id, engine, profile).on_error(report_shards_failed.s(report_id)))
+            return
+
+        timer = ReportTimer(engine)
+        progress = ReportProgress(report_id, timer, settings.REPORT_PROGRESS_INTERVAL_SECONDS)
+        profile_path = get_profile_path(report_id) if profile else None
+        with track_report_job(engine, "report"), sample_profile(profile_path, settings.REPORT_PROFILE_INTERVAL_SECONDS) if profile else nullcontext():
+            with timer.stage("settings_load"):
+                loaded_version, (timezone, time_range_for_dayofweek) = get_versioned_store_settings(db)
+            if settings_version and loaded_version != settings_version:
+                # Edited since the check above; the base was chosen for the older version
+                restamp_settings_version(db, report, loaded_version)
+                base_report = None
+                report.base_report_id = None
+                db.commit()
+
+            windows = parse_report_windows(report.windows)
+            base = load_incremental_base(db, base_report, windows) if base_report else None
+            result = progress.track(iter_report_results(db, engine, timezone, time_range_for_dayofweek, timer=timer, windows=windows, incremental=base, settings_version=loaded_version))
+            with timer.consumer_stage("file_write", result) as result:
+                # Rows for GET /api/reports/{id}/stores are saved as the file is written
+                result = tee_report_results(result, report.report_id, db.get_bind(), window_fields(windows), settings.REPORT_RESULTS_BATCH_SIZE)
+                file_url = generate_report_for_all_stores(result, report.report_id, report.format or "csv", window_fields(windows))
+            progress.save("file_write", force=True)
+        report.profile_url = profile_path
+        complete_report(db, report, file_url)
+        timer.observe()
+        logger.info(f"Report {report_id} computed {timer.stores - timer.stores_reused} stores (copied {timer.stores_reused}) from {timer.log_rows} logs; stage seconds: { {stage: round(seconds, 3) for stage, seconds in timer.seconds.items()} }")
 
-        
     except Exception as e:
         logger.error(f"Error generating report: {str(e)}")
         if 'db' in locals() and 'report' in locals():
             report.status = ReportStatus.failed
+            report.dedup_key = None
+            if profile and os.path.exists(get_profile_path(report_id)):
+                report.profile_url = get_profile_path(report_id)
             db.commit()
-        raise
\ No newline at end of file
+            notify_report_status(report_id, ReportStatus.failed)
+        raise
+    finally:
+        # Returns the connection to the pool once the report is done, whichever way it ended
+        if 'db' in locals():
+            db.close()
+
+@celery_app.task(
+    name='report_shard',
+    autoretry_for=(Exception,),
+    # A retry would read the same, newer settings again
+    dont_autoretry_for=(StoreSettingsChanged,),
+    retry_backoff=True,
+    max_retries=settings.REPORT_SHARD_MAX_RETRIES
+)
+def report_shard(report_id: str, shard_index: int, shard_count: int, engine: str, profile: bool = False, base_report_id: str = None, settings_version: str = None) -> str:
+    # Every shard computes from settings_version, the one in the report's watermark; a shard
+    # that finds the settings edited since fails the report instead of mixing two versions
+    shard_path = get_report_shard_path(report_id, shard_index, shard_count)
+    if os.path.exists(shard_path):
+        logger.info(f"Shard {shard_index}/{shard_count} of report {report_id} already computed")
+        return shard_path
+
+    db = SessionLocal()
+    timer = ReportTimer(engine)
+    progress = ReportProgress(report_id, timer, settings.REPORT_PROGRESS_INTERVAL_SECONDS, shared=True)
+    profile_path = get_shard_profile_path(shard_path)
+    try:
+        with track_report_job(engine, "shard"), sample_profile(profile_path, settings.REPORT_PROFILE_INTERVAL_SECONDS) if profile else nullcontext():
+            with timer.stage("settings_load"):
+                loaded_version, (timezone, time_range_for_dayofweek) = get_versioned_store_settings(db)
+            if settings_version and loaded_version != settings_version:
+                raise StoreSettingsChanged(f"Store settings changed from version {settings_version} to {loaded_version}")
+
+            report = db.query(Report).filter(Report.report_id == report_id).first()
+            windows = parse_report_windows(report.windows if report else None)
+            base_report = db.query(Report).filter(Report.report_id == base_report_id).first() if base_report_id else None
+            base = load_incremental_base(db, base_report, windows, shard_index, shard_count) if base_report else None
+
+            # Partial files are always CSV; merge_report_shards writes the report format
+            result = progress.track(iter_report_results(db, engine, timezone, time_range_for_dayofweek, shard_index, shard_count, timer, windows, base, loaded_version))
+            with timer.consumer_stage("file_write", result) as result, ReportWriter(shard_path, "csv", extra_fields=window_fields(windows)) as writer:
+                stores = writer.write_many(result)
+            progress.save(force=True)
+        timer.observe()
+        logger.info(f"Shard {shard_index}/{shard_count} of report {report_id} wrote {stores} stores")
+        return shard_path
+    except Exception as e:
+        logger.error(f"Error generating shard {shard_index} of report {report_id}: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+@celery_app.task(name='merge_report_shards')
+def merge_report_shards(shard_paths: list, report_id: str, engine: str = None, profile: bool = False):
+    db = SessionLocal()
+    try:
+        report = db.query(Report).filter(Report.report_id == report_id).first()
+        if not report:
+            raise Exception(f"Report with ID {report_id} not found")
+
+        timer = ReportTimer(engine or settings.REPORT_ENGINE)
+        ReportProgress(report_id, timer, settings.REPORT_PROGRESS_INTERVAL_SECONDS, shared=True).save("file_merge", force=True)
+        with track_report_job(timer.engine, "merge"):
+            if profile:
+                # Before the partial files are merged, which removes their directory
+                report.profile_url = merge_collapsed_stacks(
+                    [get_shard_profile_path(shard_path) for shard_path in shard_paths], get_profile_path(report_id)
+                )
+            extra_fields = window_fields(parse_report_windows(report.windows))
+            with timer.stage("results_save"):
+                # From the partial files, before merging removes them; a store is in one shard only
+                save_report_results(
+                    (result for shard_path in shard_paths for result in read_report_results(shard_path, "csv", extra_fields).values()),
+                    report_id, db.get_bind(), extra_fields, settings.REPORT_RESULTS_BATCH_SIZE
+                )
+            with timer.stage("file_merge"):
+                file_url = merge_report_shard_files(shard_paths, report_id, report.format or "csv", extra_fields)
+            complete_report(db, report, file_url)
+        timer.observe()
+    except Exception as e:
+        logger.error(f"Error merging shards of report {report_id}: {str(e)}")
+        if 'report' in locals() and report:
+            report.status = ReportStatus.failed
+            report.dedup_key = None
+            db.commit()
+            notify_report_status(report_id, ReportStatus.failed)
+        raise
+    finally:
+        db.close()
+
+@celery_app.task(name='report_shards_failed')
+def report_shards_failed(request, exc, traceback, report_id: str):
+    logger.error(f"Shard of report {report_id} failed: {exc}")
+    with get_db_session() as db:
+        report = db.query(Report).filter(Report.report_id == report_id).first()
+        if report:
+            report.status = ReportStatus.failed
+            report.dedup_key = None
+    notify_report_status(report_id, ReportStatus.failed)
@@ -0,0 +1,25 @@
+import logging
+from celery_app import celery_app
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.utils.retention import apply_log_retention
+logger = logging.getLogger(__name__)
+
+@celery_app.task(name='apply_store_status_retention')
+def apply_store_status_retention():
+    db = SessionLocal()
+    try:
+        deleted = apply_log_retention(
+            db,
+            settings.LOG_RETENTION_DAYS,
+            settings.LOG_RETENTION_BATCH_SIZE,
+            settings.LOG_PARTITION_INTERVAL,
+            settings.LOG_PARTITION_DAYS_AHEAD
+        )
+        logger.info(f"Store status retention deleted {deleted} logs")
+        return deleted
+    except Exception as e:
+        logger.error(f"Error applying store status retention: {str(e)}")
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,21 @@
+import logging
+from celery_app import celery_app
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.services.report_service import get_versioned_store_settings
+from app.utils.rollup import bring_rollups_current
+logger = logging.getLogger(__name__)
+
+@celery_app.task(name='rollup_store_status')
+def rollup_store_status():
+    db = SessionLocal()
+    try:
+        settings_version, (timezone, time_range_for_dayofweek) = get_versioned_store_settings(db)
+        folded = bring_rollups_current(db, timezone, time_range_for_dayofweek, settings.REPORT_BATCH_SIZE, settings.ROLLUP_MAX_LOGS_PER_RUN, settings_version)
+        logger.info(f"Folded {folded} log ids into the hourly rollups")
+        return folded
+    except Exception as e:
+        logger.error(f"Error rolling up store status logs: {str(e)}")
+        raise
+    finally:
+        db.close()
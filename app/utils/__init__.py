@@ -1,9 +1,29 @@
-from .report import get_uptime_downtime_for_store,get_store_logs_within_week,generate_report_for_all_stores,convert_to_local_time,is_within_business_hours,is_within_business_hours
+from .report import get_uptime_downtime_for_store,get_store_logs_within_week,generate_report_for_all_stores,convert_to_local_time,is_within_business_hours,get_latest_log_times,stream_store_logs,stream_store_logs_within_week,get_report_shard_path,merge_report_files,merge_report_shard_files,read_report_results
+from .report_writer import REPORT_FORMATS,ReportWriter,get_report_path
+from .schedule import CompiledSchedule,compile_schedule,schedule_key
+from .storage import LocalStorage,S3Storage,get_report_storage,get_location_storage
 
 __all__ = [
     "get_uptime_downtime_for_store",
     "get_store_logs_within_week",
     "generate_report_for_all_stores",
     "convert_to_local_time",
-    "is_within_business_hours"
+    "is_within_business_hours",
+    "get_latest_log_times",
+    "stream_store_logs",
+    "stream_store_logs_within_week",
+    "get_report_shard_path",
+    "merge_report_files",
+    "merge_report_shard_files",
+    "read_report_results",
+    "REPORT_FORMATS",
+    "ReportWriter",
+    "get_report_path",
+    "CompiledSchedule",
+    "compile_schedule",
+    "schedule_key",
+    "LocalStorage",
+    "S3Storage",
+    "get_report_storage",
+    "get_location_storage"
 ]
\ No newline at end of file
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterator, List
+import numpy as np
+from app.utils.schedule import EPOCH, US_PER_DAY, US_PER_SECOND
+from app.utils.store_logs import StoreLogs
+from app.utils.uptime_engine import to_epoch_us
+from app.utils.uptime_index import UptimeIndex
+
+US_PER_HOUR = 3600 * US_PER_SECOND
+US_PER_WEEK = 7 * US_PER_DAY
+
+BACKFILL_STEPS = {"hour": US_PER_HOUR, "day": US_PER_DAY}
+# One year of hourly points per store is already a large report
+MAX_AS_OF_POINTS = 366 * 24
+
+# Logs read before the first as-of point: its week window plus the business day the
+# window starts in, whose opening gap takes the status of that day's first log
+BACKFILL_LOOKBACK = timedelta(days=8)
+
+# Columns added after store_id by a backfill report
+BACKFILL_KEY_FIELDS = ["as_of"]
+
+def as_of_points(start: datetime, end: datetime, step: str) -> np.ndarray:
+    """UTC epoch microseconds from start to end (inclusive) every step, an hour or a day.
+
+    Raises ValueError for an empty or too long range.
+    """
+    if step not in BACKFILL_STEPS:
+        raise ValueError(f"Unknown step {step}, expected one of {tuple(BACKFILL_STEPS)}")
+    start_us, end_us = to_epoch_us(start), to_epoch_us(end)
+    if end_us < start_us:
+        raise ValueError("The last as-of point must not be before the first one")
+    count = (end_us - start_us) // BACKFILL_STEPS[step] + 1
+    if count > MAX_AS_OF_POINTS:
+        raise ValueError(f"{count} as-of points requested, at most {MAX_AS_OF_POINTS} are allowed")
+    return start_us + np.arange(count, dtype=np.int64) * BACKFILL_STEPS[step]
+
+# Every store has the same points, so each is formatted once
+@lru_cache(maxsize=MAX_AS_OF_POINTS)
+def format_as_of(as_of_us: int) -> str:
+    return (EPOCH + timedelta(microseconds=as_of_us)).strftime("%Y-%m-%d %H:%M:%S")
+
+def compute_backfill_rows(store_id: str, store_logs: StoreLogs, store_timezone: str, time_range: Dict, as_of_us: np.ndarray) -> Iterator[List]:
+    """Report rows (ReportWriter order, with as_of after store_id) of one store at every as-of point.
+
+    The store's intervals are built once over all of its logs and every point is then a
+    handful of binary searches (UptimeIndex), so the cost is one pass over the logs however
+    many points are asked for. Each point T counts the trailing hour, day (24 hours) and
+    week (7 days) before T, from the logs before T only. Points without any log of the store
+    in the week before them are skipped, as the report leaves out stores without logs.
+    """
+    timestamps = store_logs.timestamps
+    if not len(timestamps):
+        return
+
+    # Step 1: keep the points with logs in their week window
+    has_logs = np.searchsorted(timestamps, as_of_us) > np.searchsorted(timestamps, as_of_us - US_PER_WEEK)
+    points = as_of_us[has_logs]
+    if not len(points):
+        return
+
+    # Step 2: the hour, day and week windows of every point in one lookup
+    index = UptimeIndex.build(store_logs, store_timezone, time_range)
+    starts = np.concatenate([points - US_PER_HOUR, points - US_PER_DAY, points - US_PER_WEEK])
+    ends = np.tile(points, 3)
+    uptime, downtime = index.minutes(starts, ends)
+
+    # Step 3: a business day's opening gap takes the status of the day's first log, which a
+    # point before that log has not seen yet; take back the gap pending at each point.
+    # Opening gaps are the only intervals that do not begin at a log.
+    if len(index):
+        containing = np.searchsorted(index.begin, ends) - 1
+        safe = np.maximum(containing, 0)
+        pending = (containing >= 0) & (index.end[safe] >= ends) & ~np.isin(index.begin[safe], timestamps)
+        seen = np.where(pending, np.maximum(ends - np.maximum(index.begin[safe], starts), 0), 0) / US_PER_SECOND / 60
+        uptime = uptime - np.where(index.active[safe], seen, 0)
+        downtime = downtime - np.where(index.active[safe], 0, seen)
+    uptime_hour, uptime_day, uptime_week = uptime.reshape(3, -1)
+    downtime_hour, downtime_day, downtime_week = downtime.reshape(3, -1)
+
+    # Step 4: same units and rounding as format_store_result
+    for row in zip(
+        points.tolist(),
+        uptime_hour.tolist(), (uptime_day / 60).tolist(), (uptime_week / 60).tolist(),
+        downtime_hour.tolist(), (downtime_day / 60).tolist(), (downtime_week / 60).tolist(),
+    ):
+        yield [store_id, format_as_of(row[0]), int(row[1]), round(row[2]), round(row[3]),
+               int(row[4]), round(row[5]), round(row[6])]
@@ -0,0 +1,83 @@
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+import logging
+import time
+from sqlalchemy import func, update
+from app.core.db_utils import get_db_session
+from app.core.metrics import ReportTimer
+from app.models import Report
+
+logger = logging.getLogger(__name__)
+
+class ReportProgress:
+    """Persists the progress of a running report on its Report row, at most every interval seconds.
+
+    Counts and the current stage are read from the job's ReportTimer. Writes use their own
+    short session because the job's session is busy streaming logs. Shard tasks add their
+    counts to the row instead of overwriting them, so a sharded report shows the sum of its
+    shards (a retried shard is counted again).
+    """
+
+    def __init__(self, report_id: str, timer: ReportTimer, interval: float, shared: bool = False):
+        self.report_id = report_id
+        self.timer = timer
+        self.interval = interval
+        self.shared = shared
+        self._saved_at = time.monotonic()
+        self._saved_stores = 0
+        self._saved_total = 0
+
+    def track(self, results: Iterable) -> Iterator:
+        for result in results:
+            yield result
+            self.save()
+
+    def save(self, stage: Optional[str] = None, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._saved_at < self.interval:
+            return
+        self._saved_at = now
+
+        values = {"stage": stage or self.timer.current_stage, "progress_updated_at": datetime.now()}
+        if self.shared:
+            values["stores_done"] = func.coalesce(Report.stores_done, 0) + (self.timer.stores - self._saved_stores)
+            values["stores_total"] = func.coalesce(Report.stores_total, 0) + (self.timer.stores_total - self._saved_total)
+        else:
+            values["stores_done"] = self.timer.stores
+            values["stores_total"] = self.timer.stores_total
+
+        try:
+            with get_db_session() as db:
+                db.execute(update(Report).where(Report.report_id == self.report_id).values(**values))
+            self._saved_stores = self.timer.stores
+            self._saved_total = self.timer.stores_total
+        except Exception as e:
+            # Progress is informational and never fails the report
+            logger.warning(f"Could not save progress of report {self.report_id}: {str(e)}")
+
+def start_report_progress(report: Report, stage: str):
+    # Resets the progress columns of a (re)started report; the caller commits
+    report.stage = stage
+    report.stores_done = 0
+    report.stores_total = 0
+    report.started_at = datetime.now()
+    report.progress_updated_at = report.started_at
+
+def get_report_progress(report: Report, now: Optional[datetime] = None) -> dict:
+    """Progress of a running report, with an ETA extrapolated from its rate so far."""
+    now = now or datetime.now()
+    stores_total = report.stores_total or 0
+    stores_done = min(report.stores_done or 0, stores_total) if stores_total else report.stores_done or 0
+    eta_seconds = None
+    if report.started_at and 0 < stores_done < stores_total:
+        elapsed = (now - report.started_at).total_seconds()
+        eta_seconds = round(elapsed * (stores_total - stores_done) / stores_done)
+    return {
+        "stage": report.stage,
+        "stores_done": stores_done,
+        "stores_total": stores_total,
+        "percent": round(100 * stores_done / stores_total, 1) if stores_total else None,
+        "started_at": report.started_at,
+        "updated_at": report.progress_updated_at,
+        "eta_seconds": eta_seconds,
+    }
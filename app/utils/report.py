@@ -1,12 +1,18 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 from datetime import datetime, timedelta,time
 import logging
 import pytz
 from app.models import StoreStatusLog, StoreStatus
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Tuple
 import csv
+import gzip
+import io
 from datetime import datetime
 import os
+from app.utils.report_writer import REPORT_FIELDS, ReportWriter, get_report_path
+from app.utils.storage import get_location_storage, get_report_storage
+from app.utils.store_logs import StoreLogs, StoreLogsBuilder
 
 logger = logging.getLogger(__name__)
 
@@ -139,48 +145,77 @@ def get_uptime_downtime_for_store(store_data: Dict, time_range_for_dayofweek: Di
         logger.error(f"Error in get_uptime_downtime_for_store: {str(e)}")
         raise e
 
-def generate_report_for_all_stores(result,report_id:str):
+def generate_report_for_all_stores(result: Iterable[Dict], report_id: str, report_format: str = "csv", extra_fields: List[str] = None):
     try:
-        # Create reports directory if it no  exist
-        os.makedirs("reports", exist_ok=True)
-
         # report_id as  filename 
+        filename = get_report_path(report_id, report_format)
 
-        filename = f"reports/store_report_{report_id}.csv"
-
-        
-        headers = [
-            "store_id",
-            "uptime_last_hour(minutes)",
-            "uptime_last_day(hours)",
-            "uptime_last_week(hours)",
-            "downtime_last_hour(minutes)",
-            "downtime_last_day(hours)",
-            "downtime_last_week(hours)"
-        ]
+        # Results are written as they are produced, result can be any iterable
+        with ReportWriter(filename, report_format, extra_fields=extra_fields, storage=get_report_storage()) as writer:
+            writer.write_many(result)
 
-       
-        with open(filename, 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(headers)
-
-            for store_result in result:
-                writer.writerow([
-                    store_result.get("store_id", "N/A"),
-                    store_result.get("uptime_last_hour", 0),
-                    store_result.get("uptime_last_day", 0),
-                    store_result.get("uptime_last_week", 0),
-                    store_result.get("downtime_last_hour", 0),
-                    store_result.get("downtime_last_day", 0),
-                    store_result.get("downtime_last_week", 0)
-                ])
-
-        print(f"Report generated successfully: {filename}")
-        return filename
+        print(f"Report generated successfully: {writer.location}")
+        return writer.location
     except Exception as e:
         print(f"Error generating report: {e}")
         raise e
 
+def read_report_results(location: str, report_format: str = "csv", extra_fields: List[str] = None) -> Dict[str, Dict]:
+    """Store results of a written report, keyed by store_id, in the units they were written in.
+
+    Raises ValueError when the report's columns are not the standard ones plus extra_fields.
+    """
+    fields = REPORT_FIELDS + list(extra_fields or [])
+    results = {}
+    with get_location_storage(location).open_read(location) as file:
+        if report_format == "parquet":
+            import pyarrow.parquet as pq
+            table = pq.read_table(file)
+            if len(table.column_names) != len(fields):
+                raise ValueError(f"Report {location} has {len(table.column_names)} columns, expected {len(fields)}")
+            rows = zip(*(table.column(i).to_pylist() for i in range(len(fields))))
+        else:
+            binary = gzip.GzipFile(fileobj=file) if report_format == "csv.gz" else file
+            reader = csv.reader(io.TextIOWrapper(binary, encoding="utf-8", newline=""))
+            header = next(reader, [])
+            if len(header) != len(fields):
+                raise ValueError(f"Report {location} has {len(header)} columns, expected {len(fields)}")
+            rows = reader
+        for row in rows:
+            results[row[0]] = dict(zip(fields, [row[0]] + [int(value) for value in row[1:]]))
+    return results
+
+def get_report_shard_path(report_id: str, shard_index: int, shard_count: int) -> str:
+    return f"reports/partials/{report_id}/shard_{shard_index}_of_{shard_count}.csv"
+
+def merge_report_files(shard_paths: List[str], filename: str, report_format: str = "csv", extra_fields: List[str] = None, storage=None, key_fields: List[str] = None) -> str:
+    # Shards are plain CSV with the same header; skip it and stream the rows across
+    with ReportWriter(filename, report_format, extra_fields=extra_fields, storage=storage, key_fields=key_fields) as writer:
+        for shard_path in shard_paths:
+            with open(shard_path, 'r', newline='') as shard_file:
+                reader = csv.reader(shard_file)
+                next(reader, None)
+                for row in reader:
+                    writer.write_row(row)
+    return writer.location
+
+def merge_report_shard_files(shard_paths: List[str], report_id: str, report_format: str = "csv", extra_fields: List[str] = None) -> str:
+    try:
+        filename = get_report_path(report_id, report_format)
+        location = merge_report_files(shard_paths, filename, report_format, extra_fields, get_report_storage())
+
+        for shard_path in shard_paths:
+            os.remove(shard_path)
+        shard_dir = os.path.dirname(shard_paths[0]) if shard_paths else None
+        if shard_dir and not os.listdir(shard_dir):
+            os.rmdir(shard_dir)
+
+        print(f"Report generated successfully: {location}")
+        return location
+    except Exception as e:
+        print(f"Error merging report shards: {e}")
+        raise e
+
 
 
 def convert_to_local_time(timestamp_str: str, timezone_str: str) -> datetime:
@@ -232,22 +267,103 @@ def is_within_business_hours(timestamp: datetime, business_hours: Dict, store_ti
         logger.error(f"Error checking business hours: {str(e)}")
         raise e
 
-def get_store_logs_within_week(db: Session, store_id: str, last_store_log_time: datetime) -> List[Dict]:
+def get_week_start(last_store_log_time: datetime) -> datetime:
+    # Start of the week window (7 days ago from last_store_log_time)
+    return last_store_log_time.replace(hour=23, minute=59, second=59) - timedelta(days=6)
+
+def get_store_logs_within_week(db: Session, store_id: str, last_store_log_time: datetime) -> StoreLogs:
    
     try:
         # Calculate the start of the week (7 days ago from last_store_log_time)
-        week_start = last_store_log_time.replace(hour=23, minute=59, second=59) - timedelta(days=6)
+        week_start = get_week_start(last_store_log_time)
             
-        logs = db.query(StoreStatusLog).filter(
+        # Two columns instead of whole ORM objects
+        rows = db.query(StoreStatusLog.timestamp_utc, StoreStatusLog.status).filter(
             StoreStatusLog.store_id == store_id,
             StoreStatusLog.timestamp_utc >= week_start,
         ).order_by(StoreStatusLog.timestamp_utc).all()
         
-        return [{
-            "timestamp": log.timestamp_utc.isoformat(),
-            "status": log.status
-        } for log in logs]
+        return StoreLogs.from_rows([row[0] for row in rows], [row[1] for row in rows])
     except Exception as e:
         logger.error(f"Error getting store logs within week: {str(e)}")
         raise e
-        
\ No newline at end of file
+
+def get_latest_log_times(db: Session, store_ids: Iterable[str] = None) -> Dict[str, datetime]:
+    try:
+        # One grouped query instead of one "latest log" query per store
+        query = db.query(
+            StoreStatusLog.store_id,
+            func.max(StoreStatusLog.timestamp_utc)
+        )
+        if store_ids is None:
+            rows = query.group_by(StoreStatusLog.store_id).all()
+        else:
+            # Only the given stores, 1000 per IN (...) list
+            store_ids = list(store_ids)
+            rows = []
+            for start in range(0, len(store_ids), 1000):
+                rows += query.filter(StoreStatusLog.store_id.in_(store_ids[start:start + 1000])).group_by(StoreStatusLog.store_id).all()
+
+        return {store_id: last_store_log_time for store_id, last_store_log_time in rows}
+    except Exception as e:
+        logger.error(f"Error getting latest log times: {str(e)}")
+        raise e
+
+def stream_store_logs(db: Session, lower_bounds: Dict[str, datetime], batch_size: int = 10000, restrict_to_stores: bool = False, upper_bounds: Dict[str, datetime] = None) -> Iterator[Tuple[str, StoreLogs]]:
+    """Yield (store_id, StoreLogs) for every store in lower_bounds from a single ordered scan.
+
+    All stores are read through one server-side cursor ordered by (store_id, timestamp_utc),
+    so each store's logs are complete as soon as the next store_id shows up. Only logs at or
+    after the store's lower bound (and before its optional upper bound) are kept. Only the
+    store being read is held in memory. With restrict_to_stores the scan is limited to the
+    given stores (e.g. one report shard).
+    """
+    if not lower_bounds:
+        return
+
+    try:
+        query = db.query(
+            StoreStatusLog.store_id,
+            StoreStatusLog.timestamp_utc,
+            StoreStatusLog.status
+        ).filter(
+            StoreStatusLog.timestamp_utc >= min(lower_bounds.values())
+        )
+        if upper_bounds:
+            query = query.filter(StoreStatusLog.timestamp_utc < max(upper_bounds.values()))
+        if restrict_to_stores:
+            query = query.filter(StoreStatusLog.store_id.in_(list(lower_bounds)))
+
+        rows = query.order_by(
+            StoreStatusLog.store_id,
+            StoreStatusLog.timestamp_utc
+        ).yield_per(batch_size)
+
+        current_store_id = None
+        current_logs = StoreLogsBuilder()
+        for store_id, timestamp_utc, status in rows:
+            if store_id != current_store_id:
+                if current_logs:
+                    yield current_store_id, current_logs.build()
+                current_store_id = store_id
+                current_logs = StoreLogsBuilder()
+
+            # Skip unknown stores and logs before this store's own lower bound
+            lower_bound = lower_bounds.get(store_id)
+            if lower_bound is None or timestamp_utc < lower_bound:
+                continue
+            if upper_bounds and timestamp_utc >= upper_bounds[store_id]:
+                continue
+
+            current_logs.append(timestamp_utc, status)
+
+        if current_logs:
+            yield current_store_id, current_logs.build()
+    except Exception as e:
+        logger.error(f"Error streaming store logs: {str(e)}")
+        raise e
+
+def stream_store_logs_within_week(db: Session, latest_log_times: Dict[str, datetime], batch_size: int = 10000, restrict_to_stores: bool = False) -> Iterator[Tuple[str, StoreLogs]]:
+    # Week window of every store, read in one ordered scan (see stream_store_logs)
+    week_starts = {store_id: get_week_start(last_time) for store_id, last_time in latest_log_times.items()}
+    return stream_store_logs(db, week_starts, batch_size, restrict_to_stores)
@@ -0,0 +1,134 @@
+from sqlalchemy import and_, delete, insert, or_, select
+from sqlalchemy.engine import Engine
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import base64
+import json
+import logging
+import operator
+import re
+from app.models import REPORT_RESULT_METRICS, ReportResult
+
+logger = logging.getLogger(__name__)
+
+# Largest page of GET /api/reports/{id}/stores
+MAX_RESULTS_PAGE_SIZE = 1000
+
+RESULT_SORT_FIELDS = ["store_id"] + REPORT_RESULT_METRICS
+
+FILTER_SPEC = re.compile(r"^(?P<field>\w+)(?P<op><=|>=|<|>|=)(?P<value>-?\d+(\.\d+)?)$")
+FILTER_OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "=": operator.eq,
+}
+
+class ResultFilter(NamedTuple):
+    field: str
+    op: str
+    value: float
+
+def parse_result_filter(spec: str) -> ResultFilter:
+    """Parse METRIC<OP>VALUE, e.g. downtime_last_day>2, with OP one of < <= > >= =.
+
+    Raises ValueError for anything else.
+    """
+    match = FILTER_SPEC.match(spec.replace(" ", ""))
+    if not match:
+        raise ValueError(f"Invalid filter {spec!r}, expected e.g. downtime_last_day>2 or uptime_last_hour<=30")
+    if match["field"] not in REPORT_RESULT_METRICS:
+        raise ValueError(f"Unknown filter field {match['field']}, expected one of {', '.join(REPORT_RESULT_METRICS)}")
+    return ResultFilter(match["field"], match["op"], float(match["value"]))
+
+def encode_results_cursor(sort: str, descending: bool, row: Dict) -> str:
+    # Opaque to clients: the sort key of the last row of a page
+    key = [sort, descending, row[sort], row["store_id"]]
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+def decode_results_cursor(cursor: str, sort: str, descending: bool) -> Tuple:
+    """(sort value, store_id) after which the next page starts. Raises ValueError for a bad cursor."""
+    try:
+        cursor_sort, cursor_descending, value, store_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if (cursor_sort, cursor_descending) != (sort, descending):
+        raise ValueError("The cursor belongs to a different sort order")
+    return value, store_id
+
+def select_report_results(report_id: str, filters: List[ResultFilter] = None, sort: str = "store_id", descending: bool = False, after: Optional[Tuple] = None, limit: int = 100):
+    """One keyset page of a report's results, ordered by sort then store_id.
+
+    With a filter or sort on a metric the page is a range scan of that metric's
+    (report_id, metric, store_id) index; after is the decoded cursor of the previous page.
+    """
+    if sort not in RESULT_SORT_FIELDS:
+        raise ValueError(f"Unknown sort field {sort}, expected one of {', '.join(RESULT_SORT_FIELDS)}")
+
+    sort_column = getattr(ReportResult, sort)
+    conditions = [ReportResult.report_id == report_id]
+    conditions += [FILTER_OPERATORS[f.op](getattr(ReportResult, f.field), f.value) for f in filters or []]
+    if after is not None:
+        value, store_id = after
+        beyond = operator.lt if descending else operator.gt
+        if sort == "store_id":
+            conditions.append(beyond(ReportResult.store_id, store_id))
+        else:
+            conditions.append(or_(beyond(sort_column, value), and_(sort_column == value, beyond(ReportResult.store_id, store_id))))
+
+    order = [sort_column] if sort == "store_id" else [sort_column, ReportResult.store_id]
+    return select(ReportResult).where(*conditions).order_by(
+        *(column.desc() if descending else column for column in order)
+    ).limit(limit)
+
+def format_report_result(row: ReportResult) -> Dict:
+    return {
+        "store_id": row.store_id,
+        **{metric: getattr(row, metric) for metric in REPORT_RESULT_METRICS},
+        **(row.windows or {})
+    }
+
+def report_result_row(report_id: str, result: Dict, extra_fields: List[str] = None) -> Dict:
+    return {
+        "report_id": report_id,
+        "store_id": result["store_id"],
+        **{metric: int(result.get(metric, 0)) for metric in REPORT_RESULT_METRICS},
+        "windows": {field: result.get(field, 0) for field in extra_fields} if extra_fields else None
+    }
+
+def delete_report_results(bind: Engine, report_id: str):
+    # Rows of an earlier, failed attempt of the report
+    with bind.begin() as connection:
+        connection.execute(delete(ReportResult.__table__).where(ReportResult.report_id == report_id))
+
+def insert_report_results(bind: Engine, rows: List[Dict]):
+    with bind.begin() as connection:
+        connection.execute(insert(ReportResult.__table__), rows)
+
+def tee_report_results(results: Iterable[Dict], report_id: str, bind: Engine, extra_fields: List[str] = None, batch_size: int = 5000) -> Iterator[Dict]:
+    """Yield results unchanged while bulk inserting them into report_results.
+
+    Rows go through their own connections, batch_size per insert and transaction, so a
+    report streamed from a server-side cursor is saved as it is written to its file.
+    """
+    try:
+        delete_report_results(bind, report_id)
+        batch = []
+        for result in results:
+            batch.append(report_result_row(report_id, result, extra_fields))
+            if len(batch) >= batch_size:
+                insert_report_results(bind, batch)
+                batch = []
+            yield result
+        if batch:
+            insert_report_results(bind, batch)
+    except Exception as e:
+        logger.error(f"Error saving results of report {report_id}: {str(e)}")
+        raise e
+
+def save_report_results(results: Iterable[Dict], report_id: str, bind: Engine, extra_fields: List[str] = None, batch_size: int = 5000) -> int:
+    # Saves results without passing them on; returns the stores saved
+    saved = 0
+    for _ in tee_report_results(results, report_id, bind, extra_fields, batch_size):
+        saved += 1
+    return saved
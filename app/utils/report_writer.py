@@ -0,0 +1,168 @@
+from typing import Dict, Iterable, List
+import csv
+import gzip
+import io
+import logging
+from app.utils.storage import LocalStorage
+
+logger = logging.getLogger(__name__)
+
+REPORT_FORMATS = ("csv", "csv.gz", "parquet")
+
+REPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "csv.gz": "application/gzip",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+REPORT_HEADERS = [
+    "store_id",
+    "uptime_last_hour(minutes)",
+    "uptime_last_day(hours)",
+    "uptime_last_week(hours)",
+    "downtime_last_hour(minutes)",
+    "downtime_last_day(hours)",
+    "downtime_last_week(hours)"
+]
+
+# Result keys in REPORT_HEADERS order
+REPORT_FIELDS = [
+    "store_id",
+    "uptime_last_hour",
+    "uptime_last_day",
+    "uptime_last_week",
+    "downtime_last_hour",
+    "downtime_last_day",
+    "downtime_last_week"
+]
+
+def get_report_path(report_id: str, report_format: str = "csv") -> str:
+    return f"reports/store_report_{report_id}.{report_format}"
+
+def store_result_row(store_result: Dict, fields: List[str] = REPORT_FIELDS) -> List:
+    return [store_result.get("store_id", "N/A")] + [store_result.get(field, 0) for field in fields[1:]]
+
+class ReportWriter:
+    """Writes report rows as they are produced, in csv, csv.gz or parquet.
+
+    Rows go straight to the storage sink (parquet buffers at most one row group), so memory
+    does not grow with the number of stores. Nothing appears at `filename` before close(),
+    so a half written report is never mistaken for a finished one; abort() discards it
+    instead. close() returns the report's location in `storage` (local files by default).
+    extra_fields are result keys written after the standard columns, in minutes (custom
+    report windows); key_fields are text columns written right after store_id (the as_of
+    point of a backfill).
+    """
+
+    def __init__(self, filename: str, report_format: str = "csv", row_group_size: int = 50000, extra_fields: List[str] = None, storage=None, key_fields: List[str] = None):
+        if report_format not in REPORT_FORMATS:
+            raise ValueError(f"Unknown report format {report_format}, expected one of {REPORT_FORMATS}")
+
+        self.filename = filename
+        self.report_format = report_format
+        self.row_group_size = row_group_size
+        key_fields = list(key_fields or [])
+        self.key_count = 1 + len(key_fields)
+        self.fields = REPORT_FIELDS[:1] + key_fields + REPORT_FIELDS[1:] + list(extra_fields or [])
+        self.headers = REPORT_HEADERS[:1] + key_fields + REPORT_HEADERS[1:] + [f"{field}(minutes)" for field in extra_fields or []]
+        self.rows_written = 0
+        # Where the report ended up, once closed
+        self.location = None
+        self._file = None
+        self._gzip_file = None
+        self._csv_writer = None
+        self._parquet_writer = None
+        self._pending = []
+
+        self._sink = (storage or LocalStorage()).open_sink(filename, REPORT_MEDIA_TYPES[report_format])
+        if report_format == "parquet":
+            self._open_parquet()
+        else:
+            # The wrappers never close the sink, only commit() or abort() finish it
+            if report_format == "csv.gz":
+                self._gzip_file = gzip.GzipFile(fileobj=self._sink, mode="wb")
+                self._file = io.TextIOWrapper(self._gzip_file, encoding="utf-8", newline="")
+            else:
+                self._file = io.TextIOWrapper(self._sink, encoding="utf-8", newline="")
+            self._csv_writer = csv.writer(self._file)
+            self._csv_writer.writerow(self.headers)
+
+    def _open_parquet(self):
+        # pyarrow is only needed for parquet reports
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet reports need pyarrow (pip install pyarrow)") from e
+
+        self._pa = pa
+        self._schema = pa.schema(
+            [pa.field(header, pa.string()) for header in self.headers[:self.key_count]] +
+            [pa.field(header, pa.int64()) for header in self.headers[self.key_count:]]
+        )
+        self._parquet_writer = pq.ParquetWriter(self._sink, self._schema, compression="snappy")
+
+    def _flush_row_group(self):
+        if not self._pending:
+            return
+        columns = list(zip(*self._pending))
+        table = self._pa.Table.from_arrays(
+            [self._pa.array(column, type=field.type) for column, field in zip(columns, self._schema)],
+            schema=self._schema
+        )
+        self._parquet_writer.write_table(table)
+        self._pending = []
+
+    def write_row(self, row: List):
+        if self._parquet_writer is not None:
+            self._pending.append(list(row[:self.key_count]) + [int(value) for value in row[self.key_count:]])
+            if len(self._pending) >= self.row_group_size:
+                self._flush_row_group()
+        else:
+            self._csv_writer.writerow(row)
+        self.rows_written += 1
+
+    def write(self, store_result: Dict):
+        self.write_row(store_result_row(store_result, self.fields))
+
+    def write_many(self, results: Iterable[Dict]) -> int:
+        for store_result in results:
+            self.write(store_result)
+        return self.rows_written
+
+    def write_rows(self, rows: Iterable[List]) -> int:
+        for row in rows:
+            self.write_row(row)
+        return self.rows_written
+
+    def _close_writers(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        elif self._file is not None:
+            self._file.flush()
+            self._file.detach()
+            if self._gzip_file is not None:
+                self._gzip_file.close()
+
+    def close(self) -> str:
+        if self._parquet_writer is not None:
+            self._flush_row_group()
+        self._close_writers()
+        self.location = self._sink.commit()
+        return self.location
+
+    def abort(self):
+        try:
+            self._close_writers()
+        finally:
+            self._sink.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
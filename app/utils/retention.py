@@ -0,0 +1,77 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from datetime import date, datetime, timedelta
+from typing import Optional
+import logging
+from app.models import StoreStatusHourlyRollup, StoreStatusLog
+from app.core.migrations import drop_store_status_partitions, list_store_status_partitions, add_store_status_partitions
+
+logger = logging.getLogger(__name__)
+
+# Reports look back one week from each store's latest log, plus one day for local time
+MIN_RETENTION_DAYS = 8
+
+def get_retention_cutoff(db: Session, retention_days: int) -> Optional[datetime]:
+    # The horizon is measured from the newest log, the same "now" reports use
+    if retention_days < MIN_RETENTION_DAYS:
+        raise ValueError(f"Log retention must be at least {MIN_RETENTION_DAYS} days, got {retention_days}")
+
+    latest_log_time = db.query(func.max(StoreStatusLog.timestamp_utc)).scalar()
+    if latest_log_time is None:
+        return None
+    return (latest_log_time - timedelta(days=retention_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def delete_rows_before(db: Session, model, column, cutoff, batch_size: int = 10000) -> int:
+    """Delete rows of model whose column is below cutoff in primary key batches, committing after each one.
+
+    Short transactions keep locks brief while the ingestion endpoint and rollups keep writing.
+    """
+    deleted = 0
+    try:
+        while True:
+            ids = [row.id for row in db.query(model.id).filter(column < cutoff).order_by(model.id).limit(batch_size)]
+            if not ids:
+                return deleted
+
+            db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+            deleted += len(ids)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error deleting {model.__tablename__} rows: {str(e)}")
+        raise e
+
+def delete_store_status_logs_before(db: Session, cutoff: datetime, batch_size: int = 10000) -> int:
+    return delete_rows_before(db, StoreStatusLog, StoreStatusLog.timestamp_utc, cutoff, batch_size)
+
+def delete_hourly_rollups_before(db: Session, cutoff: date, batch_size: int = 10000) -> int:
+    # Rollup rows of local days before cutoff; their logs are gone or going
+    return delete_rows_before(db, StoreStatusHourlyRollup, StoreStatusHourlyRollup.local_date, cutoff, batch_size)
+
+def apply_log_retention(db: Session, retention_days: int, batch_size: int = 10000, partition_interval: str = "day", partition_days_ahead: int = 7) -> int:
+    """Drop (or batch-delete) logs older than the retention horizon.
+
+    Partitioned tables lose whole partitions, which is instant and leaves no fragmentation;
+    rows left in the partition that straddles the cutoff are deleted in batches. Partitioned
+    tables also get their upcoming partitions created here. Hourly rollups of local days
+    before the cutoff's day are deleted in the same pass. Returns the logs deleted, not
+    counting dropped partitions.
+    """
+    cutoff = get_retention_cutoff(db, retention_days)
+    if cutoff is None:
+        return 0
+
+    try:
+        engine = db.get_bind()
+        if list_store_status_partitions(engine):
+            add_store_status_partitions(engine, datetime.utcnow().date() + timedelta(days=partition_days_ahead), partition_interval)
+            drop_store_status_partitions(engine, cutoff)
+
+        deleted = delete_store_status_logs_before(db, cutoff, batch_size)
+        logger.info(f"Deleted {deleted} store status logs before {cutoff}")
+        rollups_deleted = delete_hourly_rollups_before(db, cutoff.date(), batch_size)
+        logger.info(f"Deleted {rollups_deleted} hourly rollups before {cutoff.date()}")
+        return deleted
+    except Exception as e:
+        logger.error(f"Error applying log retention: {str(e)}")
+        raise e
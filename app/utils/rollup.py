@@ -0,0 +1,481 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, insert, or_
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import hashlib
+import logging
+import numpy as np
+import pytz
+from app.models import StoreStatusLog, StoreStatus, StoreStatusHourlyRollup, StoreStatusRollupSettings, StoreStatusRollupState
+from app.utils.report import get_week_start, stream_store_logs
+from app.utils.schedule import DEFAULT_HOURS, localize_to_epoch_us, schedule_key
+from app.utils.store_logs import StoreLogs, StoreLogsBuilder
+from app.utils.uptime_engine import (
+    EPOCH, US_PER_SECOND, US_PER_DAY, UptimeBatch, build_business_windows, build_intervals, format_store_result, to_epoch_us
+)
+from app.utils.watermark import get_settings_version
+
+logger = logging.getLogger(__name__)
+
+US_PER_MINUTE = 60 * US_PER_SECOND
+US_PER_HOUR = 3600 * US_PER_SECOND
+
+# Stores per OR-ed range query of read_store_log_ranges (three bound parameters each)
+RANGE_QUERY_STORES = 300
+
+def split_by_hour(begin: np.ndarray, end: np.ndarray):
+    """Split [begin, end) spans at UTC hour boundaries.
+
+    Returns (span index, hour since epoch, piece begin, piece end) for every piece; empty
+    spans produce no pieces.
+    """
+    span = np.nonzero(end > begin)[0]
+    first_hour = begin[span] // US_PER_HOUR
+    last_hour = (end[span] - 1) // US_PER_HOUR
+    pieces_per_span = last_hour - first_hour + 1
+
+    piece_span = np.repeat(span, pieces_per_span)
+    piece_offset = np.arange(len(piece_span)) - np.repeat(np.cumsum(pieces_per_span) - pieces_per_span, pieces_per_span)
+    hour = np.repeat(first_hour, pieces_per_span) + piece_offset
+    piece_begin = np.maximum(begin[piece_span], hour * US_PER_HOUR)
+    piece_end = np.minimum(end[piece_span], (hour + 1) * US_PER_HOUR)
+    return piece_span, hour, piece_begin, piece_end
+
+
+def from_epoch_us(epoch_us: int) -> datetime:
+    # Naive UTC, like StoreStatusLog.timestamp_utc
+    return EPOCH + timedelta(microseconds=int(epoch_us))
+
+def compute_rollup_rows(batch: UptimeBatch) -> List[Dict]:
+    """Hourly rollup rows for the business windows of every store in the batch.
+
+    Each row holds the active/inactive microseconds the reference algorithm attributes to
+    one (store, local business day, UTC hour), so summing rows gives its day/week totals
+    exactly.
+    """
+    if not len(batch):
+        return []
+
+    arrays = batch.arrays()
+    window_open = arrays["window_open"]
+    window_close = arrays["window_close"]
+    window_day = arrays["window_day"]
+    store_of_window = np.repeat(np.arange(len(batch)), np.diff(arrays["window_offsets"]))
+    intervals = build_intervals(
+        arrays["timestamps"], arrays["statuses"], arrays["offsets"],
+        window_open, window_close, arrays["window_offsets"]
+    )
+
+    # Step 1: one row per (window, hour) with business time in it
+    window_span, window_hour, window_piece_begin, window_piece_end = split_by_hour(window_open, window_close)
+    if not len(window_span):
+        return []
+    min_hour = int(window_hour.min())
+    row_keys, row_index = np.unique((window_span << 24) | (window_hour - min_hour), return_inverse=True)
+    # bincount adds in float64, which is exact for sums of at most an hour of microseconds
+    business_us = np.bincount(row_index, weights=window_piece_end - window_piece_begin, minlength=len(row_keys))
+
+    # Step 2: fold the counted intervals into the same rows
+    counted = intervals["counted"]
+    interval_span, interval_hour, interval_piece_begin, interval_piece_end = split_by_hour(
+        intervals["begin"][counted], intervals["end"][counted]
+    )
+    interval_window = intervals["window"][counted][interval_span]
+    interval_active = intervals["active"][counted][interval_span]
+    interval_row = np.searchsorted(row_keys, (interval_window << 24) | (interval_hour - min_hour))
+    piece_us = interval_piece_end - interval_piece_begin
+    active_us = np.bincount(interval_row, weights=np.where(interval_active, piece_us, 0), minlength=len(row_keys))
+    inactive_us = np.bincount(interval_row, weights=np.where(interval_active, 0, piece_us), minlength=len(row_keys))
+
+    # Status in effect at the end of the row's business time
+    last_status = np.full(len(row_keys), -1, dtype=np.int8)
+    order = np.lexsort((interval_piece_end, interval_row))
+    last_piece = order[np.r_[interval_row[order][1:] != interval_row[order][:-1], True]] if len(order) else order
+    last_status[interval_row[last_piece]] = interval_active[last_piece]
+
+    row_window = (row_keys >> 24).astype(np.int64)
+    row_hour = (row_keys & ((1 << 24) - 1)) + min_hour
+    rows = []
+    for i in range(len(row_keys)):
+        window = int(row_window[i])
+        rows.append({
+            "store_id": batch.store_ids[int(store_of_window[window])],
+            "local_date": (EPOCH + timedelta(days=int(window_day[window]))).date(),
+            "hour_start_utc": EPOCH + timedelta(hours=int(row_hour[i])),
+            "active_us": int(active_us[i]),
+            "inactive_us": int(inactive_us[i]),
+            "business_us": int(business_us[i]),
+            "last_status": None if last_status[i] < 0 else (StoreStatus.active if last_status[i] else StoreStatus.inactive),
+        })
+    return rows
+
+def rebuild_store_days(db: Session, affected_days: Dict[str, Tuple[int, int]], timezone: Dict, time_range_for_dayofweek: Dict, batch_size: int = 2000):
+    # Recompute the rows of every store's (first, last) local days from raw logs and replace them
+    store_ids = sorted(affected_days)
+    for start in range(0, len(store_ids), batch_size):
+        batch_store_ids = store_ids[start:start + batch_size]
+        lower_bounds = {
+            store_id: EPOCH + timedelta(days=int(affected_days[store_id][0]) - 1)
+            for store_id in batch_store_ids
+        }
+
+        batch = UptimeBatch()
+        for store_id, store_logs in stream_store_logs(db, lower_bounds, restrict_to_stores=True):
+            batch.add_store(
+                store_id, store_logs, store_logs.last_time,
+                timezone[store_id]["timeZone"], time_range_for_dayofweek[store_id],
+                window_days=affected_days[store_id]
+            )
+        rows = compute_rollup_rows(batch)
+
+        for store_id in batch_store_ids:
+            first_day, last_day = affected_days[store_id]
+            db.query(StoreStatusHourlyRollup).filter(
+                StoreStatusHourlyRollup.store_id == store_id,
+                StoreStatusHourlyRollup.local_date >= (EPOCH + timedelta(days=int(first_day))).date(),
+                StoreStatusHourlyRollup.local_date <= (EPOCH + timedelta(days=int(last_day))).date()
+            ).delete(synchronize_session=False)
+        if rows:
+            db.execute(insert(StoreStatusHourlyRollup), rows)
+
+def store_settings_key(timezone_str: str, time_range: Dict) -> str:
+    return hashlib.sha1(repr((timezone_str, schedule_key(time_range))).encode("utf-8")).hexdigest()[:16]
+
+def rebuild_changed_stores(db: Session, timezone: Dict, time_range_for_dayofweek: Dict, batch_size: int = 2000, rebuild: bool = True) -> int:
+    """Rebuild every day of the stores whose timezone or business hours changed.
+
+    Rows are bucketed by the local days and business hours of the settings they were
+    computed with, so all rows of a store whose settings key differs from the one in
+    store_status_rollup_settings are recomputed from its logs, and stores without settings
+    lose theirs. With rebuild=False (nothing rolled up yet) only the keys are stored.
+    Returns the number of stores rebuilt.
+    """
+    keys = {}
+    shared_keys = {}
+    for store_id, store_timezone in timezone.items():
+        time_range = time_range_for_dayofweek[store_id]
+        # Shared settings dicts make id() a cheap identity of the store's hours
+        shared = (store_timezone["timeZone"], id(time_range))
+        if shared not in shared_keys:
+            shared_keys[shared] = store_settings_key(store_timezone["timeZone"], time_range)
+        keys[store_id] = shared_keys[shared]
+
+    stored = dict(db.query(StoreStatusRollupSettings.store_id, StoreStatusRollupSettings.settings_key).all())
+    changed = sorted(store_id for store_id, key in keys.items() if stored.get(store_id) != key)
+    stale = changed + [store_id for store_id in stored if store_id not in keys]
+
+    for start in range(0, len(stale), 1000):
+        chunk = stale[start:start + 1000]
+        db.query(StoreStatusRollupSettings).filter(StoreStatusRollupSettings.store_id.in_(chunk)).delete(synchronize_session=False)
+        if rebuild:
+            db.query(StoreStatusHourlyRollup).filter(StoreStatusHourlyRollup.store_id.in_(chunk)).delete(synchronize_session=False)
+    if changed:
+        db.execute(insert(StoreStatusRollupSettings), [{"store_id": store_id, "settings_key": keys[store_id]} for store_id in changed])
+    if not rebuild or not changed:
+        return 0
+
+    # Every local day the store has logs on
+    affected_days = {}
+    for start in range(0, len(changed), 1000):
+        rows = db.query(
+            StoreStatusLog.store_id,
+            func.min(StoreStatusLog.timestamp_utc),
+            func.max(StoreStatusLog.timestamp_utc)
+        ).filter(StoreStatusLog.store_id.in_(changed[start:start + 1000])).group_by(StoreStatusLog.store_id)
+        for store_id, first_time, last_time in rows:
+            affected_days[store_id] = (to_epoch_us(first_time) // US_PER_DAY - 1, to_epoch_us(last_time) // US_PER_DAY + 1)
+    rebuild_store_days(db, affected_days, timezone, time_range_for_dayofweek, batch_size)
+    logger.info(f"Rebuilt the rollups of {len(changed)} stores whose settings changed")
+    return len(changed)
+
+def update_store_status_rollups(db: Session, timezone: Dict, time_range_for_dayofweek: Dict, batch_size: int = 2000, max_logs: int = 500000, settings_version: str = None) -> int:
+    """Fold logs newer than the rollup watermark into the hourly rollups.
+
+    Every (store, local day) touched by a new log is recomputed from its raw logs and its rows
+    replaced. At most max_logs new log ids are folded per call, in the same transaction that
+    moves the watermark. settings_version is the version the settings were loaded at (read
+    here if not given); when it differs from the one stored with the watermark, the stores
+    whose settings changed are rebuilt first (see rebuild_changed_stores). Returns the number
+    of log ids folded; 0 means the rollups are current.
+    """
+    try:
+        state = db.query(StoreStatusRollupState).with_for_update().first()
+        if not state:
+            state = StoreStatusRollupState(last_log_id=0)
+            db.add(state)
+        watermark = state.last_log_id or 0
+        settings_version = settings_version or get_settings_version(db)
+        if state.settings_version != settings_version:
+            rebuild_changed_stores(db, timezone, time_range_for_dayofweek, batch_size, rebuild=watermark > 0)
+            state.settings_version = settings_version
+
+        latest_log_id = db.query(func.max(StoreStatusLog.id)).scalar() or 0
+        if latest_log_id <= watermark:
+            db.commit()
+            return 0
+        upto_log_id = min(latest_log_id, watermark + max_logs)
+
+        # Step 1: stores and UTC days touched by the new logs
+        touched = db.query(
+            StoreStatusLog.store_id,
+            func.min(StoreStatusLog.timestamp_utc),
+            func.max(StoreStatusLog.timestamp_utc)
+        ).filter(
+            StoreStatusLog.id > watermark,
+            StoreStatusLog.id <= upto_log_id
+        ).group_by(StoreStatusLog.store_id).all()
+
+        # Local days are within a day of UTC days
+        affected_days = {
+            store_id: (to_epoch_us(first_time) // US_PER_DAY - 1, to_epoch_us(last_time) // US_PER_DAY + 1)
+            for store_id, first_time, last_time in touched
+            if store_id in timezone
+        }
+
+        # Step 2: recompute the affected days of each store batch from raw logs
+        rebuild_store_days(db, affected_days, timezone, time_range_for_dayofweek, batch_size)
+
+        state.last_log_id = upto_log_id
+        db.commit()
+        logger.info(f"Rolled up logs {watermark + 1}..{upto_log_id} for {len(affected_days)} stores")
+        return upto_log_id - watermark
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error updating store status rollups: {str(e)}")
+        raise e
+
+def bring_rollups_current(db: Session, timezone: Dict, time_range_for_dayofweek: Dict, batch_size: int = 2000, max_logs: int = 500000, settings_version: str = None) -> int:
+    folded = 0
+    while True:
+        folded_now = update_store_status_rollups(db, timezone, time_range_for_dayofweek, batch_size, max_logs, settings_version)
+        if not folded_now:
+            return folded
+        folded += folded_now
+
+def read_store_log_ranges(db: Session, ranges: Dict[str, Tuple[int, int]], chunk_stores: int = RANGE_QUERY_STORES) -> Dict[str, StoreLogs]:
+    """Logs of each store within its own [begin, end) range of epoch microseconds.
+
+    Every range is one range of the (store_id, timestamp_utc) index, OR-ed together
+    chunk_stores at a time, so only those hours are read instead of the scan of the widest
+    range that stream_store_logs makes. Stores without logs in their range are left out.
+    """
+    builders = {}
+    items = sorted(ranges.items())
+    try:
+        for start in range(0, len(items), chunk_stores):
+            rows = db.query(
+                StoreStatusLog.store_id,
+                StoreStatusLog.timestamp_utc,
+                StoreStatusLog.status
+            ).filter(or_(*(
+                and_(
+                    StoreStatusLog.store_id == store_id,
+                    StoreStatusLog.timestamp_utc >= from_epoch_us(begin),
+                    StoreStatusLog.timestamp_utc < from_epoch_us(end)
+                )
+                for store_id, (begin, end) in items[start:start + chunk_stores]
+            ))).order_by(StoreStatusLog.store_id, StoreStatusLog.timestamp_utc)
+            for store_id, timestamp_utc, status in rows:
+                builders.setdefault(store_id, StoreLogsBuilder()).append(timestamp_utc, status)
+        return {store_id: builder.build() for store_id, builder in builders.items()}
+    except Exception as e:
+        logger.error(f"Error reading store log ranges: {str(e)}")
+        raise e
+
+def sum_window_us(store_logs: List[StoreLogs], window_open: np.ndarray, window_close: np.ndarray) -> np.ndarray:
+    """(active, inactive) microseconds of each store's logs within its one business window.
+
+    The intervals are the reference algorithm's (see build_intervals), added up exactly.
+    """
+    totals = np.zeros((len(store_logs), 2), dtype=np.int64)
+    if not store_logs:
+        return totals
+    offsets = np.zeros(len(store_logs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(logs) for logs in store_logs])
+    intervals = build_intervals(
+        np.concatenate([logs.timestamps for logs in store_logs]),
+        np.concatenate([logs.statuses for logs in store_logs]),
+        offsets, window_open, window_close, np.arange(len(store_logs) + 1, dtype=np.int64)
+    )
+    counted = intervals["counted"]
+    interval_us = (intervals["end"] - intervals["begin"])[counted]
+    interval_store = intervals["store"][counted]
+    interval_active = intervals["active"][counted]
+    np.add.at(totals[:, 0], interval_store[interval_active], interval_us[interval_active])
+    np.add.at(totals[:, 1], interval_store[~interval_active], interval_us[~interval_active])
+    return totals
+
+def empty_store_logs() -> StoreLogs:
+    return StoreLogs(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint8))
+
+def compute_rollup_results(db: Session, latest_log_times: Dict[str, datetime], timezone: Dict, time_range_for_dayofweek: Dict, restrict_to_stores: bool = False) -> List[Dict]:
+    """Report results from the hourly rollups, reading raw logs only in boundary hours.
+
+    Days and weeks add up the integer microseconds of rollup rows (stores x 168). Raw logs
+    are read for two short spans per store:
+
+    - When the week starts inside the first day's business window, the reference counts
+      that day from opening time using the first log after the cut. The logs from the cut
+      to the UTC hour after next give that part of the day, its rows the rest (the whole
+      window is read only if no log falls in those hours).
+    - The last hour comes from the logs of its UTC hours, starting from the status in effect
+      at the first of them (last_status of the row before), which reproduces the reference.
+
+    Day and week totals are exact. The python and numpy engines add float minutes, so a
+    total sitting exactly on a half hour (e.g. a 6.5 hour business day in one status) can
+    round the other way there.
+    """
+    if not latest_log_times:
+        return []
+
+    try:
+        store_ids = list(latest_log_times)
+        epoch_date = EPOCH.date()
+        first_dates = {}
+        last_dates = {}
+        # Rows of the first day from this hour on count; stores with none counting are left out
+        first_day_from = {}
+        # (cut, open, close, split) of first-day windows the week starts inside
+        partial_days = {}
+        # UTC hours [begin, end) read for the last hour, and the report end inside them
+        hour_ranges = {}
+        report_ends = {}
+        for store_id, last_time in latest_log_times.items():
+            store_timezone = timezone[store_id]["timeZone"]
+            time_range = time_range_for_dayofweek[store_id]
+
+            week_start = get_week_start(last_time)
+            cut = to_epoch_us(week_start)
+            first_date = pytz.utc.localize(week_start).astimezone(pytz.timezone(store_timezone)).date()
+            first_dates[store_id] = first_date
+            first_day = (first_date - epoch_date).days
+            opens, closes, _ = build_business_windows(time_range, store_timezone, first_day, first_day)
+            window_open, window_close = int(opens[0]), int(closes[0])
+            if cut <= window_open:
+                first_day_from[store_id] = EPOCH
+            elif cut <= window_close:
+                split = (cut // US_PER_HOUR + 2) * US_PER_HOUR
+                partial_days[store_id] = (cut, window_open, window_close, split)
+                first_day_from[store_id] = from_epoch_us(split)
+
+            # Same report end as UptimeBatch.add_store
+            last_day = to_epoch_us(last_time) // US_PER_DAY
+            last_dates[store_id] = epoch_date + timedelta(days=int(last_day))
+            last_day_hours = time_range.get(last_time.weekday(), DEFAULT_HOURS)
+            report_end = localize_to_epoch_us(store_timezone, int(last_day), f"{last_day_hours['end_time']}")
+            report_ends[store_id] = report_end
+            hour_ranges[store_id] = (
+                (report_end - US_PER_HOUR) // US_PER_HOUR * US_PER_HOUR,
+                (report_end // US_PER_HOUR + 1) * US_PER_HOUR
+            )
+
+        # Step 1: whole days from the rollups, plus the statuses at the edges of the last hour
+        totals = {store_id: [0, 0, 0, 0] for store_id in store_ids}
+        first_day_us = {store_id: [0, 0] for store_id in store_ids}
+        edge_hours = {
+            store_id: (from_epoch_us(begin - US_PER_HOUR), from_epoch_us(end - US_PER_HOUR))
+            for store_id, (begin, end) in hour_ranges.items()
+        }
+        edge_statuses = {}
+        query = db.query(
+            StoreStatusHourlyRollup.store_id,
+            StoreStatusHourlyRollup.local_date,
+            StoreStatusHourlyRollup.hour_start_utc,
+            StoreStatusHourlyRollup.active_us,
+            StoreStatusHourlyRollup.inactive_us,
+            StoreStatusHourlyRollup.last_status
+        ).filter(
+            StoreStatusHourlyRollup.local_date >= min(first_dates.values())
+        )
+        if restrict_to_stores:
+            query = query.filter(StoreStatusHourlyRollup.store_id.in_(store_ids))
+
+        for store_id, local_date, hour_start_utc, active_us, inactive_us, last_status in query.yield_per(10000):
+            store_totals = totals.get(store_id)
+            if store_totals is None:
+                continue
+            if hour_start_utc in edge_hours[store_id]:
+                edge_statuses[(store_id, local_date, hour_start_utc)] = last_status
+            first_date = first_dates[store_id]
+            if local_date > first_date:
+                store_totals[2] += active_us
+                store_totals[3] += inactive_us
+                if local_date == last_dates[store_id]:
+                    store_totals[0] += active_us
+                    store_totals[1] += inactive_us
+            elif local_date == first_date and store_id in first_day_from and hour_start_utc >= first_day_from[store_id]:
+                first_day_us[store_id][0] += active_us
+                first_day_us[store_id][1] += inactive_us
+
+        # Step 2: the first day up to its split hour from the logs after the cut
+        partial_logs = read_store_log_ranges(db, {
+            store_id: (cut, min(window_close, split) + 1)
+            for store_id, (cut, window_open, window_close, split) in partial_days.items()
+        })
+        # Without a log before the split hour the first one after the cut is further on
+        whole_days = {
+            store_id: (cut, window_close + 1)
+            for store_id, (cut, window_open, window_close, split) in partial_days.items()
+            if store_id not in partial_logs and window_close > split
+        }
+        partial_logs.update(read_store_log_ranges(db, whole_days))
+        partial_ids = list(partial_days)
+        partial_us = sum_window_us(
+            [partial_logs.get(store_id, empty_store_logs()) for store_id in partial_ids],
+            np.array([partial_days[store_id][1] for store_id in partial_ids], dtype=np.int64),
+            np.array([
+                partial_days[store_id][2] if store_id in whole_days else min(partial_days[store_id][2], partial_days[store_id][3])
+                for store_id in partial_ids
+            ], dtype=np.int64)
+        )
+        for store_id, (active_us, inactive_us) in zip(partial_ids, partial_us.tolist()):
+            if store_id in whole_days:
+                first_day_us[store_id] = [0, 0]
+            first_day_us[store_id][0] += active_us
+            first_day_us[store_id][1] += inactive_us
+
+        # Step 3: the last hour from the logs of its UTC hours. A window open before them
+        # starts from its status then; one opening inside them without a log before their
+        # end gets its first log's status (the last_status of the last row) at their end.
+        hour_logs = read_store_log_ranges(db, hour_ranges)
+        batch = UptimeBatch()
+        for store_id in store_ids:
+            store_timezone = timezone[store_id]["timeZone"]
+            time_range = time_range_for_dayofweek[store_id]
+            begin, end = hour_ranges[store_id]
+            store_logs = hour_logs.get(store_id, empty_store_logs())
+            timestamps, statuses = store_logs.timestamps, store_logs.statuses
+            last_day = (last_dates[store_id] - epoch_date).days
+            opens, closes, days = build_business_windows(time_range, store_timezone, last_day - 1, last_day + 1)
+            for window_open, window_close, day in zip(opens.tolist(), closes.tolist(), days.tolist()):
+                local_date = epoch_date + timedelta(days=day)
+                if window_open < begin < window_close:
+                    status = edge_statuses.get((store_id, local_date, edge_hours[store_id][0]))
+                    if status is not None:
+                        timestamps = np.r_[np.int64(begin), timestamps]
+                        statuses = np.r_[np.uint8(status is StoreStatus.active), statuses]
+                elif begin <= window_open <= report_ends[store_id] and window_close >= end and not np.any(timestamps >= window_open):
+                    status = edge_statuses.get((store_id, local_date, edge_hours[store_id][1]))
+                    if status is not None:
+                        timestamps = np.r_[timestamps, np.int64(end)]
+                        statuses = np.r_[statuses, np.uint8(status is StoreStatus.active)]
+            batch.add_store(
+                store_id, StoreLogs(timestamps.astype(np.int64), statuses.astype(np.uint8)), latest_log_times[store_id],
+                store_timezone, time_range, window_days=(last_day - 1, last_day + 1)
+            )
+        hour_minutes = batch.compute_minutes()[:, :2]
+
+        result = []
+        for store_id, (uptime_hour, downtime_hour) in zip(store_ids, hour_minutes.tolist()):
+            uptime_day, downtime_day, uptime_week, downtime_week = totals[store_id]
+            uptime_week += first_day_us[store_id][0]
+            downtime_week += first_day_us[store_id][1]
+            result.append(format_store_result(store_id, (
+                uptime_hour, downtime_hour,
+                uptime_day / US_PER_MINUTE, downtime_day / US_PER_MINUTE,
+                uptime_week / US_PER_MINUTE, downtime_week / US_PER_MINUTE
+            )))
+        return result
+    except Exception as e:
+        logger.error(f"Error computing results from rollups: {str(e)}")
+        raise e
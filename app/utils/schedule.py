@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+import logging
+import numpy as np
+import pytz
+
+logger = logging.getLogger(__name__)
+
+# Compiled schedules are UTC epoch microseconds, like the rest of the uptime engine
+US_PER_SECOND = 1_000_000
+US_PER_DAY = 86400 * US_PER_SECOND
+EPOCH = datetime(1970, 1, 1)
+
+DEFAULT_HOURS = {
+    "start_time": "00:00:00",
+    "end_time": "23:59:59"
+}
+
+ScheduleKey = Tuple[Tuple[int, str, str], ...]
+
+def schedule_key(time_range: Dict) -> ScheduleKey:
+    """Hashable form of a store's day-of-week hours; stores with equal keys share compiled schedules."""
+    return tuple(
+        (day_of_week, f"{hours['start_time']}", f"{hours['end_time']}")
+        for day_of_week, hours in sorted(time_range.items())
+    )
+
+def epoch_day_weekday(epoch_day: int) -> int:
+    # 1970-01-01 was a Thursday (weekday 3)
+    return (epoch_day + 3) % 7
+
+def epoch_day_week(epoch_day: int) -> int:
+    # Monday-aligned week number, so one compiled week maps onto one set of seven rows
+    return (epoch_day + 3) // 7
+
+@lru_cache(maxsize=65536)
+def localize_to_epoch_us(timezone_str: str, epoch_day: int, time_str: str) -> int:
+    # Same string round trip as the reference so DST gaps/folds resolve identically
+    date_str = (EPOCH + timedelta(days=epoch_day)).strftime("%Y-%m-%d")
+    local_dt = pytz.timezone(timezone_str).localize(datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M:%S"))
+    delta = local_dt.astimezone(pytz.utc).replace(tzinfo=None) - EPOCH
+    return (delta.days * 86400 + delta.seconds) * US_PER_SECOND + delta.microseconds
+
+@lru_cache(maxsize=16384)
+def compile_week(timezone_str: str, key: ScheduleKey, week: int, overnight: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """UTC (open, close, local day) arrays for the seven local days of one Monday-aligned week.
+
+    Open and close times are localized per day, so DST transitions inside the week shift
+    only the days after them. With overnight=False a day whose end time is before its start
+    time gets an empty window (close < open), as in get_uptime_downtime_for_store; with
+    overnight=True it closes at the end time of the following local day instead.
+    The arrays are shared between callers and therefore read-only.
+    """
+    hours_by_day = {day_of_week: (start_time, end_time) for day_of_week, start_time, end_time in key}
+    days = np.arange(week * 7 - 3, week * 7 + 4, dtype=np.int64)
+    opens = np.empty(7, dtype=np.int64)
+    closes = np.empty(7, dtype=np.int64)
+
+    for i, epoch_day in enumerate(days.tolist()):
+        start_time, end_time = hours_by_day.get(epoch_day_weekday(epoch_day), (DEFAULT_HOURS["start_time"], DEFAULT_HOURS["end_time"]))
+        opens[i] = localize_to_epoch_us(timezone_str, epoch_day, start_time)
+        close_day = epoch_day + 1 if overnight and end_time < start_time else epoch_day
+        closes[i] = localize_to_epoch_us(timezone_str, close_day, end_time)
+
+    for array in (opens, closes, days):
+        array.setflags(write=False)
+    return opens, closes, days
+
+class CompiledSchedule:
+    """Business-hour windows of one store over a range of local days, as sorted UTC epochs.
+
+    Membership is a binary search over the window opens instead of a timezone conversion
+    and two strptime/localize calls per log.
+    """
+
+    def __init__(self, opens: np.ndarray, closes: np.ndarray, days: np.ndarray):
+        self.opens = opens
+        self.closes = closes
+        self.days = days
+
+    def __len__(self):
+        return len(self.days)
+
+    def window_index(self, timestamps_us: np.ndarray) -> np.ndarray:
+        """Index of the window containing each timestamp (inclusive at both ends), or -1.
+
+        Where an overnight window runs into the next day's window the later one wins.
+        """
+        index = np.searchsorted(self.opens, timestamps_us, side="right") - 1
+        inside = index >= 0
+        inside[inside] &= timestamps_us[inside] <= self.closes[index[inside]]
+        return np.where(inside, index, -1)
+
+    def local_day(self, timestamp_us: int) -> Optional[int]:
+        """Local epoch day of the window containing timestamp_us, or None outside business hours."""
+        index = int(np.searchsorted(self.opens, timestamp_us, side="right")) - 1
+        if index < 0 or timestamp_us > self.closes[index]:
+            return None
+        return int(self.days[index])
+
+def compile_schedule(time_range: Dict, timezone_str: str, first_day: int, last_day: int, overnight: bool = False) -> CompiledSchedule:
+    """Compile a store's hours into UTC windows for every local day in [first_day, last_day].
+
+    Weeks are compiled once per (timezone, schedule, week) and shared by every store with
+    the same hours and timezone.
+    """
+    if last_day < first_day:
+        empty = np.empty(0, dtype=np.int64)
+        return CompiledSchedule(empty, empty, empty)
+
+    key = schedule_key(time_range)
+    weeks = [
+        compile_week(timezone_str, key, week, overnight)
+        for week in range(epoch_day_week(first_day), epoch_day_week(last_day) + 1)
+    ]
+    # Slice the first and last compiled weeks down to the requested days
+    skip = first_day - int(weeks[0][2][0])
+    count = last_day - first_day + 1
+    if len(weeks) == 1:
+        opens, closes, days = (array[skip:skip + count] for array in weeks[0])
+    else:
+        opens, closes, days = (np.concatenate([week[i] for week in weeks])[skip:skip + count] for i in range(3))
+    return CompiledSchedule(opens, closes, days)
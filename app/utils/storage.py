@@ -0,0 +1,225 @@
+from functools import lru_cache
+from typing import BinaryIO, Optional
+import io
+import logging
+import os
+import tempfile
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+S3_SCHEME = "s3://"
+# S3 rejects multipart parts below 5 MiB, except the last one
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+# Reports read back from S3 spill to a temporary file above this size
+S3_READ_SPOOL_SIZE = 64 * 1024 * 1024
+
+class StorageSink(io.RawIOBase):
+    """Binary stream a report is written to; nothing is visible at its location until commit().
+
+    abort() discards whatever was written. close() alone neither commits nor aborts.
+    """
+
+    def writable(self):
+        return True
+
+    def commit(self) -> str:
+        raise NotImplementedError
+
+    def abort(self):
+        raise NotImplementedError
+
+class LocalFileSink(StorageSink):
+    # Written next to the target and renamed over it, so readers never see half a report
+    def __init__(self, filename: str):
+        super().__init__()
+        self.filename = filename
+        self._tmp_filename = f"{filename}.tmp"
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        self._file = open(self._tmp_filename, "wb")
+
+    def write(self, data) -> int:
+        return self._file.write(data)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def commit(self) -> str:
+        self._file.close()
+        os.replace(self._tmp_filename, self.filename)
+        return self.filename
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_filename):
+            os.remove(self._tmp_filename)
+
+class S3MultipartSink(StorageSink):
+    """Streams a report to S3 in parts of part_size bytes while it is being written.
+
+    Only one part is buffered in memory. The object appears on commit(), when the multipart
+    upload is completed; abort() cancels the upload so no parts are left behind.
+    """
+
+    def __init__(self, client, bucket: str, key: str, part_size: int, content_type: str):
+        super().__init__()
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, S3_MIN_PART_SIZE)
+        self._upload_id = client.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)["UploadId"]
+        self._parts = []
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def _upload_part(self, body: bytes):
+        part_number = len(self._parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=part_number, Body=body
+        )
+        self._parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+
+    def commit(self) -> str:
+        if self._buffer or not self._parts:
+            self._upload_part(bytes(self._buffer))
+            self._buffer.clear()
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, MultipartUpload={"Parts": self._parts}
+        )
+        return f"{S3_SCHEME}{self.bucket}/{self.key}"
+
+    def abort(self):
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        except Exception as e:
+            logger.warning(f"Could not abort upload of s3://{self.bucket}/{self.key}: {str(e)}")
+
+class LocalStorage:
+    """Reports on the local filesystem; their location is the file path."""
+
+    name = "local"
+
+    def open_sink(self, path: str, content_type: str = "application/octet-stream") -> StorageSink:
+        return LocalFileSink(path)
+
+    def exists(self, location: str) -> bool:
+        return os.path.exists(location)
+
+    def open_read(self, location: str) -> BinaryIO:
+        return open(location, "rb")
+
+    def delete(self, location: str):
+        if os.path.exists(location):
+            os.remove(location)
+
+    def download_url(self, location: str, filename: str, content_type: str) -> Optional[str]:
+        # Local files are served by the API (GET /api/download_report)
+        return None
+
+class S3Storage:
+    """Reports in an S3-compatible bucket (AWS, MinIO, ...); their location is s3://bucket/key.
+
+    Downloads are presigned GET URLs, so report bytes never pass through the API.
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", part_size: int = 8 * 1024 * 1024, url_expires: int = 3600, client=None, **client_options):
+        if not bucket:
+            raise ValueError("S3 report storage needs S3_BUCKET_NAME")
+        if client is None:
+            # boto3 is only needed for S3 storage
+            try:
+                import boto3
+            except ImportError as e:
+                raise RuntimeError("S3 report storage needs boto3 (pip install boto3)") from e
+            client = boto3.client("s3", **{option: value for option, value in client_options.items() if value})
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+        self.url_expires = url_expires
+
+    def split_location(self, location: str):
+        bucket, _, key = location[len(S3_SCHEME):].partition("/")
+        return bucket, key
+
+    def open_sink(self, path: str, content_type: str = "application/octet-stream") -> StorageSink:
+        return S3MultipartSink(self.client, self.bucket, f"{self.prefix}{path}", self.part_size, content_type)
+
+    def exists(self, location: str) -> bool:
+        from botocore.exceptions import ClientError
+        bucket, key = self.split_location(location)
+        try:
+            self.client.head_object(Bucket=bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete(self, location: str):
+        bucket, key = self.split_location(location)
+        self.client.delete_object(Bucket=bucket, Key=key)
+
+    def open_read(self, location: str) -> BinaryIO:
+        # Downloaded into a seekable file, which parquet needs
+        bucket, key = self.split_location(location)
+        file = tempfile.SpooledTemporaryFile(max_size=S3_READ_SPOOL_SIZE)
+        try:
+            self.client.download_fileobj(bucket, key, file)
+        except Exception:
+            file.close()
+            raise
+        file.seek(0)
+        return file
+
+    def download_url(self, location: str, filename: str, content_type: str) -> Optional[str]:
+        bucket, key = self.split_location(location)
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": bucket,
+                "Key": key,
+                "ResponseContentDisposition": f'attachment; filename="{filename}"',
+                "ResponseContentType": content_type,
+            },
+            ExpiresIn=self.url_expires,
+        )
+
+@lru_cache(maxsize=None)
+def get_report_storage(name: str = None):
+    """Storage new reports are written to (REPORT_STORAGE), one instance per process."""
+    name = name or settings.REPORT_STORAGE
+    if name == "local":
+        return LocalStorage()
+    if name == "s3":
+        return S3Storage(
+            settings.S3_BUCKET_NAME,
+            prefix=settings.S3_REPORT_PREFIX,
+            part_size=settings.S3_MULTIPART_PART_SIZE_MB * 1024 * 1024,
+            url_expires=settings.REPORT_URL_EXPIRES_SECONDS,
+            region_name=settings.AWS_REGION,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+        )
+    raise ValueError(f"Unknown report storage {name}, expected local or s3")
+
+def get_location_storage(location: str):
+    # Reports keep the storage they were written to, even after REPORT_STORAGE changes
+    return get_report_storage("s3" if location.startswith(S3_SCHEME) else "local")
+
+def report_file_exists(location: str) -> bool:
+    return bool(location) and get_location_storage(location).exists(location)
@@ -0,0 +1,278 @@
+from datetime import datetime
+from typing import Dict, List, Tuple
+import logging
+import numpy as np
+import pytz
+from app.utils.schedule import EPOCH, US_PER_DAY, US_PER_SECOND, compile_schedule, localize_to_epoch_us
+from app.utils.store_logs import StoreLogs
+
+logger = logging.getLogger(__name__)
+
+# All engine timestamps are UTC epoch microseconds held in int64 arrays. Microseconds
+# (rather than float seconds) keep every difference exact, so interval lengths come out
+# bit-for-bit the same as timedelta.total_seconds() in get_uptime_downtime_for_store.
+
+METRICS = (
+    "uptime_last_hour",
+    "downtime_last_hour",
+    "uptime_last_day",
+    "downtime_last_day",
+    "uptime_last_week",
+    "downtime_last_week",
+)
+
+def to_epoch_us(dt: datetime) -> int:
+    # Naive datetimes are treated as UTC, like StoreStatusLog.timestamp_utc
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(pytz.utc).replace(tzinfo=None)
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * US_PER_SECOND + delta.microseconds
+
+def to_epoch_us_array(timestamps: List[str]) -> np.ndarray:
+    # ISO strings are parsed in C by numpy instead of one fromisoformat per log
+    return np.array(timestamps, dtype="datetime64[us]").astype(np.int64)
+
+def build_business_windows(time_range: Dict, timezone_str: str, first_day: int, last_day: int):
+    """Return (open_us, close_us, local_day) arrays for every local day in [first_day, last_day]."""
+    # Same-day windows, as the reference: hours ending before they start count as closed
+    schedule = compile_schedule(time_range, timezone_str, first_day, last_day)
+    return schedule.opens, schedule.closes, schedule.days
+
+def _sequential_segment_sum(values: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    # Sum each segment strictly left to right (not pairwise) so the floating point
+    # result matches the reference's running "+=" totals exactly
+    totals = np.zeros((len(starts), values.shape[1]))
+    live = np.arange(len(starts))
+    for k in range(int(counts.max()) if len(counts) else 0):
+        live = live[counts[live] > k]
+        totals[live] += values[starts[live] + k]
+    return totals
+
+def build_intervals(timestamps: np.ndarray, statuses: np.ndarray, offsets: np.ndarray,
+                    window_open: np.ndarray, window_close: np.ndarray, window_offsets: np.ndarray) -> Dict[str, np.ndarray]:
+    """Turn the logs of many stores into the business-hour intervals the reference sums up.
+
+    timestamps/statuses hold the logs of all stores concatenated (sorted per store, status 1 =
+    active) with store s owning timestamps[offsets[s]:offsets[s + 1]]. Business windows are
+    concatenated the same way through window_offsets and must be sorted by open time.
+    Intervals are returned per store in the order the reference adds them up.
+    """
+    n_stores = len(offsets) - 1
+    n_logs = len(timestamps)
+    n_windows = len(window_open)
+    intervals = {
+        "begin": np.empty(0, dtype=np.int64),
+        "end": np.empty(0, dtype=np.int64),
+        "active": np.empty(0, dtype=bool),
+        "store": np.empty(0, dtype=np.int64),
+        "window": np.empty(0, dtype=np.int64),
+        "counted": np.empty(0, dtype=bool),
+    }
+    if n_logs == 0 or n_windows == 0:
+        return intervals
+
+    store_of_log = np.repeat(np.arange(n_stores), np.diff(offsets))
+    store_of_window = np.repeat(np.arange(n_stores), np.diff(window_offsets))
+
+    # Step 1: find the last window opening at or before each log (per store) with one lexsort
+    order = np.lexsort((
+        np.concatenate([np.zeros(n_windows, dtype=np.int8), np.ones(n_logs, dtype=np.int8)]),
+        np.concatenate([window_open, timestamps]),
+        np.concatenate([store_of_window, store_of_log]),
+    ))
+    is_window = order < n_windows
+    windows_seen = np.cumsum(is_window)
+    candidate = np.empty(n_logs, dtype=np.int64)
+    candidate[order[~is_window] - n_windows] = windows_seen[~is_window] - 1
+
+    # Step 2: keep logs inside business hours (open <= ts <= close, like is_within_business_hours)
+    has_window = candidate >= window_offsets[store_of_log]
+    candidate = np.where(has_window, candidate, 0)
+    keep = has_window & (timestamps <= window_close[candidate])
+
+    ts = timestamps[keep]
+    active = statuses[keep].astype(bool)
+    window = candidate[keep]
+    store = store_of_log[keep]
+    n_kept = len(ts)
+    if n_kept == 0:
+        return intervals
+
+    group_start = np.ones(n_kept, dtype=bool)
+    group_start[1:] = window[1:] != window[:-1]
+    group_end = np.ones(n_kept, dtype=bool)
+    group_end[:-1] = group_start[1:]
+
+    # Step 3: lay out intervals in the reference order: per day, the gap from opening time to
+    # the first log, then each log up to the next log (or to closing time for the last one)
+    groups_so_far = np.cumsum(group_start)
+    n_intervals = n_kept + int(groups_so_far[-1])
+    log_pos = np.arange(n_kept) + groups_so_far
+    first_pos = log_pos[group_start] - 1
+
+    begin = np.empty(n_intervals, dtype=np.int64)
+    end = np.empty(n_intervals, dtype=np.int64)
+    interval_active = np.empty(n_intervals, dtype=bool)
+    interval_store = np.empty(n_intervals, dtype=np.int64)
+    interval_window = np.empty(n_intervals, dtype=np.int64)
+    counted = np.ones(n_intervals, dtype=bool)
+
+    next_ts = np.empty(n_kept, dtype=np.int64)
+    next_ts[:-1] = ts[1:]
+    begin[log_pos] = ts
+    end[log_pos] = np.where(group_end, window_close[window], next_ts)
+    interval_active[log_pos] = active
+    interval_store[log_pos] = store
+    interval_window[log_pos] = window
+
+    begin[first_pos] = window_open[window[group_start]]
+    end[first_pos] = ts[group_start]
+    interval_active[first_pos] = active[group_start]
+    interval_store[first_pos] = store[group_start]
+    interval_window[first_pos] = window[group_start]
+    # The opening gap only counts when the first log is after opening time
+    counted[first_pos] = end[first_pos] > begin[first_pos]
+
+    intervals.update(
+        begin=begin,
+        end=end,
+        active=interval_active,
+        store=interval_store,
+        window=interval_window,
+        counted=counted,
+    )
+    return intervals
+
+def compute_store_minutes(timestamps: np.ndarray, statuses: np.ndarray, offsets: np.ndarray,
+                          window_open: np.ndarray, window_close: np.ndarray, window_day: np.ndarray,
+                          window_offsets: np.ndarray, last_dates: np.ndarray, last_days: np.ndarray) -> np.ndarray:
+    """Vectorized equivalent of get_uptime_downtime_for_store for many stores at once.
+
+    Inputs are laid out as for build_intervals; window_day is the local day (days since the
+    epoch) of each window. Returns an (n_stores, 6) array of unrounded minutes in METRICS order.
+    """
+    n_stores = len(offsets) - 1
+    totals = np.zeros((n_stores, len(METRICS)))
+
+    intervals = build_intervals(timestamps, statuses, offsets, window_open, window_close, window_offsets)
+    begin = intervals["begin"]
+    end = intervals["end"]
+    interval_active = intervals["active"]
+    interval_store = intervals["store"]
+    interval_window = intervals["window"]
+    counted = intervals["counted"]
+    n_intervals = len(begin)
+    if n_intervals == 0:
+        return totals
+
+    # Step 4: clip intervals against the last hour / last day / week windows
+    minutes = (end - begin).astype(np.float64) / US_PER_SECOND / 60
+    last_date = last_dates[interval_store]
+    hour_start = last_date - 3600 * US_PER_SECOND
+    overlap_start = np.maximum(begin, hour_start)
+    overlap_end = np.minimum(end, last_date)
+    in_hour = counted & (overlap_end > overlap_start)
+    hour_minutes = (overlap_end - overlap_start).astype(np.float64) / US_PER_SECOND / 60
+    in_day = counted & (window_day[interval_window] == last_days[interval_store])
+
+    values = np.zeros((n_intervals, len(METRICS)))
+    values[:, 0] = np.where(in_hour & interval_active, hour_minutes, 0.0)
+    values[:, 1] = np.where(in_hour & ~interval_active, hour_minutes, 0.0)
+    values[:, 2] = np.where(in_day & interval_active, minutes, 0.0)
+    values[:, 3] = np.where(in_day & ~interval_active, minutes, 0.0)
+    values[:, 4] = np.where(counted & interval_active, minutes, 0.0)
+    values[:, 5] = np.where(counted & ~interval_active, minutes, 0.0)
+
+    # Step 5: per-store totals
+    present = np.unique(interval_store)
+    starts = np.searchsorted(interval_store, present, side="left")
+    counts = np.searchsorted(interval_store, present, side="right") - starts
+    totals[present] = _sequential_segment_sum(values, starts, counts)
+    return totals
+
+def format_store_result(store_id: str, minutes) -> Dict:
+    # Same units and rounding as get_uptime_downtime_for_store
+    uptime_hour, downtime_hour, uptime_day, downtime_day, uptime_week, downtime_week = (float(m) for m in minutes)
+    return {
+        "store_id": store_id,
+        "uptime_last_hour": int(uptime_hour),
+        "downtime_last_hour": int(downtime_hour),
+        "uptime_last_day": round(uptime_day/60),
+        "downtime_last_day": round(downtime_day/60),
+        "uptime_last_week": round(uptime_week/60),
+        "downtime_last_week": round(downtime_week/60),
+    }
+
+class UptimeBatch:
+    """Collects stores for one compute_store_minutes call."""
+
+    def __init__(self):
+        self.store_ids = []
+        self.timestamps = []
+        self.statuses = []
+        self.windows = []
+        self.last_dates = []
+        self.last_days = []
+
+    def __len__(self):
+        return len(self.store_ids)
+
+    def add_store(self, store_id: str, store_logs: StoreLogs, last_store_log_time: datetime, store_timezone: str, time_range: Dict, window_days: Tuple[int, int] = None):
+        timestamps = store_logs.timestamps
+        statuses = store_logs.statuses
+
+        if window_days:
+            first_day, last_day = window_days
+        else:
+            # Local days of the logs are within one day of their UTC days
+            first_day = int(timestamps[0] // US_PER_DAY) - 1 if len(timestamps) else 0
+            last_day = int(timestamps[-1] // US_PER_DAY) + 1 if len(timestamps) else -1
+
+        # The report ends at the closing time of the last log's UTC date and weekday
+        last_log_us = to_epoch_us(last_store_log_time)
+        last_log_day = last_log_us // US_PER_DAY
+        last_day_hours = time_range.get(last_store_log_time.weekday(), {
+            "end_time": "23:59:59"
+        })
+
+        self.store_ids.append(store_id)
+        self.timestamps.append(timestamps)
+        self.statuses.append(statuses)
+        self.windows.append(build_business_windows(time_range, store_timezone, first_day, last_day))
+        self.last_dates.append(localize_to_epoch_us(store_timezone, last_log_day, f"{last_day_hours['end_time']}"))
+        self.last_days.append(last_log_day)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        # Concatenated engine inputs, in the layout compute_store_minutes expects
+        offsets = np.zeros(len(self.store_ids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(t) for t in self.timestamps])
+        window_offsets = np.zeros(len(self.store_ids) + 1, dtype=np.int64)
+        window_offsets[1:] = np.cumsum([len(w[0]) for w in self.windows])
+
+        return {
+            "timestamps": np.concatenate(self.timestamps),
+            "statuses": np.concatenate(self.statuses),
+            "offsets": offsets,
+            "window_open": np.concatenate([w[0] for w in self.windows]),
+            "window_close": np.concatenate([w[1] for w in self.windows]),
+            "window_day": np.concatenate([w[2] for w in self.windows]),
+            "window_offsets": window_offsets,
+            "last_dates": np.array(self.last_dates, dtype=np.int64),
+            "last_days": np.array(self.last_days, dtype=np.int64),
+        }
+
+    def compute_minutes(self) -> np.ndarray:
+        if not self.store_ids:
+            return np.zeros((0, len(METRICS)))
+        return compute_store_minutes(**self.arrays())
+
+    def compute(self) -> List[Dict]:
+        if not self.store_ids:
+            return []
+
+        try:
+            minutes = self.compute_minutes()
+            return [format_store_result(store_id, row) for store_id, row in zip(self.store_ids, minutes)]
+        except Exception as e:
+            logger.error(f"Error computing uptime batch: {str(e)}")
+            raise e
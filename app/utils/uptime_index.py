@@ -0,0 +1,161 @@
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import re
+import numpy as np
+import pytz
+from app.utils.schedule import US_PER_DAY, US_PER_SECOND, compile_schedule, localize_to_epoch_us
+from app.utils.store_logs import StoreLogs
+from app.utils.uptime_engine import build_intervals, to_epoch_us
+
+# Custom report windows must fit in the one-week lookback the report reads logs for
+MAX_WINDOW_HOURS = 7 * 24
+MAX_WINDOW_DAYS_BACK = 6
+
+WINDOW_SPEC = re.compile(
+    r"^(?P<name>[a-z][a-z0-9_]{0,39})="
+    r"(?:(?P<amount>\d+)(?P<unit>[hm])"
+    r"|(?P<day_offset>0|-\d)d(?:@(?P<start>\d{2}:\d{2})-(?P<end>\d{2}:\d{2}))?)$"
+)
+
+class ReportWindow(NamedTuple):
+    """A window relative to a store's latest log.
+
+    Either the trailing `minutes` up to the latest log, or local day `day_offset` (0 is the
+    day of the latest log, -1 the day before) from start_time to end_time local time.
+    """
+    name: str
+    minutes: Optional[int] = None
+    day_offset: int = 0
+    start_time: str = "00:00:00"
+    end_time: Optional[str] = None
+
+def parse_report_window(spec: str) -> ReportWindow:
+    """Parse NAME=SPEC where SPEC is 3h / 90m (trailing), -1d (a whole local day) or -1d@12:00-18:00.
+
+    Raises ValueError for anything else.
+    """
+    match = WINDOW_SPEC.match(spec.strip())
+    if not match:
+        raise ValueError(f"Invalid window {spec!r}, expected e.g. last_3_hours=3h, yesterday=-1d or yesterday_afternoon=-1d@12:00-18:00")
+
+    name = match["name"]
+    if match["amount"]:
+        minutes = int(match["amount"]) * (60 if match["unit"] == "h" else 1)
+        if not 0 < minutes <= MAX_WINDOW_HOURS * 60:
+            raise ValueError(f"Window {name} must be between 1 minute and {MAX_WINDOW_HOURS} hours")
+        return ReportWindow(name, minutes=minutes)
+
+    day_offset = int(match["day_offset"])
+    if day_offset < -MAX_WINDOW_DAYS_BACK:
+        raise ValueError(f"Window {name} must be within the last {MAX_WINDOW_DAYS_BACK} days")
+    if not match["start"]:
+        return ReportWindow(name, day_offset=day_offset)
+
+    start_time, end_time = f"{match['start']}:00", f"{match['end']}:00"
+    for value in (start_time, end_time):
+        datetime.strptime(value, "%H:%M:%S")
+    if end_time <= start_time:
+        raise ValueError(f"Window {name} must end after it starts")
+    return ReportWindow(name, day_offset=day_offset, start_time=start_time, end_time=end_time)
+
+def parse_report_windows(specs: Optional[List[str]]) -> List[ReportWindow]:
+    windows = [parse_report_window(spec) for spec in specs or []]
+    names = [window.name for window in windows]
+    if len(set(names)) != len(names):
+        raise ValueError("Window names must be unique")
+    return windows
+
+def window_fields(windows: List[ReportWindow]) -> List[str]:
+    # Result keys (and report columns) added by the windows, in minutes
+    return [f"{kind}_{window.name}" for window in windows for kind in ("uptime", "downtime")]
+
+def window_bounds(window: ReportWindow, last_store_log_time: datetime, store_timezone: str) -> Tuple[int, int]:
+    """UTC epoch microsecond [start, end) of a window for a store whose latest log is last_store_log_time."""
+    last_log_us = to_epoch_us(last_store_log_time)
+    if window.minutes is not None:
+        return last_log_us - window.minutes * 60 * US_PER_SECOND, last_log_us
+
+    local_date = pytz.utc.localize(last_store_log_time).astimezone(pytz.timezone(store_timezone)).date()
+    epoch_day = (local_date - datetime(1970, 1, 1).date()).days + window.day_offset
+    start_us = localize_to_epoch_us(store_timezone, epoch_day, window.start_time)
+    if window.end_time is None:
+        return start_us, localize_to_epoch_us(store_timezone, epoch_day + 1, "00:00:00")
+    return start_us, localize_to_epoch_us(store_timezone, epoch_day, window.end_time)
+
+class UptimeIndex:
+    """Cumulative business-hour uptime and downtime of one store at every status change.
+
+    Built once from the store's logs and business hours: the intervals the report adds up
+    (see build_intervals) are laid end to end with the active and inactive time before
+    each of them, so the uptime of any window is two binary searches instead of a pass
+    over the logs. Time outside business hours, or in business hours without logs, counts
+    as neither.
+    """
+
+    def __init__(self, begin: np.ndarray, end: np.ndarray, active: np.ndarray):
+        self.begin = begin
+        self.end = end
+        self.active = active
+        lengths = end - begin
+        self.active_before = np.concatenate([[0], np.cumsum(np.where(active, lengths, 0))])
+        self.inactive_before = np.concatenate([[0], np.cumsum(np.where(active, 0, lengths))])
+
+    def __len__(self):
+        return len(self.begin)
+
+    @classmethod
+    def build(cls, store_logs: StoreLogs, store_timezone: str, time_range: Dict) -> "UptimeIndex":
+        timestamps = store_logs.timestamps
+        statuses = store_logs.statuses
+        if not len(timestamps):
+            empty = np.empty(0, dtype=np.int64)
+            return cls(empty, empty, np.empty(0, dtype=bool))
+
+        # Local days of the logs are within one day of their UTC days
+        schedule = compile_schedule(time_range, store_timezone, int(timestamps[0] // US_PER_DAY) - 1, int(timestamps[-1] // US_PER_DAY) + 1)
+        intervals = build_intervals(
+            timestamps, statuses, np.array([0, len(timestamps)]),
+            schedule.opens, schedule.closes, np.array([0, len(schedule)])
+        )
+        keep = intervals["counted"] & (intervals["end"] > intervals["begin"])
+        return cls(intervals["begin"][keep], intervals["end"][keep], intervals["active"][keep])
+
+    @property
+    def covered_from(self) -> Optional[int]:
+        return int(self.begin[0]) if len(self) else None
+
+    @property
+    def covered_to(self) -> Optional[int]:
+        return int(self.end[-1]) if len(self) else None
+
+    def _cumulative(self, at_us: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Active and inactive microseconds before each instant
+        index = np.searchsorted(self.begin, at_us, side="right") - 1
+        before = index < 0
+        index = np.maximum(index, 0)
+        partial = np.clip(at_us, self.begin[index], self.end[index]) - self.begin[index]
+        active = np.where(before, 0, self.active_before[index] + np.where(self.active[index], partial, 0))
+        inactive = np.where(before, 0, self.inactive_before[index] + np.where(self.active[index], 0, partial))
+        return active, inactive
+
+    def minutes(self, starts_us, ends_us) -> Tuple[np.ndarray, np.ndarray]:
+        """Uptime and downtime minutes within each [start, end)."""
+        starts_us = np.asarray(starts_us, dtype=np.int64)
+        ends_us = np.asarray(ends_us, dtype=np.int64)
+        if not len(self):
+            return np.zeros(len(starts_us)), np.zeros(len(starts_us))
+        active_start, inactive_start = self._cumulative(starts_us)
+        active_end, inactive_end = self._cumulative(ends_us)
+        return (active_end - active_start) / US_PER_SECOND / 60, (inactive_end - inactive_start) / US_PER_SECOND / 60
+
+def compute_window_results(index: UptimeIndex, windows: List[ReportWindow], last_store_log_time: datetime, store_timezone: str) -> Dict:
+    # Report columns of the custom windows of one store, in whole minutes
+    if not windows:
+        return {}
+    bounds = [window_bounds(window, last_store_log_time, store_timezone) for window in windows]
+    uptime, downtime = index.minutes([start for start, _ in bounds], [end for _, end in bounds])
+    results = {}
+    for window, up, down in zip(windows, uptime.tolist(), downtime.tolist()):
+        results[f"uptime_{window.name}"] = int(round(up))
+        results[f"downtime_{window.name}"] = int(round(down))
+    return results
@@ -0,0 +1,86 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from typing import Iterable, NamedTuple, Optional, Set
+import hashlib
+import logging
+import re
+from app.models import StoreStatusLog, BusinessHours, StoreTimezone
+from app.utils.report import get_week_start
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_PATTERN = re.compile(r"^logs:(?P<min_log_id>\d+)-(?P<max_log_id>\d+):settings:(?P<settings_version>\w+)$")
+
+def get_settings_version(db: Session) -> str:
+    """Version of the business hours and timezones, moved by every insert, delete and edit.
+
+    A digest of each table's row count, highest id and latest updated_at, which the
+    database sets on every insert and update (see add_settings_update_tracking), so it
+    costs a few index lookups instead of a pass over every settings row.
+    """
+    aggregates = [
+        tuple(db.execute(select(func.count(model.id), func.max(model.id), func.max(model.updated_at))).one())
+        for model in (BusinessHours, StoreTimezone)
+    ]
+    return hashlib.sha1(repr(aggregates).encode("utf-8")).hexdigest()[:16]
+
+def get_data_watermark(db: Session) -> str:
+    """Identify the inputs of a report: log id range plus the store settings version.
+
+    Logs are only ever appended (new ids) or expired from the oldest end (min id moves),
+    so two reports with equal watermarks were computed from the same data. Both bounds
+    come from the primary key index.
+    """
+    try:
+        min_log_id, max_log_id = db.query(func.min(StoreStatusLog.id), func.max(StoreStatusLog.id)).one()
+        return format_data_watermark(min_log_id or 0, max_log_id or 0, get_settings_version(db))
+    except Exception as e:
+        logger.error(f"Error computing data watermark: {str(e)}")
+        raise e
+
+class DataWatermark(NamedTuple):
+    min_log_id: int
+    max_log_id: int
+    settings_version: str
+
+def format_data_watermark(min_log_id: int, max_log_id: int, settings_version: str) -> str:
+    return f"logs:{min_log_id}-{max_log_id}:settings:{settings_version}"
+
+def parse_data_watermark(watermark: Optional[str]) -> Optional[DataWatermark]:
+    # None for reports without a watermark or with one in an older layout
+    match = WATERMARK_PATTERN.match(watermark or "")
+    if not match:
+        return None
+    return DataWatermark(int(match["min_log_id"]), int(match["max_log_id"]), match["settings_version"])
+
+def get_changed_store_ids(db: Session, after_log_id: int) -> Set[str]:
+    """Stores with logs ingested after after_log_id, from the primary key index."""
+    try:
+        rows = db.query(StoreStatusLog.store_id).filter(StoreStatusLog.id > after_log_id).distinct()
+        return {store_id for store_id, in rows}
+    except Exception as e:
+        logger.error(f"Error getting changed stores: {str(e)}")
+        raise e
+
+def get_truncated_store_ids(db: Session, store_ids: Iterable[str]) -> Set[str]:
+    """Stores of store_ids whose week window may have lost logs since they were computed.
+
+    Retention deletes the oldest logs by timestamp, so a week window kept every log as long
+    as some log at or before its start remains. Stores without that log, or without any log
+    left, are returned; one grouped pass over the (store_id, timestamp_utc) index.
+    """
+    store_ids = set(store_ids)
+    try:
+        covered = set()
+        rows = db.query(
+            StoreStatusLog.store_id,
+            func.min(StoreStatusLog.timestamp_utc),
+            func.max(StoreStatusLog.timestamp_utc)
+        ).group_by(StoreStatusLog.store_id)
+        for store_id, first_time, last_time in rows:
+            if store_id in store_ids and first_time <= get_week_start(last_time):
+                covered.add(store_id)
+        return store_ids - covered
+    except Exception as e:
+        logger.error(f"Error getting truncated stores: {str(e)}")
+        raise e
@@ -0,0 +1,254 @@
+"""Benchmark the report pipeline on synthetic data.
+
+    python -m benchmarks.run --stores 1000 10000 --engines python numpy rollup --output bench.json
+
+Every scale gets a fresh SQLite database of synthetic stores (see benchmarks.synthetic).
+Each engine run is a separate process that calls report_generation with Celery in eager
+mode, so no MySQL or Redis is needed and peak RSS is per run. Results are printed (or
+written to --output) as JSON: dataset size and load rate, then per run the wall time,
+stores/s, logs/s and peak RSS of each pipeline stage.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from functools import wraps
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# report_service functions timed as pipeline stages
+STAGES = [
+    "load_store_settings",
+    "get_latest_log_times",
+    "bring_rollups_current",
+    "generate_report_for_all_stores",
+    "merge_report_shard_files",
+    "complete_report",
+]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def configure_environment(db_path: str):
+    # Must run before anything under app/ is imported: the engine is built at import time
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["REDIS_URL"] = "memory://"
+    sys.path.insert(0, REPO_ROOT)
+
+class StageTimer:
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.peak_rss_mb = {}
+
+    def record(self, stage: str, seconds: float):
+        self.seconds[stage] += seconds
+        self.calls[stage] += 1
+        self.peak_rss_mb[stage] = peak_rss_mb()
+
+    def wrap(self, stage: str, function):
+        @wraps(function)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+        return timed
+
+    def wrap_generator(self, stage: str, function):
+        # Only time spent inside the generator counts, not in the consumer writing rows
+        @wraps(function)
+        def timed(*args, **kwargs):
+            iterator = function(*args, **kwargs)
+            items = 0
+            elapsed = 0.0
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - started
+                    break
+                elapsed += time.perf_counter() - started
+                items += 1
+                yield item
+            self.record(stage, elapsed)
+            self.calls[f"{stage}_items"] += items
+        return timed
+
+def generate_worker(db_path: str, args) -> dict:
+    configure_environment(db_path)
+    from app.core import init_db
+    from app.core.database import engine
+    from benchmarks.synthetic import generate_dataset
+
+    init_db()
+    # generate_dataset switches the journal mode, which needs the only connection to the file
+    engine.dispose()
+    return generate_dataset(
+        db_path, args.stores[0], days=args.days, poll_minutes=args.poll_minutes,
+        flip_probability=args.flip_probability, seed=args.seed
+    )
+
+def report_worker(db_path: str, args) -> dict:
+    configure_environment(db_path)
+    from celery_app import celery_app
+    from app.core.database import SessionLocal
+    from app.models import Report, ReportStatus
+    from app.services import report_service
+
+    celery_app.conf.task_always_eager = True
+    celery_app.conf.task_eager_propagates = True
+    celery_app.conf.result_backend = "cache+memory://"
+
+    timer = StageTimer()
+    for stage in STAGES:
+        setattr(report_service, stage, timer.wrap(stage, getattr(report_service, stage)))
+    report_service.iter_report_results = timer.wrap_generator("compute", report_service.iter_report_results)
+
+    report_id = f"bench-{uuid.uuid4()}"
+    db = SessionLocal()
+    db.add(Report(report_id=report_id, status=ReportStatus.running, format=args.format))
+    db.commit()
+
+    started = time.perf_counter()
+    report_service.report_generation(report_id, engine=args.engine, shards=args.shards)
+    total_seconds = time.perf_counter() - started
+
+    db.expire_all()
+    report = db.query(Report).filter(Report.report_id == report_id).first()
+    if report.status != ReportStatus.completed:
+        raise RuntimeError(f"Report {report_id} finished as {report.status}")
+    db.close()
+
+    stores = timer.calls.get("compute_items", 0)
+    compute_seconds = timer.seconds.get("compute", 0.0)
+    stages = {
+        stage: {
+            "seconds": round(timer.seconds[stage], 4),
+            "calls": timer.calls[stage],
+            "peak_rss_mb": timer.peak_rss_mb[stage],
+        }
+        for stage in ["compute"] + STAGES
+        if timer.calls.get(stage)
+    }
+    # Writing is interleaved with computing: the generate/merge time not spent computing
+    if "generate_report_for_all_stores" in stages and args.shards == 1:
+        stages["write"] = {"seconds": round(timer.seconds["generate_report_for_all_stores"] - compute_seconds, 4)}
+    if "compute" in stages:
+        stages["compute"]["stores_per_second"] = round(stores / max(compute_seconds, 1e-9))
+        stages["compute"]["logs_per_second"] = round(args.logs / max(compute_seconds, 1e-9)) if args.logs else None
+
+    return {
+        "engine": args.engine,
+        "shards": args.shards,
+        "format": args.format,
+        "stores": stores,
+        "seconds": round(total_seconds, 4),
+        "stores_per_second": round(stores / max(total_seconds, 1e-9)),
+        "peak_rss_mb": peak_rss_mb(),
+        "report_size_bytes": os.path.getsize(report.url),
+        "stages": stages,
+    }
+
+def run_worker(*worker_args) -> dict:
+    command = [sys.executable, "-m", "benchmarks.run", *[str(arg) for arg in worker_args]]
+    completed = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed:\n{completed.stderr[-4000:]}")
+    # The result is the last line; everything before it is log output
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def run_benchmarks(args) -> dict:
+    results = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "days": args.days,
+            "poll_minutes": args.poll_minutes,
+            "flip_probability": args.flip_probability,
+            "seed": args.seed,
+        },
+        "scales": [],
+    }
+
+    for stores in args.stores:
+        with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+            db_path = os.path.join(workdir, "bench.db")
+            print(f"Generating {stores} stores...", file=sys.stderr)
+            dataset = run_worker(
+                "--worker", "generate", "--db", db_path, "--stores", stores, "--days", args.days,
+                "--poll-minutes", args.poll_minutes, "--flip-probability", args.flip_probability, "--seed", args.seed
+            )
+            dataset["database_bytes"] = os.path.getsize(db_path)
+
+            runs = []
+            for engine in args.engines:
+                for shards in args.shards:
+                    for repeat in range(args.repeat):
+                        print(f"  {engine} engine, {shards} shard(s), run {repeat + 1}...", file=sys.stderr)
+                        run = run_worker(
+                            "--worker", "report", "--db", db_path, "--engine", engine, "--shards", shards,
+                            "--format", args.format, "--logs", dataset["logs"], "--workdir", workdir
+                        )
+                        run["repeat"] = repeat + 1
+                        runs.append(run)
+                        print(f"    {run['seconds']}s, {run['stores_per_second']} stores/s, {run['peak_rss_mb']} MB peak", file=sys.stderr)
+            results["scales"].append({"dataset": dataset, "runs": runs})
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark report generation on synthetic data")
+    parser.add_argument("--stores", type=int, nargs="+", default=[1000], help="one benchmark per store count")
+    parser.add_argument("--days", type=int, default=10, help="days of status logs per store")
+    parser.add_argument("--poll-minutes", type=float, default=60.0, help="mean minutes between polls")
+    parser.add_argument("--flip-probability", type=float, default=0.1, help="chance a poll changes status")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engines", nargs="+", default=["python", "numpy", "rollup"])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1])
+    parser.add_argument("--format", default="csv", help="report format: csv, csv.gz or parquet")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per engine (rollup runs after the first are incremental)")
+    parser.add_argument("--workdir", default=None, help="directory for the temporary databases (e.g. /dev/shm)")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    # Internal: run one step in this process
+    parser.add_argument("--worker", choices=["generate", "report"], help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--engine", help=argparse.SUPPRESS)
+    parser.add_argument("--logs", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        if args.worker == "report":
+            args.shards = args.shards[0]
+            os.chdir(args.workdir)
+            result = report_worker(args.db, args)
+        else:
+            result = generate_worker(args.db, args)
+        print(json.dumps(result))
+        return
+
+    results = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"Benchmark results written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+from datetime import datetime
+from typing import Dict
+import sqlite3
+import time
+import numpy as np
+
+# Weighted like the dumps: mostly US timezones, with a few half-hour and non-DST ones
+TIMEZONES = [
+    ("America/Chicago", 0.40),
+    ("America/New_York", 0.25),
+    ("America/Los_Angeles", 0.15),
+    ("America/Denver", 0.08),
+    ("America/Phoenix", 0.04),
+    ("America/Boise", 0.03),
+    ("Asia/Kolkata", 0.02),
+    ("America/St_Johns", 0.02),
+    ("Pacific/Honolulu", 0.01),
+]
+
+US_PER_MINUTE = 60 * 1_000_000
+EPOCH = np.datetime64("1970-01-01T00:00:00", "us")
+
+def _format_datetimes(epoch_us: np.ndarray) -> np.ndarray:
+    # Same text format SQLAlchemy's SQLite dialect stores DateTime values in
+    text = np.datetime_as_string(EPOCH + epoch_us.astype("timedelta64[us]"), unit="us")
+    return np.char.replace(text, "T", " ")
+
+def _format_times(minutes: np.ndarray) -> np.ndarray:
+    return np.array([f"{m // 60:02d}:{m % 60:02d}:00.000000" for m in minutes.tolist()])
+
+def generate_dataset(path: str, stores: int, days: int = 10, poll_minutes: float = 60.0,
+                     flip_probability: float = 0.1, end: datetime = datetime(2023, 1, 25, 18, 0),
+                     seed: int = 0, chunk_stores: int = 20000) -> Dict:
+    """Write synthetic stores, timezones, business hours and status logs into a SQLite file.
+
+    The schema must already exist (Base.metadata.create_all). Each store polls roughly every
+    poll_minutes over `days` days ending near `end`, flipping status with flip_probability
+    per poll; about 15% of stores have no business hours (open 24x7) and 5% have overnight
+    hours. Rows go straight through sqlite3 executemany,
+    which is several times faster than the ORM at tens of millions of logs.
+    Returns counts and timings.
+    """
+    rng = np.random.default_rng(seed)
+    started = time.perf_counter()
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+
+    # 19 digit ids like the dumps, unique through the zero-padded suffix
+    prefixes = rng.integers(10 ** 9, 10 ** 10, size=stores).tolist()
+    store_ids = np.array([f"{prefix}{store:09d}" for store, prefix in enumerate(prefixes)])
+    timezone_names = np.array([name for name, _ in TIMEZONES])
+    weights = np.array([weight for _, weight in TIMEZONES])
+    timezones = timezone_names[rng.choice(len(TIMEZONES), size=stores, p=weights / weights.sum())]
+    connection.executemany(
+        "INSERT INTO store_timezones (store_id, timezone_str) VALUES (?, ?)",
+        zip(store_ids.tolist(), timezones.tolist())
+    )
+
+    # Business hours: one row per day, opening 6-11am and closing 5-11pm local
+    hours_rows = 0
+    kind = rng.random(stores)
+    with_hours = np.nonzero(kind >= 0.15)[0]
+    overnight = kind < 0.20
+    for day_of_week in range(7):
+        opens = rng.integers(6 * 60, 11 * 60, size=len(with_hours)) // 30 * 30
+        closes = rng.integers(17 * 60, 23 * 60, size=len(with_hours)) // 30 * 30
+        closes = np.where(overnight[with_hours], rng.integers(0, 3 * 60, size=len(with_hours)) // 30 * 30, closes)
+        connection.executemany(
+            "INSERT INTO business_hours (store_id, day_of_week, start_time_local, end_time_local) VALUES (?, ?, ?, ?)",
+            zip(store_ids[with_hours].tolist(), [day_of_week] * len(with_hours), _format_times(opens).tolist(), _format_times(closes).tolist())
+        )
+        hours_rows += len(with_hours)
+    connection.commit()
+    settings_seconds = time.perf_counter() - started
+
+    # Status logs, generated and written a chunk of stores at a time to bound memory
+    logs = 0
+    end_us = int((np.datetime64(end, "us") - EPOCH).astype(np.int64))
+    span_us = days * 24 * 60 * US_PER_MINUTE
+    polls_per_store = max(1, int(days * 24 * 60 / poll_minutes))
+    # Keep the (stores x polls) arrays of a chunk around a few million cells
+    chunk_stores = max(1, min(chunk_stores, 4_000_000 // polls_per_store))
+    for first in range(0, stores, chunk_stores):
+        chunk_ids = store_ids[first:first + chunk_stores]
+        count = len(chunk_ids)
+        # Jittered poll times; some stores stop polling up to a day before the end
+        stop_us = end_us - rng.integers(0, 24 * 60, size=count) * US_PER_MINUTE
+        steps = rng.exponential(poll_minutes * US_PER_MINUTE, size=(count, polls_per_store)).astype(np.int64) + US_PER_MINUTE
+        timestamps = (stop_us - span_us)[:, None] + np.cumsum(steps, axis=1)
+        keep = timestamps <= stop_us[:, None]
+        flips = rng.random((count, polls_per_store)) < flip_probability
+        statuses = (np.cumsum(flips, axis=1) + rng.integers(0, 2, size=(count, 1))) % 2 == 0
+
+        chunk_store_ids = np.repeat(chunk_ids, keep.sum(axis=1))
+        chunk_timestamps = _format_datetimes(timestamps[keep])
+        chunk_statuses = np.where(statuses[keep], "active", "inactive")
+        connection.executemany(
+            "INSERT INTO store_status_logs (store_id, timestamp_utc, status) VALUES (?, ?, ?)",
+            zip(chunk_store_ids.tolist(), chunk_timestamps.tolist(), chunk_statuses.tolist())
+        )
+        connection.commit()
+        logs += int(keep.sum())
+
+    connection.close()
+    total_seconds = time.perf_counter() - started
+    return {
+        "stores": stores,
+        "business_hours": hours_rows,
+        "logs": logs,
+        "days": days,
+        "settings_seconds": round(settings_seconds, 3),
+        "logs_seconds": round(total_seconds - settings_seconds, 3),
+        "logs_per_second": round(logs / max(total_seconds - settings_seconds, 1e-9)),
+    }
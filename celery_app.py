@@ -1,12 +1,43 @@
 from celery import Celery
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
+import logging
 from app.core.config import settings
+from app.core.metrics import mark_process_dead
+
+logger = logging.getLogger(__name__)
+
+WORKER_PROFILES = ("solo", "linux")
+WORKER_POOLS = ("prefork", "threads")
+
+def worker_profile_options(profile: str) -> dict:
+    """Celery worker settings of a WORKER_PROFILE; command line options (-P, -c) still win."""
+    if profile not in WORKER_PROFILES:
+        raise ValueError(f"Unknown worker profile {profile}, expected one of {WORKER_PROFILES}")
+    if profile == "solo":
+        return {
+            # Windows-specific settings
+            'worker_pool': 'solo',  # Use solo pool for Windows compatibility
+            'worker_max_tasks_per_child': 1,
+            'worker_pool_restarts': True,
+        }
+
+    if settings.WORKER_POOL not in WORKER_POOLS:
+        raise ValueError(f"Unknown worker pool {settings.WORKER_POOL}, expected one of {WORKER_POOLS}")
+    return {
+        'worker_pool': settings.WORKER_POOL,
+        'worker_concurrency': settings.WORKER_CONCURRENCY or None,
+        'worker_prefetch_multiplier': settings.WORKER_PREFETCH_MULTIPLIER,
+        # Recycle children by memory (checked after each task) rather than after every task
+        'worker_max_memory_per_child': settings.WORKER_MAX_MEMORY_PER_CHILD_KB or None,
+        'worker_max_tasks_per_child': settings.WORKER_MAX_TASKS_PER_CHILD or None,
+    }
 
 # Initialize Celery
 celery_app = Celery(
     'store_monitoring',
     broker=settings.REDIS_URL,
     backend=settings.REDIS_URL,
-    include=['app.services.report_service']
+    include=['app.services.report_service', 'app.services.rollup_service', 'app.services.retention_service']
 )
 
 # Celery configuration
@@ -18,9 +49,48 @@ celery_app.conf.update(
     enable_utc=True,
     task_track_started=True,
     task_time_limit=3600,  
-    worker_max_tasks_per_child=1,
     broker_connection_retry_on_startup=True,
-    # Windows-specific settings
-    worker_pool='solo',  # Use solo pool for Windows compatibility
-    worker_pool_restarts=True
-) 
\ No newline at end of file
+    **worker_profile_options(settings.WORKER_PROFILE)
+)
+
+# Periodic tasks (run with `celery -A celery_app beat`)
+celery_app.conf.beat_schedule = {
+    'rollup-store-status': {
+        'task': 'rollup_store_status',
+        'schedule': settings.ROLLUP_INTERVAL_SECONDS,
+    },
+    'store-status-retention': {
+        'task': 'apply_store_status_retention',
+        'schedule': settings.LOG_RETENTION_INTERVAL_SECONDS,
+    },
+} 
+
+@worker_process_shutdown.connect
+def remove_worker_metrics(pid=None, **kwargs):
+    # Prometheus multiprocess mode: drop the live gauges of the exiting pool process
+    mark_process_dead(pid)
+
+def preload_worker_caches():
+    if not settings.WORKER_PRELOAD_CACHES:
+        return
+    # Imported here because the report service imports this module
+    from app.services.report_service import preload_worker_caches as preload
+    try:
+        preload()
+    except Exception as e:
+        # A cold cache only costs the first task some time
+        logger.warning(f"Could not preload worker caches: {str(e)}")
+
+@worker_init.connect
+def preload_worker(sender=None, **kwargs):
+    # Solo and threads pools run tasks in this process; prefork children preload after the fork
+    # instead, so they never share the parent's database connections
+    if "prefork" not in str(getattr(sender, "pool_cls", "")):
+        preload_worker_caches()
+
+@worker_process_init.connect
+def preload_worker_process(**kwargs):
+    from app.core.database import engine
+    # Connections inherited from the parent belong to it
+    engine.dispose(close=False)
+    preload_worker_caches()
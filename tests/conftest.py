@@ -0,0 +1,65 @@
+import os
+import random
+import sqlite3
+import tempfile
+
+# Settings and database engines are created on import, so the test database is set first
+DATA_DIR = tempfile.mkdtemp(prefix="store-monitoring-tests-")
+DB_PATH = os.path.join(DATA_DIR, "store.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["REDIS_URL"] = "memory://"
+for name, value in (("MYSQL_HOST", "localhost"), ("MYSQL_PORT", "3306"), ("MYSQL_USER", "test"), ("MYSQL_PASSWORD", "test"), ("MYSQL_DB", "test")):
+    os.environ.setdefault(name, value)
+
+import pytest
+from benchmarks.synthetic import generate_dataset
+from celery_app import celery_app
+from app.core.database import Base, engine, init_db
+from app.services import report_service
+
+# Chords of sharded reports run in the calling process
+celery_app.conf.task_always_eager = True
+celery_app.conf.task_eager_propagates = True
+celery_app.conf.result_backend = "cache+memory://"
+
+STORES = 120
+
+def jitter_business_hours(path: str, seed: int = 0):
+    # Synthetic hours sit on whole half hours, where the float minutes of the python and
+    # numpy engines can round a total sitting exactly on a half hour either way
+    rng = random.Random(seed)
+    connection = sqlite3.connect(path)
+    rows = connection.execute("SELECT id, start_time_local, end_time_local FROM business_hours").fetchall()
+    connection.executemany(
+        "UPDATE business_hours SET start_time_local = ?, end_time_local = ? WHERE id = ?",
+        [
+            (f"{start[:3]}{rng.randrange(60):02d}:{rng.randrange(60):02d}.000000", f"{end[:3]}{rng.randrange(60):02d}:{rng.randrange(60):02d}.000000", row_id)
+            for row_id, start, end in rows
+        ]
+    )
+    connection.commit()
+    connection.close()
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    init_db()
+    yield
+    engine.dispose()
+
+@pytest.fixture(autouse=True)
+def report_dir(tmp_path, monkeypatch):
+    # Reports are written under a relative reports/ directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def dataset():
+    """A fresh database of STORES synthetic stores with 10 days of logs and jittered hours."""
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+    engine.dispose()
+    report_service.store_settings_cache.clear()
+    counts = generate_dataset(DB_PATH, STORES, days=10, poll_minutes=45, seed=7)
+    jitter_business_hours(DB_PATH, seed=7)
+    return counts
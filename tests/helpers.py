@@ -0,0 +1,51 @@
+import asyncio
+from typing import Dict
+from app.core.database import SessionLocal, async_engine
+from app.models import Report, ReportStatus
+from app.services.report_service import get_versioned_store_settings, iter_report_results, report_generation
+from app.utils.report import read_report_results
+from app.utils.watermark import get_data_watermark, parse_data_watermark
+
+def run_async(coroutine):
+    # Each test runs its own event loop, so pooled async connections are dropped after it
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(run())
+
+def compute_results(engine: str) -> Dict[str, Dict]:
+    # Results of one engine over the current data, keyed by store_id
+    db = SessionLocal()
+    try:
+        settings_version, (timezone, time_range_for_dayofweek) = get_versioned_store_settings(db)
+        results = iter_report_results(db, engine, timezone, time_range_for_dayofweek, settings_version=settings_version)
+        return {result["store_id"]: {field: int(value) for field, value in result.items() if field != "store_id"} for result in results}
+    finally:
+        db.close()
+
+def generate_report(report_id: str, **kwargs) -> Report:
+    """Create a running report over the current data and run report_generation for it."""
+    db = SessionLocal()
+    try:
+        watermark = get_data_watermark(db)
+        db.add(Report(report_id=report_id, status=ReportStatus.running, watermark=watermark))
+        db.commit()
+    finally:
+        db.close()
+    report_generation(report_id, settings_version=parse_data_watermark(watermark).settings_version, **kwargs)
+    return get_report(report_id)
+
+def get_report(report_id: str) -> Report:
+    db = SessionLocal()
+    try:
+        return db.query(Report).filter(Report.report_id == report_id).one()
+    finally:
+        db.close()
+
+def read_results(report: Report) -> Dict[str, Dict]:
+    return {
+        store_id: {field: int(value) for field, value in result.items() if field != "store_id"}
+        for store_id, result in read_report_results(report.url, report.format or "csv").items()
+    }
@@ -0,0 +1,16 @@
+import pytest
+from app.models import ReportStatus
+from tests.conftest import STORES
+from tests.helpers import compute_results, generate_report, read_results
+
+def test_numpy_engine_matches_python_engine(dataset):
+    expected = compute_results("python")
+    assert len(expected) == STORES
+    assert compute_results("numpy") == expected
+
+@pytest.mark.parametrize("engine", ["python", "numpy"])
+def test_sharded_report_matches_single_report(dataset, engine):
+    single = generate_report("single", engine=engine)
+    sharded = generate_report("sharded", engine=engine, shards=3)
+    assert single.status == sharded.status == ReportStatus.completed
+    assert read_results(sharded) == read_results(single) == compute_results("python")
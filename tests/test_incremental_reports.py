@@ -0,0 +1,59 @@
+import random
+from datetime import timedelta
+import pytest
+from sqlalchemy import func
+from app.core.database import SessionLocal
+from app.models import StoreStatus, StoreStatusLog
+from app.utils.retention import delete_store_status_logs_before
+from app.utils.watermark import get_truncated_store_ids
+from tests.helpers import generate_report, read_results
+
+def add_logs(seed: int = 0):
+    # New polls after the newest log of some stores, and late polls inside the week of others
+    rng = random.Random(seed)
+    db = SessionLocal()
+    try:
+        latest = dict(db.query(StoreStatusLog.store_id, func.max(StoreStatusLog.timestamp_utc)).group_by(StoreStatusLog.store_id).all())
+        store_ids = rng.sample(sorted(latest), 20)
+        for store_id in store_ids[:10]:
+            for step in range(1, 4):
+                db.add(StoreStatusLog(store_id=store_id, timestamp_utc=latest[store_id] + timedelta(minutes=37 * step), status=rng.choice(list(StoreStatus))))
+        for store_id in store_ids[10:]:
+            db.add(StoreStatusLog(store_id=store_id, timestamp_utc=latest[store_id] - timedelta(days=2, seconds=rng.randrange(3600)), status=rng.choice(list(StoreStatus))))
+        db.commit()
+    finally:
+        db.close()
+
+def expire_logs(before_newest: timedelta) -> set:
+    # Retention cutting into the week window of the stores whose logs stop earliest
+    db = SessionLocal()
+    try:
+        newest = db.query(func.max(StoreStatusLog.timestamp_utc)).scalar()
+        store_ids = {store_id for store_id, in db.query(StoreStatusLog.store_id).distinct()}
+        delete_store_status_logs_before(db, newest - before_newest)
+        return get_truncated_store_ids(db, store_ids)
+    finally:
+        db.close()
+
+@pytest.mark.parametrize("shards", [1, 3])
+def test_incremental_report_matches_full_report(dataset, shards):
+    generate_report("base", engine="numpy")
+    add_logs()
+    incremental = generate_report("incremental", engine="numpy", shards=shards, incremental=True)
+    full = generate_report("full", engine="numpy")
+
+    assert incremental.base_report_id == "base"
+    assert full.base_report_id is None
+    assert read_results(incremental) == read_results(full)
+
+def test_incremental_report_after_retention_matches_full_report(dataset):
+    generate_report("base", engine="numpy")
+    truncated = expire_logs(timedelta(days=6, hours=12))
+    assert truncated
+    add_logs()
+    incremental = generate_report("incremental", engine="numpy", incremental=True)
+    full = generate_report("full", engine="numpy")
+
+    # The min log id moved, but the base still serves the stores whose week kept its logs
+    assert incremental.base_report_id == "base"
+    assert read_results(incremental) == read_results(full)
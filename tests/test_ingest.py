@@ -0,0 +1,54 @@
+import json
+import pytest
+from datetime import datetime
+from sqlalchemy.exc import OperationalError
+from app.core.database import SessionLocal
+from app.models import StoreStatus, StoreStatusLog
+from app.services.ingest_service import StatusLogBuffer, parse_status_logs
+
+def poll(store_id: str, timestamp_utc, status: StoreStatus = StoreStatus.active) -> dict:
+    return {"store_id": store_id, "timestamp_utc": timestamp_utc, "status": status}
+
+def stored_count(store_id: str) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(StoreStatusLog).filter(StoreStatusLog.store_id == store_id).count()
+    finally:
+        db.close()
+
+def test_timestamps_out_of_range_are_rejected():
+    body = "\n".join(json.dumps(item) for item in [
+        {"store_id": "s", "timestamp_utc": "2023-01-24 09:06:42.605777 UTC", "status": "active"},
+        {"store_id": "s", "timestamp_utc": "0001-01-01T00:00:00Z", "status": "active"},
+        {"store_id": "s", "timestamp_utc": "1969-12-31T23:59:59", "status": "inactive"},
+    ]).encode("utf-8")
+    rows, errors = parse_status_logs(body, "application/x-ndjson")
+    assert [row["timestamp_utc"] for row in rows] == [datetime(2023, 1, 24, 9, 6, 42, 605777)]
+    assert [error["index"] for error in errors] == [1, 2]
+
+def test_rejected_rows_are_dropped_alone(dataset):
+    buffer = StatusLogBuffer(max_rows=100, flush_size=4, flush_interval=1.0)
+    rows = [poll("ingest-store", datetime(2023, 1, 24, hour)) for hour in range(9)]
+    # A value the database driver refuses, in the middle of the batch
+    rows[5] = poll("ingest-store", "not a datetime")
+    buffer.add(rows)
+
+    assert buffer.flush() == 9
+    assert len(buffer) == 0
+    assert (buffer.rows_rejected, buffer.rows_skipped) == (1, 0)
+    assert stored_count("ingest-store") == 8
+
+def test_transient_errors_keep_the_rows(dataset, monkeypatch):
+    buffer = StatusLogBuffer(max_rows=100, flush_size=4, flush_interval=1.0)
+    buffer.add([poll("ingest-store", datetime(2023, 1, 24, hour)) for hour in range(6)])
+
+    def unreachable(rows):
+        raise OperationalError("INSERT", {}, Exception("server has gone away"))
+    monkeypatch.setattr(buffer, "_insert", unreachable)
+    with pytest.raises(OperationalError):
+        buffer.flush()
+    assert len(buffer) == 6
+
+    monkeypatch.undo()
+    assert buffer.flush() == 6
+    assert stored_count("ingest-store") == 6
@@ -0,0 +1,73 @@
+import pytest
+from app.api.reports import trigger_report
+from app.core.database import AsyncSessionLocal, SessionLocal
+from app.models import BusinessHours, ReportStatus, StoreTimezone
+from app.services.report_service import report_generation
+from app.utils.watermark import get_settings_version, parse_data_watermark
+from tests.helpers import get_report, run_async
+
+def trigger() -> dict:
+    # The route coroutine itself; its Query defaults are passed explicitly
+    async def call():
+        async with AsyncSessionLocal() as db:
+            return await trigger_report(format="csv", force=False, profile=False, window=None, incremental=False, db=db)
+    return run_async(call())
+
+def run_worker(report_id: str):
+    report = get_report(report_id)
+    report_generation(report_id, settings_version=parse_data_watermark(report.watermark).settings_version)
+
+def edit_business_hours():
+    db = SessionLocal()
+    try:
+        business_hour = db.query(BusinessHours).order_by(BusinessHours.id).first()
+        business_hour.end_time_local = business_hour.end_time_local.replace(minute=(business_hour.end_time_local.minute + 7) % 60)
+        db.commit()
+    finally:
+        db.close()
+
+def edit_timezone():
+    db = SessionLocal()
+    try:
+        store = db.query(StoreTimezone).order_by(StoreTimezone.id).first()
+        store.timezone_str = "Pacific/Honolulu" if store.timezone_str != "Pacific/Honolulu" else "America/Chicago"
+        db.commit()
+    finally:
+        db.close()
+
+def current_settings_version() -> str:
+    db = SessionLocal()
+    try:
+        return get_settings_version(db)
+    finally:
+        db.close()
+
+def test_unchanged_data_reuses_the_report(dataset):
+    first = trigger()
+    assert trigger() == {"report_id": first["report_id"], "reused": True}
+    run_worker(first["report_id"])
+    assert get_report(first["report_id"]).status == ReportStatus.completed
+    assert trigger() == {"report_id": first["report_id"], "reused": True}
+
+@pytest.mark.parametrize("edit", [edit_business_hours, edit_timezone])
+def test_settings_edit_in_place_is_not_reused(dataset, edit):
+    first = trigger()
+    run_worker(first["report_id"])
+    edit()
+    second = trigger()
+    assert "reused" not in second
+    assert second["report_id"] != first["report_id"]
+    assert trigger() == {"report_id": second["report_id"], "reused": True}
+
+def test_settings_edit_before_the_worker_restamps_the_report(dataset):
+    triggered = trigger()
+    triggered_version = parse_data_watermark(get_report(triggered["report_id"]).watermark).settings_version
+    edit_business_hours()
+    run_worker(triggered["report_id"])
+
+    report = get_report(triggered["report_id"])
+    assert report.status == ReportStatus.completed
+    assert parse_data_watermark(report.watermark).settings_version == current_settings_version() != triggered_version
+    # Its key claimed the older settings, so it is not handed out for them
+    assert report.dedup_key is None
+    assert trigger()["report_id"] != triggered["report_id"]
@@ -0,0 +1,58 @@
+import pytest
+from fastapi import HTTPException
+from app.api.reports import get_report_stores
+from app.core.database import AsyncSessionLocal
+from tests.helpers import generate_report, read_results, run_async
+
+def get_page(report_id: str, filters=None, sort: str = "store_id", order: str = "asc", limit: int = 100, cursor: str = None) -> dict:
+    # The route coroutine itself; its Query defaults are passed explicitly
+    async def call():
+        async with AsyncSessionLocal() as db:
+            return await get_report_stores(report_id=report_id, filters=filters, sort=sort, order=order, limit=limit, cursor=cursor, db=db)
+    return run_async(call())
+
+def walk_pages(report_id: str, **kwargs) -> list:
+    stores, cursor, pages = [], None, 0
+    while True:
+        page = get_page(report_id, cursor=cursor, **kwargs)
+        stores += page["stores"]
+        pages += 1
+        cursor = page["next_cursor"]
+        if not cursor:
+            return stores, pages
+
+@pytest.mark.parametrize("filters, matches, sort, order", [
+    (None, lambda result: True, "store_id", "asc"),
+    (None, lambda result: True, "uptime_last_week", "desc"),
+    (["downtime_last_week>=60", "uptime_last_day<600"], lambda result: result["downtime_last_week"] >= 60 and result["uptime_last_day"] < 600, "downtime_last_week", "asc"),
+])
+def test_pages_cover_the_report_once_in_order(dataset, filters, matches, sort, order):
+    report = generate_report("paged", engine="numpy")
+    expected = [{"store_id": store_id, **result} for store_id, result in read_results(report).items() if matches(result)]
+    assert expected
+    expected.sort(key=lambda result: (result[sort], result["store_id"]), reverse=order == "desc")
+
+    stores, pages = walk_pages("paged", filters=filters, sort=sort, order=order, limit=17)
+    assert stores == expected
+    assert pages == len(expected) // 17 + 1
+
+@pytest.mark.parametrize("kwargs, status_code", [
+    ({"filters": ["bogus>1"]}, 400),
+    ({"filters": ["uptime_last_hour~1"]}, 400),
+    ({"sort": "bogus"}, 400),
+    ({"order": "up"}, 400),
+    ({"cursor": "not-a-cursor"}, 400),
+    ({"report_id": "missing"}, 404),
+])
+def test_bad_requests_are_rejected(dataset, kwargs, status_code):
+    generate_report("paged", engine="numpy")
+    with pytest.raises(HTTPException) as error:
+        get_page(**{"report_id": "paged", **kwargs})
+    assert error.value.status_code == status_code
+
+def test_cursor_is_tied_to_its_sort_order(dataset):
+    generate_report("paged", engine="numpy")
+    cursor = get_page("paged", sort="uptime_last_day", limit=5)["next_cursor"]
+    with pytest.raises(HTTPException) as error:
+        get_page("paged", sort="uptime_last_day", order="desc", cursor=cursor)
+    assert error.value.status_code == 400
@@ -0,0 +1,20 @@
+from sqlalchemy import func
+from app.core.database import SessionLocal
+from app.models import StoreStatusHourlyRollup, StoreStatusLog
+from app.utils.retention import MIN_RETENTION_DAYS, apply_log_retention, get_retention_cutoff
+from tests.helpers import compute_results
+
+def test_retention_expires_logs_and_hourly_rollups(dataset):
+    compute_results("rollup")
+    db = SessionLocal()
+    try:
+        cutoff = get_retention_cutoff(db, MIN_RETENTION_DAYS)
+        assert db.query(StoreStatusHourlyRollup).filter(StoreStatusHourlyRollup.local_date < cutoff.date()).count() > 0
+
+        assert apply_log_retention(db, MIN_RETENTION_DAYS, batch_size=500) > 0
+        assert db.query(func.min(StoreStatusLog.timestamp_utc)).scalar() >= cutoff
+        assert db.query(func.min(StoreStatusHourlyRollup.local_date)).scalar() >= cutoff.date()
+    finally:
+        db.close()
+    # Reports only look back a week, so the remaining rollups still answer them
+    assert compute_results("rollup") == compute_results("python")
@@ -0,0 +1,51 @@
+import random
+from datetime import timedelta
+from sqlalchemy import func
+from app.core.database import SessionLocal
+from app.models import BusinessHours, StoreStatus, StoreStatusHourlyRollup, StoreStatusLog, StoreTimezone
+from tests.helpers import compute_results
+
+def add_logs_after_latest(store_count: int, seed: int = 0):
+    # Three more polls for some stores, after their newest log
+    rng = random.Random(seed)
+    db = SessionLocal()
+    try:
+        latest = dict(db.query(StoreStatusLog.store_id, func.max(StoreStatusLog.timestamp_utc)).group_by(StoreStatusLog.store_id).all())
+        for store_id in rng.sample(sorted(latest), store_count):
+            for step in range(1, 4):
+                db.add(StoreStatusLog(store_id=store_id, timestamp_utc=latest[store_id] + timedelta(minutes=41 * step), status=rng.choice(list(StoreStatus))))
+        db.commit()
+    finally:
+        db.close()
+
+def test_rollup_engine_matches_python_engine(dataset):
+    assert compute_results("rollup") == compute_results("python")
+    db = SessionLocal()
+    try:
+        assert db.query(StoreStatusHourlyRollup).count() > 0
+    finally:
+        db.close()
+
+def test_rollups_follow_new_logs(dataset):
+    compute_results("rollup")
+    add_logs_after_latest(20)
+    assert compute_results("rollup") == compute_results("python")
+
+def test_rollups_follow_settings_edits(dataset):
+    compute_results("rollup")
+    rng = random.Random(1)
+    db = SessionLocal()
+    try:
+        # Hours edited in place, a store's hours removed (open 24x7) and timezones moved
+        hours = db.query(BusinessHours).order_by(BusinessHours.id).all()
+        for business_hour in rng.sample(hours, 40):
+            start = business_hour.start_time_local
+            business_hour.start_time_local = start.replace(hour=(start.hour + 1) % 24, second=rng.randrange(60))
+        removed = hours[0].store_id
+        db.query(BusinessHours).filter(BusinessHours.store_id == removed).delete()
+        for store in rng.sample(db.query(StoreTimezone).order_by(StoreTimezone.id).all(), 10):
+            store.timezone_str = "Asia/Kolkata" if store.timezone_str != "Asia/Kolkata" else "America/Denver"
+        db.commit()
+    finally:
+        db.close()
+    assert compute_results("rollup") == compute_results("python")
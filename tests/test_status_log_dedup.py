@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+import pandas as pd
+from sqlalchemy import create_engine, inspect, text
+from app.core.database import engine
+from app.core.migrations import deduplicate_store_status_logs
+from app.dump_csv import insert_rows
+from app.models import StoreStatus, StoreStatusLog
+from app.services.ingest_service import StatusLogBuffer
+
+START = datetime(2023, 1, 24, 9, 0)
+
+def poll(store_id: str, minutes: int, status: StoreStatus) -> dict:
+    return {"store_id": store_id, "timestamp_utc": START + timedelta(minutes=minutes), "status": status}
+
+def stored_logs(bind, store_id: str):
+    with bind.connect() as connection:
+        return connection.execute(text(
+            "SELECT timestamp_utc, status FROM store_status_logs WHERE store_id = :store_id ORDER BY timestamp_utc, id"
+        ), {"store_id": store_id}).all()
+
+def test_buffer_skips_stored_and_repeated_polls(dataset):
+    buffer = StatusLogBuffer(max_rows=100, flush_size=2, flush_interval=1.0)
+    buffer.add([poll("dedup-store", 0, StoreStatus.active), poll("dedup-store", 60, StoreStatus.active)])
+    buffer.flush()
+    # A resent batch, a repeat inside the batch and a repeated status at a new time
+    buffer.add([
+        poll("dedup-store", 0, StoreStatus.inactive),
+        poll("dedup-store", 60, StoreStatus.active),
+        poll("dedup-store", 120, StoreStatus.active),
+        poll("dedup-store", 120, StoreStatus.inactive),
+        poll("dedup-store", 180, StoreStatus.active),
+    ])
+    buffer.flush()
+
+    assert buffer.rows_flushed == 7
+    assert buffer.rows_skipped == 3
+    # The first stored poll of each time wins, and runs of one status keep every poll
+    assert [(row.timestamp_utc[11:16], row.status) for row in stored_logs(engine, "dedup-store")] == [
+        ("09:00", "active"), ("10:00", "active"), ("11:00", "active"), ("12:00", "active")
+    ]
+
+def test_csv_load_skips_stored_polls(dataset):
+    rows = pd.DataFrame([poll("csv-store", 0, "active"), poll("csv-store", 0, "inactive"), poll("csv-store", 30, "inactive")])
+    with engine.begin() as connection:
+        insert_rows(connection, StoreStatusLog, rows, load_data_infile=False)
+        insert_rows(connection, StoreStatusLog, rows, load_data_infile=False)
+    assert [row.status for row in stored_logs(engine, "csv-store")] == ["active", "inactive"]
+
+def test_migration_deletes_duplicates_before_the_unique_index(tmp_path):
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE store_status_logs (id INTEGER PRIMARY KEY, store_id VARCHAR(36), timestamp_utc DATETIME, status VARCHAR(8))"
+        ))
+        connection.execute(text("CREATE INDEX ix_store_status_logs_store_time ON store_status_logs (store_id, timestamp_utc)"))
+        connection.execute(text("INSERT INTO store_status_logs (store_id, timestamp_utc, status) VALUES (:store_id, :timestamp_utc, :status)"), [
+            {"store_id": "a", "timestamp_utc": "2023-01-24 09:00:00.000000", "status": "active"},
+            {"store_id": "a", "timestamp_utc": "2023-01-24 09:00:00.000000", "status": "inactive"},
+            {"store_id": "a", "timestamp_utc": "2023-01-24 10:00:00.000000", "status": "active"},
+            {"store_id": "b", "timestamp_utc": "2023-01-24 09:00:00.000000", "status": "inactive"},
+            {"store_id": "a", "timestamp_utc": "2023-01-24 10:00:00.000000", "status": "inactive"},
+        ])
+
+    assert deduplicate_store_status_logs(legacy) == 2
+    assert [tuple(row) for row in stored_logs(legacy, "a")] == [("2023-01-24 09:00:00.000000", "active"), ("2023-01-24 10:00:00.000000", "active")]
+    indexes = {index["name"]: bool(index["unique"]) for index in inspect(legacy).get_indexes("store_status_logs")}
+    assert indexes == {"uq_store_status_logs_store_time": True}
+    # Already unique: nothing left to do
+    assert deduplicate_store_status_logs(legacy) == 0
+    legacy.dispose()